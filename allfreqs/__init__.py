@@ -1,8 +1,28 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Created by Roberto Preste
-from allfreqs.allfreqs import AlleleFreqs
-
 __author__ = """Roberto Preste"""
 __email__ = "robertopreste@gmail.com"
 __version__ = '0.3.0'
+
+import sys
+
+__all__ = ["AlleleFreqs", "AlleleCounts"]
+
+
+def __getattr__(name):
+    # import classes (and therefore numpy and pandas) only when they are
+    # needed, so that the command line interface starts quickly
+    if name == "AlleleFreqs":
+        from allfreqs.allfreqs import AlleleFreqs
+        return AlleleFreqs
+    if name == "AlleleCounts":
+        from allfreqs.classes import AlleleCounts
+        return AlleleCounts
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ (PEP 562) is only available from Python 3.7
+    from allfreqs.allfreqs import AlleleFreqs
+    from allfreqs.classes import AlleleCounts
@@ -1,14 +1,34 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Created by Roberto Preste
-from typing import Dict, Optional
+import functools
+from typing import (
+    Any, Callable, Dict, Hashable, Iterable, Optional, TextIO, Tuple, Union
+)
 
 from cached_property import cached_property
+import numpy as np
 import pandas as pd
-from skbio import TabularMSA, DNA, Sequence
 
-from allfreqs.classes import Reference, MultiAlignment
-from allfreqs.constants import AMBIGUOUS_COLS, STANDARD_COLS
+from allfreqs.binary import read_afm, write_afm
+from allfreqs.cache import ResultCache
+from allfreqs.compression import detect_compression, open_input
+from allfreqs.classes import (
+    AlleleCounts, HaplotypeAlignment, MatrixAlignment, MultiAlignment,
+    PackedAlignment, Reference, SparseAlignment
+)
+from allfreqs.counting import (
+    BLOCK_CELLS, CountAccumulator, count_alleles, count_alleles_grouped
+)
+from allfreqs.faidx import FastaIndex, count_indexed, read_indexed
+from allfreqs.fasta import read_fasta
+from allfreqs.constants import STORAGES
+from allfreqs.packing import count_packed
+from allfreqs.parallel import count_alleles_parallel
+from allfreqs.profiling import Profiler, profile_stage
+from allfreqs.regions import Region, select_columns
+from allfreqs.sparse import count_sparse, diff_rows, select_rows, stack_rows
+from allfreqs.writer import write_frequencies
 
 
 class AlleleFreqs:
@@ -18,179 +38,1051 @@ class AlleleFreqs:
     which may or may not contain the reference sequence in the first
     position. In the latter case, an additional reference sequence file
     is needed, either in fasta or csv format.
+
+    Allele counting can be split across `n_jobs` worker processes, each
+    one counting a different block of positions.
+
+    Calculations can be restricted to some `regions` of the reference,
+    and/or some regions can be left out using `exclude`; in this case,
+    only the selected columns of the multialignment are counted.
+
+    If a `profiler` is provided, the wall time, CPU time and peak memory
+    of each stage are recorded and available through `profile`.
+
+    Multialignments read from files can be deduplicated with `dedup`, so
+    that sequences shared by several samples are stored and counted once,
+    weighted by the number of samples sharing them, packed with two
+    bases per byte using `storage="packed"`, or stored as differences
+    from the reference using `storage="sparse"`.
+
+    Multialignments read from files can use a persistent `cache` of allele
+    counts: if the same input was already counted, neither parsing nor
+    counting are needed, otherwise counts are stored once calculated. On
+    a cache hit, the multialignment is only parsed when sequences are
+    accessed (e.g. `matrix`, `df` or grouped frequencies), unless it was
+    requested in streaming mode.
     """
 
     def __init__(self,
-                 multialg: MultiAlignment,
+                 multialg: Optional[MultiAlignment],
                  reference: Reference,
-                 ambiguous: bool = False):
+                 ambiguous: bool = False,
+                 n_jobs: int = 1,
+                 regions: Optional[Iterable[Region]] = None,
+                 exclude: Optional[Iterable[Region]] = None,
+                 profiler: Optional[Profiler] = None):
+        self._load = None
         self.multialg = multialg
         self.reference = reference
         self.ambiguous = ambiguous
-        if len(self.multialg.tabmsa.sequence[0]) != len(self.reference):
+        self.n_jobs = n_jobs
+        self.profiler = profiler
+        if multialg is not None and multialg.width != len(reference):
             raise ValueError("Reference and aligned sequences must have "
                              "the same length.")
+        self.columns = select_columns(self.reference, regions, exclude)
+        self.cache = None
+        self.cache_key = None
+        self.cache_hit = False
+
+    @classmethod
+    def from_counts(cls,
+                    counts: AlleleCounts,
+                    ambiguous: bool = False,
+                    profiler: Optional[Profiler] = None):
+        """Create an instance from precomputed allele counts, for example
+        the ones merged from several multialignments.
+
+        The multialignment itself is not available, so allele frequencies
+        can be calculated as usual, but `matrix` and `df` cannot.
+
+        Args:
+            counts: allele counts of the multialignment
+            ambiguous: show frequencies for ambiguous nucleotides too
+                [default: False]
+            profiler: record resources used by each stage [default: None]
+        """
+        af = cls(multialg=None, reference=counts.reference,
+                 ambiguous=ambiguous, profiler=profiler)
+        af.counts = counts
+
+        return af
 
     @classmethod
     def from_fasta(cls,
                    sequences: str,
-                   reference: Optional[str] = None,
-                   ambiguous: bool = False):
+                   reference: Optional[Union[str, Reference]] = None,
+                   ambiguous: bool = False,
+                   streaming: bool = False,
+                   n_jobs: int = 1,
+                   regions: Optional[Iterable[Region]] = None,
+                   exclude: Optional[Iterable[Region]] = None,
+                   profiler: Optional[Profiler] = None,
+                   parser: str = "native",
+                   cache: Optional[Union[str, ResultCache]] = None,
+                   dedup: bool = False,
+                   storage: str = "bytes",
+                   index: bool = False):
         """Read a multialignment from a fasta file.
 
         If `reference` is not provided, it is assumed that the first
         sequence of the multialignment is the reference sequence.
         Otherwise, an additional fasta file with the reference sequence
-        is needed.
+        (or an already loaded Reference) is needed.
+
+        Sequence ids are taken from fasta headers up to the first
+        whitespace. Files compressed with gzip, bgzip or xz are
+        decompressed while being read. The built-in parser is used by
+        default; scikit-bio can be used instead with `parser="skbio"`, if
+        installed.
+
+        In streaming mode, sequences are read and counted one at a time
+        and then discarded, so that memory usage only depends on the
+        alignment width; allele frequencies are available as usual, but
+        `matrix` and `df` are not.
+
+        With `index`, uncompressed files are read through a .fai offset
+        index (see FastaIndex), which is built next to the file if missing
+        and reused afterwards; records are then split across `n_jobs`
+        worker processes, which seek directly to their records and copy
+        them to a shared matrix (or count them, in streaming mode).
+        Compressed files cannot be indexed, so they are read as usual.
 
         Args:
             sequences: input fasta file with multialignment
-            reference: optional fasta file with reference sequence
+            reference: optional fasta file with reference sequence, or
+                Reference object
             ambiguous: show frequencies for ambiguous nucleotides too
                 [default: False]
+            streaming: count sequences without keeping them in memory
+                [default: False]
+            n_jobs: number of worker processes used to count alleles,
+                unless reading in streaming mode [default: 1]
+            regions: regions of the reference to restrict calculations
+                to, as positions (e.g. 73 or "310.1"), ranges (e.g.
+                "16024-576") or BED files [default: all positions]
+            exclude: regions of the reference to leave out, in the same
+                format of `regions` [default: None]
+            profiler: record resources used by each stage [default: None]
+            parser: fasta parser, either "native" or "skbio"
+                [default: "native"]
+            cache: ResultCache, or directory of the cache, used to store
+                and retrieve allele counts [default: None]
+            dedup: store and count identical sequences once, unless
+                reading in streaming mode [default: False]
+            storage: either "bytes" (one byte per base), "packed" (two
+                bases per byte, for IUPAC symbols only) or "sparse"
+                (differences from the reference) [default: "bytes"]
+            index: read records in parallel through a .fai index, built
+                if missing, unless the file is compressed [default: False]
         """
-        msa = TabularMSA.read(sequences, constructor=DNA)
+        cls._check_storage(storage, dedup, streaming)
+        if index and parser != "native":
+            raise ValueError("Indexed fasta files are read with the native "
+                             "parser only.")
+        if index and detect_compression(sequences) is not None:
+            index = False
+        cache, key, counts = cls._cached_counts(cache, profiler, sequences,
+                                                reference, regions, exclude,
+                                                format="fasta")
+        if counts is not None:
+            load = None if streaming else functools.partial(
+                cls.from_fasta, sequences, reference, ambiguous,
+                n_jobs=n_jobs, regions=regions, exclude=exclude,
+                profiler=profiler, parser=parser, dedup=dedup,
+                storage=storage, index=index
+            )
+            return cls._from_cache(counts, ambiguous, profiler, load)
+        if index:
+            af = cls._read_indexed(sequences, reference, ambiguous, streaming,
+                                   n_jobs, regions, exclude, profiler, dedup,
+                                   storage)
+            return af._use_cache(cache, key)
+        if streaming:
+            af = cls._stream_fasta(sequences, reference, ambiguous,
+                                   regions, exclude, profiler, parser)
+            return af._use_cache(cache, key)
 
-        if not reference:
-            refer = msa[0]
-            multialg = {seq.metadata.get("id"): str(seq) for seq in msa[1:]}
-        else:
-            refer = Sequence.read(reference)
-            multialg = {seq.metadata.get("id"): str(seq) for seq in msa}
+        with profile_stage(profiler, "parse"):
+            records = read_fasta(sequences, parser)
+
+            if not reference:
+                ref = Reference(cls._first_record(records, sequences))
+            else:
+                ref = cls._read_reference(reference, Reference.from_fasta,
+                                          parser=parser)
+            alg = cls._alignment(records, dedup, storage, ref)
 
-        ref = Reference(refer)
-        alg = MultiAlignment(multialg)
+        af = cls(multialg=alg, reference=ref, ambiguous=ambiguous,
+                 n_jobs=n_jobs, regions=regions, exclude=exclude,
+                 profiler=profiler)
 
-        return cls(multialg=alg, reference=ref, ambiguous=ambiguous)
+        return af._use_cache(cache, key)
+
+    @classmethod
+    def _stream_fasta(cls,
+                      sequences: str,
+                      reference: Optional[Union[str, Reference]] = None,
+                      ambiguous: bool = False,
+                      regions: Optional[Iterable[Region]] = None,
+                      exclude: Optional[Iterable[Region]] = None,
+                      profiler: Optional[Profiler] = None,
+                      parser: str = "native"):
+        """Count alleles from a fasta file one record at a time.
+
+        Args:
+            sequences: input fasta file with multialignment
+            reference: optional fasta file with reference sequence, or
+                Reference object
+            ambiguous: show frequencies for ambiguous nucleotides too
+                [default: False]
+            regions: regions of the reference to restrict calculations to
+            exclude: regions of the reference to leave out
+            profiler: record resources used by each stage
+            parser: fasta parser, either "native" or "skbio"
+        """
+        with profile_stage(profiler, "stream"):
+            records = read_fasta(sequences, parser)
+            if not reference:
+                ref = Reference(cls._first_record(records, sequences))
+            else:
+                ref = cls._read_reference(reference, Reference.from_fasta,
+                                          parser=parser)
+
+            af = cls(multialg=None, reference=ref, ambiguous=ambiguous,
+                     regions=regions, exclude=exclude, profiler=profiler)
+            acc = CountAccumulator(len(ref), af.columns)
+            for _, seq in records:
+                acc.add(seq)
+            af.counts = AlleleCounts(acc.counts, acc.n_seqs,
+                                     af.counted_reference)
+
+        return af
+
+    @classmethod
+    def _read_indexed(cls,
+                      sequences: str,
+                      reference: Optional[Union[str, Reference]] = None,
+                      ambiguous: bool = False,
+                      streaming: bool = False,
+                      n_jobs: int = 1,
+                      regions: Optional[Iterable[Region]] = None,
+                      exclude: Optional[Iterable[Region]] = None,
+                      profiler: Optional[Profiler] = None,
+                      dedup: bool = False,
+                      storage: str = "bytes"):
+        """Read (or count, in streaming mode) the records of an indexed
+        fasta file using `n_jobs` worker processes.
+
+        Args:
+            sequences: input fasta file with multialignment
+            reference: optional fasta file with reference sequence, or
+                Reference object
+            ambiguous: show frequencies for ambiguous nucleotides too
+            streaming: count sequences without keeping them in memory
+            n_jobs: number of worker processes
+            regions: regions of the reference to restrict calculations to
+            exclude: regions of the reference to leave out
+            profiler: record resources used by each stage
+            dedup: store and count identical sequences once
+            storage: either "bytes", "packed" or "sparse"
+        """
+        with profile_stage(profiler, "stream" if streaming else "parse"):
+            fai = FastaIndex(sequences)
+            records = fai.unique_records()
+            if not reference:
+                if not fai.records:
+                    raise ValueError("No sequences found in {}."
+                                     .format(sequences))
+                ref = Reference(fai.fetch(fai.records[0].name))
+                records = [record for record in records
+                           if record != fai.records[0]]
+            else:
+                ref = cls._read_reference(reference, Reference.from_fasta)
+
+            if streaming:
+                af = cls(multialg=None, reference=ref, ambiguous=ambiguous,
+                         regions=regions, exclude=exclude, profiler=profiler)
+                if any(record.length > len(ref) for record in records):
+                    raise ValueError("Reference and aligned sequences must "
+                                     "have the same length.")
+                counts = count_indexed(sequences, records, len(ref),
+                                       af.columns, n_jobs)
+                af.counts = AlleleCounts(counts, len(records),
+                                         af.counted_reference)
+                return af
+
+            # sparse storage compares whole rows with the reference
+            width = len(ref) if storage == "sparse" else None
+            matrix = read_indexed(sequences, records, n_jobs, width)
+            alg = cls._matrix_alignment(matrix, [r.name for r in records],
+                                        dedup, storage, ref)
+
+        return cls(multialg=alg, reference=ref, ambiguous=ambiguous,
+                   n_jobs=n_jobs, regions=regions, exclude=exclude,
+                   profiler=profiler)
 
     @classmethod
     def from_csv(cls,
                  sequences: str,
-                 reference: Optional[str] = None,
+                 reference: Optional[Union[str, Reference]] = None,
                  ambiguous: bool = False,
+                 chunksize: Optional[int] = None,
+                 n_jobs: int = 1,
+                 regions: Optional[Iterable[Region]] = None,
+                 exclude: Optional[Iterable[Region]] = None,
+                 profiler: Optional[Profiler] = None,
+                 cache: Optional[Union[str, ResultCache]] = None,
+                 dedup: bool = False,
+                 storage: str = "bytes",
                  **kwargs):
         """Read a multialignment from a csv file.
 
         If `reference` is not provided, it is assumed that the first
         sequence of the multialignment is the reference sequence.
-        Otherwise, an additional csv file with the reference sequence is
-        needed. In both cases, the input csv file must be composed of
-        two columns only, one for sequences ids and the other for the
-        actual sequences; if not, you can provide additional options for
-        pandas to restrict the number of columns read.
+        Otherwise, an additional csv file with the reference sequence (or
+        an already loaded Reference) is needed. In both cases, the input
+        csv file must be composed of two columns only, one for sequences
+        ids and the other for the actual sequences; if not, you can
+        provide additional options for pandas to restrict the number of
+        columns read. Files compressed with gzip, bgzip or xz are
+        decompressed while being read.
+
+        If `chunksize` is provided, the input csv file is read and counted
+        in chunks of `chunksize` rows, which are then discarded, so that
+        the whole multialignment is never kept in memory; allele
+        frequencies are available as usual, but `matrix` and `df` are not.
 
         Args:
             sequences: input csv file with multialignment
-            reference: optional csv file with reference sequence
+            reference: optional csv file with reference sequence, or
+                Reference object
             ambiguous: show frequencies for ambiguous nucleotides too
                 [default: False]
+            chunksize: number of rows to read at a time [default: None]
+            n_jobs: number of worker processes used to count alleles,
+                unless reading in chunks [default: 1]
+            regions: regions of the reference to restrict calculations
+                to, as positions (e.g. 73 or "310.1"), ranges (e.g.
+                "16024-576") or BED files [default: all positions]
+            exclude: regions of the reference to leave out, in the same
+                format of `regions` [default: None]
+            profiler: record resources used by each stage [default: None]
+            cache: ResultCache, or directory of the cache, used to store
+                and retrieve allele counts [default: None]
+            dedup: store and count identical sequences once, unless
+                reading in chunks [default: False]
+            storage: either "bytes" (one byte per base), "packed" (two
+                bases per byte, for IUPAC symbols only) or "sparse"
+                (differences from the reference) [default: "bytes"]
             **kwargs: additional options for pandas.read_csv()
         """
-        msa = pd.read_csv(sequences, **kwargs)
-        if msa.shape[1] != 2:
-            raise ValueError("Please make sure the input only contains two "
-                             "columns.")
+        cls._check_storage(storage, dedup, chunksize)
+        cache, key, counts = cls._cached_counts(cache, profiler, sequences,
+                                                reference, regions, exclude,
+                                                format="csv", **kwargs)
+        if counts is not None:
+            load = None if chunksize else functools.partial(
+                cls.from_csv, sequences, reference, ambiguous,
+                n_jobs=n_jobs, regions=regions, exclude=exclude,
+                profiler=profiler, dedup=dedup, storage=storage, **kwargs
+            )
+            return cls._from_cache(counts, ambiguous, profiler, load)
+        if chunksize:
+            af = cls._stream_csv(sequences, reference, ambiguous,
+                                 chunksize, regions, exclude, profiler,
+                                 **kwargs)
+            return af._use_cache(cache, key)
 
-        if not reference:
-            refer = msa.iloc[0, 1]
-            msa = msa.iloc[1:, :]
-            multialg = dict(zip(msa.iloc[:, 0], msa.iloc[:, 1]))
-        else:
-            refer = pd.read_csv(reference, **kwargs)
-            if refer.shape[1] != 2:
+        with profile_stage(profiler, "parse"):
+            with open_input(sequences) as handle:
+                msa = pd.read_csv(handle, **kwargs)
+            if msa.shape[1] != 2:
                 raise ValueError("Please make sure the input only contains "
                                  "two columns.")
-            refer = refer.iloc[0, 1]
-            multialg = dict(zip(msa.iloc[:, 0], msa.iloc[:, 1]))
 
-        ref = Reference(refer)
-        alg = MultiAlignment(multialg)
+            if not reference:
+                ref = Reference(msa.iloc[0, 1])
+                msa = msa.iloc[1:, :]
+                multialg = dict(zip(msa.iloc[:, 0], msa.iloc[:, 1]))
+            else:
+                ref = cls._read_reference(reference, Reference.from_csv,
+                                          **kwargs)
+                multialg = dict(zip(msa.iloc[:, 0], msa.iloc[:, 1]))
+
+            alg = cls._alignment(multialg.items(), dedup, storage, ref)
+
+        af = cls(multialg=alg, reference=ref, ambiguous=ambiguous,
+                 n_jobs=n_jobs, regions=regions, exclude=exclude,
+                 profiler=profiler)
+
+        return af._use_cache(cache, key)
+
+    @classmethod
+    def _stream_csv(cls,
+                    sequences: str,
+                    reference: Optional[Union[str, Reference]] = None,
+                    ambiguous: bool = False,
+                    chunksize: int = 10000,
+                    regions: Optional[Iterable[Region]] = None,
+                    exclude: Optional[Iterable[Region]] = None,
+                    profiler: Optional[Profiler] = None,
+                    **kwargs):
+        """Count alleles from a csv file one chunk of rows at a time.
+
+        Args:
+            sequences: input csv file with multialignment
+            reference: optional csv file with reference sequence, or
+                Reference object
+            ambiguous: show frequencies for ambiguous nucleotides too
+                [default: False]
+            chunksize: number of rows to read at a time [default: 10000]
+            regions: regions of the reference to restrict calculations to
+            exclude: regions of the reference to leave out
+            profiler: record resources used by each stage
+            **kwargs: additional options for pandas.read_csv()
+        """
+        with profile_stage(profiler, "stream"):
+            af = acc = None
+            if reference:
+                ref = cls._read_reference(reference, Reference.from_csv,
+                                          **kwargs)
+                af = cls(multialg=None, reference=ref, ambiguous=ambiguous,
+                         regions=regions, exclude=exclude, profiler=profiler)
+                acc = CountAccumulator(len(ref), af.columns)
+
+            with open_input(sequences) as handle:
+                for chunk in pd.read_csv(handle, chunksize=chunksize,
+                                         **kwargs):
+                    if chunk.shape[1] != 2:
+                        raise ValueError("Please make sure the input only "
+                                         "contains two columns.")
+                    if af is None:
+                        af = cls(multialg=None,
+                                 reference=Reference(chunk.iloc[0, 1]),
+                                 ambiguous=ambiguous, regions=regions,
+                                 exclude=exclude, profiler=profiler)
+                        acc = CountAccumulator(len(af.reference),
+                                               af.columns)
+                        chunk = chunk.iloc[1:, :]
+                    acc.update(chunk.iloc[:, 1])
+            af.counts = AlleleCounts(acc.counts, acc.n_seqs,
+                                     af.counted_reference)
+
+        return af
+
+    @staticmethod
+    def _first_record(records: Iterable, sequences: str) -> str:
+        """Return the sequence of the first record, used as reference."""
+        for _, seq in records:
+            return seq
+        raise ValueError("No sequences found in {}.".format(sequences))
+
+    @staticmethod
+    def _read_reference(reference: Union[str, Reference],
+                        reader: Callable[..., Reference],
+                        **kwargs) -> Reference:
+        """Return the given Reference, or read it using `reader` if a file
+        name is provided instead."""
+        if isinstance(reference, Reference):
+            return reference
+        return reader(reference, **kwargs)
+
+    @classmethod
+    def from_afm(cls,
+                 sequences: str,
+                 ambiguous: bool = False,
+                 n_jobs: int = 1,
+                 regions: Optional[Iterable[Region]] = None,
+                 exclude: Optional[Iterable[Region]] = None,
+                 profiler: Optional[Profiler] = None,
+                 cache: Optional[Union[str, ResultCache]] = None,
+                 dedup: bool = False,
+                 storage: str = "bytes"):
+        """Open a multialignment stored in binary .afm format.
 
-        return cls(multialg=alg, reference=ref, ambiguous=ambiguous)
+        The alignment matrix is memory-mapped instead of being parsed, so
+        allele counting can start right away. The reference sequence is
+        stored in the .afm file itself.
+
+        Args:
+            sequences: input .afm file with multialignment
+            ambiguous: show frequencies for ambiguous nucleotides too
+                [default: False]
+            n_jobs: number of worker processes used to count alleles
+                [default: 1]
+            regions: regions of the reference to restrict calculations
+                to, as positions (e.g. 73 or "310.1"), ranges (e.g.
+                "16024-576") or BED files [default: all positions]
+            exclude: regions of the reference to leave out, in the same
+                format of `regions` [default: None]
+            profiler: record resources used by each stage [default: None]
+            cache: ResultCache, or directory of the cache, used to store
+                and retrieve allele counts [default: None]
+            dedup: store and count identical sequences once, instead of
+                memory-mapping the alignment matrix [default: False]
+            storage: either "bytes" (memory-mapped, one byte per base),
+                "packed" (two bases per byte, for IUPAC symbols only) or
+                "sparse" (differences from the reference) [default: "bytes"]
+        """
+        cls._check_storage(storage, dedup)
+        cache, key, counts = cls._cached_counts(cache, profiler, sequences,
+                                                None, regions, exclude,
+                                                format="afm")
+        if counts is not None:
+            load = functools.partial(
+                cls.from_afm, sequences, ambiguous, n_jobs=n_jobs,
+                regions=regions, exclude=exclude, profiler=profiler,
+                dedup=dedup, storage=storage
+            )
+            return cls._from_cache(counts, ambiguous, profiler, load)
+        with profile_stage(profiler, "parse"):
+            matrix, ids, refer = read_afm(sequences)
+
+            ref = Reference(refer)
+            alg = cls._matrix_alignment(matrix, ids, dedup, storage, ref)
+
+        af = cls(multialg=alg, reference=ref, ambiguous=ambiguous,
+                 n_jobs=n_jobs, regions=regions, exclude=exclude,
+                 profiler=profiler)
+
+        return af._use_cache(cache, key)
+
+    @staticmethod
+    def _matrix_alignment(matrix: np.ndarray,
+                          ids: Iterable[str],
+                          dedup: bool,
+                          storage: str,
+                          reference: Reference) -> MultiAlignment:
+        """Store a (sequences x positions) matrix of ASCII bytes in the
+        multialignment container matching the storage options."""
+        if dedup:
+            return HaplotypeAlignment.from_matrix(matrix, ids)
+        if storage == "packed":
+            return PackedAlignment.from_matrix(matrix, ids)
+        if storage == "sparse":
+            return SparseAlignment.from_matrix(matrix, ids, repr(reference))
+        return MatrixAlignment(matrix, ids)
+
+    @staticmethod
+    def _check_storage(storage: str, dedup: bool, streaming: Any = False):
+        """Make sure the storage options can be used together."""
+        if storage not in STORAGES:
+            raise ValueError("Storage {} not recognised. Please use one of "
+                             "{}.".format(storage, ", ".join(STORAGES)))
+        if (dedup or storage != "bytes") and streaming:
+            raise ValueError("Please use either dedup or {} storage, or "
+                             "streaming mode, since sequences are not kept "
+                             "in memory when streaming.".format(storage))
+        if dedup and storage != "bytes":
+            raise ValueError("Please use either dedup or {} storage."
+                             .format(storage))
+
+    @staticmethod
+    def _alignment(records: Iterable,
+                   dedup: bool,
+                   storage: str,
+                   reference: Reference) -> MultiAlignment:
+        """Store (sequence id, sequence) tuples in the multialignment
+        container matching the storage options."""
+        if dedup:
+            return HaplotypeAlignment(records)
+        if storage == "packed":
+            return PackedAlignment(records)
+        if storage == "sparse":
+            return SparseAlignment(records, repr(reference))
+        return MultiAlignment(dict(records))
+
+    @staticmethod
+    def _cached_counts(cache: Optional[Union[str, ResultCache]],
+                       profiler: Optional[Profiler],
+                       sequences: str,
+                       reference: Optional[Union[str, Reference]],
+                       regions: Optional[Iterable[Region]],
+                       exclude: Optional[Iterable[Region]],
+                       **options
+                       ) -> Tuple[Optional[ResultCache], Optional[str],
+                                  Optional[AlleleCounts]]:
+        """Look up the counts of the given input in the cache, returning
+        the cache, the key of the input and the cached counts (or None if
+        they are not available)."""
+        if cache is None:
+            return None, None, None
+        if not isinstance(cache, ResultCache):
+            cache = ResultCache(cache)
+        with profile_stage(profiler, "cache"):
+            key = cache.key(sequences, reference, regions, exclude,
+                            **options)
+            counts = cache.get(key)
+
+        return cache, key, counts
+
+    @classmethod
+    def _from_cache(cls,
+                    counts: AlleleCounts,
+                    ambiguous: bool,
+                    profiler: Optional[Profiler],
+                    load: Optional[Callable[[], "AlleleFreqs"]]
+                    ) -> "AlleleFreqs":
+        """Create an instance from cached allele counts, whose
+        multialignment is read with `load` only when accessed (or never,
+        if `load` is None)."""
+        af = cls.from_counts(counts, ambiguous, profiler)
+        af._load = load
+        af.cache_hit = True
+
+        return af
+
+    def _use_cache(self,
+                   cache: Optional[ResultCache],
+                   key: Optional[str]) -> "AlleleFreqs":
+        """Store counts in the cache once calculated, or right away if
+        they are already available."""
+        self.cache = cache
+        self.cache_key = key
+        if cache is not None and "counts" in self.__dict__:
+            cache.put(key, self.counts)
+
+        return self
+
+    @property
+    def multialg(self) -> Optional[MultiAlignment]:
+        """Stored multialignment, or None if it is not kept in memory.
+
+        If allele counts were read from the cache, the multialignment is
+        read from the input file on first access, so that the same
+        attributes and methods are available with or without the cache.
+        """
+        if self._load is not None:
+            load, self._load = self._load, None
+            af = load()
+            self._multialg = af.multialg
+            self.reference = af.reference
+            self.columns = af.columns
+        return self._multialg
+
+    @multialg.setter
+    def multialg(self, multialg: Optional[MultiAlignment]):
+        self._load = None
+        self._multialg = multialg
+
+    def _check_multialg(self):
+        """Make sure the multialignment is kept in memory."""
+        if self.multialg is None:
+            raise ValueError("The multialignment is not kept in memory when "
+                             "reading in streaming mode or in chunks, or "
+                             "when created from allele counts.")
+
+    @property
+    def n_seqs(self) -> int:
+        """Number of aligned sequences (excluding the reference)."""
+        if self._multialg is None:
+            return self.counts.n_seqs
+        return len(self._multialg)
+
+    @property
+    def n_haplotypes(self) -> int:
+        """Number of unique sequences (haplotypes) in the multialignment."""
+        self._check_multialg()
+        if isinstance(self.multialg, HaplotypeAlignment):
+            return self.multialg.n_haplotypes
+        return len({row.tobytes() for row in self.matrix})
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Multialignment as a (sequences x positions) matrix of ASCII
+        bytes, used for allele frequency calculations; if sequences are
+        deduplicated, rows are unique haplotypes, weighted by
+        `multialg.weights`."""
+        self._check_multialg()
+        if "matrix" not in self.multialg.__dict__:
+            with profile_stage(self.profiler, "matrix"):
+                return self.multialg.matrix
+        return self.multialg.matrix
+
+    def _sample_matrix(self) -> np.ndarray:
+        """Return `matrix` with one row per sequence, in the same order as
+        `multialg.ids`, expanding deduplicated haplotypes."""
+        matrix = self.matrix
+        if self.multialg.weights is not None:
+            matrix = matrix[self.multialg.haplotype_index]
+        return matrix
+
+    @cached_property
+    def counted_reference(self) -> Reference:
+        """Reference restricted to the columns selected using `regions`
+        and `exclude`, or the whole reference if they are not provided."""
+        if self.columns is None:
+            return self.reference
+        return self.reference.select(self.columns)
 
     @cached_property
     def df(self) -> pd.DataFrame:
-        """Convert sequences to the proper dataframe for further allele
-        frequency calculations."""
-        df = self.multialg.tabmsa["sequence"].str.split("", expand=True)
-        df.drop([0, df.columns[len(df.columns) - 1]], axis=1, inplace=True)
-        df.fillna("-", inplace=True)  # avoidable
-        df.index = self.multialg.tabmsa["id"]
-        df.columns = self.reference.indexes
+        """Convert sequences to a dataframe with one column per position.
+
+        The dataframe is built on demand from `matrix` and is only kept
+        for backward compatibility, since it stores one Python string per
+        base and is therefore much larger than the matrix itself."""
+        matrix = self._sample_matrix()
+        with profile_stage(self.profiler, "df"):
+            if self.columns is not None:
+                matrix = matrix[:, self.columns]
+            df = pd.DataFrame(matrix.view("S1").astype(str),
+                              index=pd.Index(self.multialg.ids, name="id"),
+                              columns=self.counted_reference.indexes)
 
         return df
 
+    @cached_property
+    def counts(self) -> AlleleCounts:
+        """Count the occurrences of each symbol in each position.
+
+        The resulting counts hold a (positions x symbols) matrix following
+        the order of SYMBOLS, with an additional last column for other
+        symbols. Packed and sparse multialignments are counted without
+        rebuilding the matrix, in a single process."""
+        alg = self.multialg
+        if isinstance(alg, PackedAlignment):
+            with profile_stage(self.profiler, "count"):
+                counts = count_packed(alg.packed, alg.width, self.columns)
+            return self._store_counts(counts)
+        if isinstance(alg, SparseAlignment):
+            with profile_stage(self.profiler, "count"):
+                counts = count_sparse(alg.indptr, alg.indices, alg.symbols,
+                                      alg.reference, self.columns)
+            return self._store_counts(counts)
+
+        matrix = self.matrix
+        weights = self.multialg.weights
+        with profile_stage(self.profiler, "count"):
+            if self.n_jobs > 1:
+                if self.columns is not None:
+                    matrix = matrix[:, self.columns]
+                counts = count_alleles_parallel(matrix, self.n_jobs, weights)
+            else:
+                counts = count_alleles(matrix, self.columns, weights)
+
+        return self._store_counts(counts)
+
+    def _store_counts(self, counts: np.ndarray) -> AlleleCounts:
+        """Wrap symbol counts in AlleleCounts, storing them in the cache
+        (if any)."""
+        counts = AlleleCounts(counts, self.n_seqs, self.counted_reference)
+        if self.cache is not None:
+            self.cache.put(self.cache_key, counts)
+
+        return counts
+
+    @cached_property
+    def _id_rows(self) -> Dict[str, int]:
+        """Index of each sequence id in `multialg.ids`."""
+        return {seq_id: row for row, seq_id in enumerate(self.multialg.ids)}
+
+    def subset_counts(self,
+                      ids: Optional[Iterable[str]] = None,
+                      regions: Optional[Iterable[Region]] = None,
+                      exclude: Optional[Iterable[Region]] = None
+                      ) -> AlleleCounts:
+        """Count the occurrences of each symbol for a subset of sequences
+        and/or positions, without changing `counts`.
+
+        Positions of all sequences are selected from `counts`, so they do
+        not need to be counted again; subsets of sequences are counted
+        from the stored multialignment, whatever its storage.
+
+        Args:
+            ids: ids of the sequences to count [default: all sequences]
+            regions: regions of the reference to restrict counts to, in
+                the same format used by `regions` [default: the positions
+                selected when creating the object]
+            exclude: regions of the reference to leave out [default: None]
+
+        Returns:
+            counts: allele counts of the selected sequences and positions
+        """
+        if ids is not None:
+            self._check_multialg()
+        columns = select_columns(self.reference, regions, exclude)
+        if self.columns is not None and columns is not None:
+            columns = np.intersect1d(self.columns, columns)
+            if not len(columns):
+                raise ValueError("None of the reference positions is "
+                                 "included in the given regions.")
+        elif columns is None:
+            columns = self.columns
+        reference = self.reference if columns is None \
+            else self.reference.select(columns)
+
+        if ids is None:
+            counts = self.counts
+            if columns is None or columns is self.columns:
+                return counts
+            if self.columns is not None:
+                columns = np.searchsorted(self.columns, columns)
+            return AlleleCounts(counts.counts[columns], counts.n_seqs,
+                                reference)
+
+        ids = list(dict.fromkeys(ids))
+        missing = [seq_id for seq_id in ids if seq_id not in self._id_rows]
+        if missing:
+            raise ValueError("Sequence ids not present in the "
+                             "multialignment: {}.".format(", ".join(missing)))
+        rows = np.array([self._id_rows[seq_id] for seq_id in ids],
+                        dtype=np.intp)
+        alg = self.multialg
+        if isinstance(alg, PackedAlignment):
+            counts = count_packed(alg.packed[rows], alg.width, columns)
+        elif isinstance(alg, SparseAlignment):
+            counts = count_sparse(*select_rows(alg.indptr, alg.indices,
+                                               alg.symbols, rows),
+                                  alg.reference, columns)
+        elif alg.weights is not None:
+            weights = np.bincount(alg.haplotype_index[rows],
+                                  minlength=len(self.matrix))
+            counts = count_alleles(self.matrix, columns, weights)
+        else:
+            counts = count_alleles(self.matrix[rows], columns)
+
+        return AlleleCounts(counts, len(rows), reference)
+
+    def variants(self) -> pd.DataFrame:
+        """List the differences of each sequence from the reference, in
+        the positions selected using `regions` and `exclude`.
+
+        Differences are read directly from sparse multialignments, and
+        found one block of sequences at a time otherwise.
+
+        Returns:
+            variants: dataframe with id, position, ref and alt columns,
+                with one row for each difference
+        """
+        if isinstance(self.multialg, SparseAlignment):
+            indptr = self.multialg.indptr
+            indices = self.multialg.indices
+            symbols = self.multialg.symbols
+        else:
+            matrix = self._sample_matrix()
+            reference = np.frombuffer(
+                repr(self.reference).encode("ascii", errors="replace"),
+                dtype=np.uint8
+            )
+            step = max(1, BLOCK_CELLS // max(len(reference), 1))
+            indptr, indices, symbols = stack_rows(
+                [diff_rows(matrix[start:start + step], reference)
+                 for start in range(0, len(matrix), step)]
+            )
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        if self.columns is not None:
+            keep = np.isin(indices, self.columns)
+            rows, indices, symbols = rows[keep], indices[keep], symbols[keep]
+        positions = self.reference.positions
+
+        return pd.DataFrame({
+            "id": np.asarray(self.multialg.ids, dtype=object)[rows],
+            "position": np.asarray(self.reference.indexes,
+                                   dtype=object)[indices],
+            "ref": positions["base"][indices].astype(object),
+            "alt": symbols.view("S1").astype(str).astype(object),
+        })
+
     @cached_property
     def frequencies(self) -> pd.DataFrame:
         """Calculate allele frequencies for the 4 basic nucleotides,
         gaps and other (non-canonical) nucleotides."""
-        rows = []
-        cols = AMBIGUOUS_COLS if self.ambiguous else STANDARD_COLS
-        idxs = []
-        for col in self.df.columns:
-            freqs = self.df[col].value_counts(normalize=True)
-            freq_dict = self._get_frequencies(freqs)
-            rows.append(freq_dict)
-            idxs.append(col)
-        var_df = pd.DataFrame(rows, columns=cols, index=idxs)
-        var_df.reset_index(inplace=True)
-        var_df.rename({"index": "position"}, axis=1, inplace=True)
+        counts = self.counts
+        with profile_stage(self.profiler, "frequencies"):
+            return counts.frequencies(self.ambiguous)
 
-        return var_df
+    @property
+    def profile(self) -> pd.DataFrame:
+        """Resources used by each stage recorded so far, with one row per
+        stage and the wall_time, cpu_time (in seconds) and peak_memory (in
+        bytes) columns."""
+        if self.profiler is None:
+            raise ValueError("Please provide a Profiler to record the "
+                             "resources used by each stage.")
+        return self.profiler.report()
 
-    def _get_frequencies(self, freqs: pd.Series) -> Dict[str, float]:
-        """Get allele frequencies for either standard or ambiguous nucleotides
-        from the value counts returned by Pandas.
+    def grouped_counts(self,
+                       groups: Dict[str, Hashable]
+                       ) -> Dict[Hashable, AlleleCounts]:
+        """Count the occurrences of each symbol in each position,
+        separately for each group of sequences (e.g. haplogroups or
+        populations), with a single pass over the multialignment.
 
         Args:
-            freqs: normalized value counts Series from pandas
+            groups: dictionary of the form {"sequence id": "group"};
+                sequences not included are ignored
 
         Returns:
-            frequencies: dictionary with each nucleotide and its frequency
-        """
-        if self.ambiguous:
-            freq_A = freqs.get("A", 0.0)
-            freq_C = freqs.get("C", 0.0)
-            freq_G = freqs.get("G", 0.0)
-            freq_T = freqs.get("T", 0.0)
-            freq_R = freqs.get("R", 0.0)
-            freq_Y = freqs.get("Y", 0.0)
-            freq_K = freqs.get("K", 0.0)
-            freq_M = freqs.get("M", 0.0)
-            freq_S = freqs.get("S", 0.0)
-            freq_W = freqs.get("W", 0.0)
-            freq_B = freqs.get("B", 0.0)
-            freq_D = freqs.get("D", 0.0)
-            freq_H = freqs.get("H", 0.0)
-            freq_V = freqs.get("V", 0.0)
-            freq_N = freqs.get("N", 0.0)
-            freq_gap = freqs.get("-", 0.0)
-            frequencies = {"A": freq_A, "C": freq_C, "G": freq_G, "T": freq_T,
-                           "R": freq_R, "Y": freq_Y, "K": freq_K, "M": freq_M,
-                           "S": freq_S, "W": freq_W, "B": freq_B, "D": freq_D,
-                           "H": freq_H, "V": freq_V, "N": freq_N,
-                           "gap": freq_gap}
-        else:
-            freq_A = freqs.get("A", 0.0)
-            freq_C = freqs.get("C", 0.0)
-            freq_G = freqs.get("G", 0.0)
-            freq_T = freqs.get("T", 0.0)
-            freq_gap = freqs.get("-", 0.0)
-            freq_oth = 1.0 - (freq_A + freq_C + freq_G + freq_T + freq_gap)
-            frequencies = {"A": freq_A, "C": freq_C, "G": freq_G, "T": freq_T,
-                           "gap": freq_gap, "oth": freq_oth}
+            counts: dictionary of the form {"group": AlleleCounts}, for
+                each group with at least one sequence
+        """
+        matrix = self._sample_matrix()
+        labels = list(dict.fromkeys(groups.values()))
+        codes = {label: code for code, label in enumerate(labels)}
+        row_groups = np.array([codes[groups[seq_id]] if seq_id in groups
+                               else -1 for seq_id in self.multialg.ids],
+                              dtype=np.intp)
+        with profile_stage(self.profiler, "count"):
+            counts = count_alleles_grouped(matrix, row_groups, len(labels),
+                                           self.columns)
+        n_seqs = np.bincount(row_groups[row_groups >= 0],
+                             minlength=len(labels))
+
+        return {label: AlleleCounts(counts[code], int(n_seqs[code]),
+                                    self.counted_reference)
+                for code, label in enumerate(labels) if n_seqs[code]}
+
+    def grouped_frequencies(self,
+                            groups: Dict[str, Hashable]) -> pd.DataFrame:
+        """Calculate allele frequencies separately for each group of
+        sequences (e.g. haplogroups or populations), with a single pass
+        over the multialignment.
 
-        return frequencies
+        Args:
+            groups: dictionary of the form {"sequence id": "group"};
+                sequences not included are ignored
+
+        Returns:
+            frequencies: dataframe in long format, with a group column
+                followed by the same columns of `frequencies`
+        """
+        tables = []
+        for label, counts in self.grouped_counts(groups).items():
+            freqs = counts.frequencies(self.ambiguous)
+            freqs.insert(0, "group", label)
+            tables.append(freqs)
+        if not tables:
+            raise ValueError("None of the sequences belongs to the given "
+                             "groups.")
+
+        return pd.concat(tables, ignore_index=True)
+
+    def add_sequences(self, sequences: Dict[str, str]):
+        """Add aligned sequences to the multialignment.
+
+        Allele counts are updated by counting the new sequences only,
+        instead of counting the whole multialignment again; `df` and
+        `frequencies` are updated accordingly.
+
+        Args:
+            sequences: dictionary of the form {"sequence id": "sequence"}
+        """
+        alg = self.multialg
+        counts = self._count_sequences(sequences)
+        if alg is not None:
+            alg.add(sequences)
+        if "counts" in self.__dict__:
+            self.counts = self.counts + counts
+        self._invalidate()
+
+    def remove_sequences(self, ids: Iterable[str]):
+        """Remove aligned sequences from the multialignment.
+
+        Allele counts are updated by counting the removed sequences only,
+        instead of counting the whole multialignment again; `df` and
+        `frequencies` are updated accordingly. This is not possible when
+        the multialignment was read in streaming mode or in chunks.
+
+        Args:
+            ids: ids of the sequences to remove
+        """
+        self._check_multialg()
+        removed = self.multialg.remove(ids)
+        if "counts" in self.__dict__:
+            self.counts = self.counts - self._count_sequences(removed)
+        self._invalidate()
+
+    def _count_sequences(self, sequences: Dict[str, str]) -> AlleleCounts:
+        """Count alleles of the given sequences only.
+
+        Args:
+            sequences: dictionary of the form {"sequence id": "sequence"}
+        """
+        acc = CountAccumulator(len(self.reference), self.columns)
+        acc.update(sequences.values())
+
+        return AlleleCounts(acc.counts, acc.n_seqs, self.counted_reference)
+
+    def _invalidate(self):
+        """Clear the cached properties derived from the sequences, which
+        no longer match the cached counts of the input file."""
+        self.cache = None
+        self.cache_key = None
+        for attr in ("df", "frequencies", "_id_rows"):
+            self.__dict__.pop(attr, None)
+
+    def to_csv(self,
+               output_file: Union[str, TextIO] = "all_freqs.csv",
+               sep: str = ",",
+               precision: Optional[int] = None):
+        """Write the resulting allele frequencies to disk.
+
+        Rows are calculated from allele counts and written one block of
+        positions at a time, without creating the `frequencies` dataframe.
+
+        Args:
+            output_file: output file name, open text file object, or "-"
+                for stdout
+            sep: field separator, e.g. "\\t" for tsv output [default: ","]
+            precision: number of decimal digits of frequencies, or None to
+                write them in full [default: None]
+        """
+        counts = self.counts
+        with profile_stage(self.profiler, "write"):
+            write_frequencies(counts, output_file, self.ambiguous, sep,
+                              precision)
+
+    def to_parquet(self, output_file: str = "all_freqs.parquet"):
+        """Write the resulting allele frequency dataframe to disk in
+        Parquet format (requires pyarrow).
+
+        Args:
+            output_file: output file name
+        """
+        freqs = self.frequencies
+        with profile_stage(self.profiler, "write"):
+            freqs.to_parquet(output_file, index=False)
+
+    def to_feather(self, output_file: str = "all_freqs.feather"):
+        """Write the resulting allele frequency dataframe to disk in
+        Feather (Arrow IPC) format (requires pyarrow).
+
+        Args:
+            output_file: output file name
+        """
+        freqs = self.frequencies
+        with profile_stage(self.profiler, "write"):
+            freqs.to_feather(output_file)
+
+    def to_hdf(self,
+               output_file: str = "all_freqs.h5",
+               key: str = "frequencies"):
+        """Write the resulting allele frequency dataframe to disk in HDF5
+        format (requires PyTables).
+
+        Args:
+            output_file: output file name
+            key: identifier of the dataframe in the HDF5 file
+        """
+        freqs = self.frequencies
+        with profile_stage(self.profiler, "write"):
+            freqs.to_hdf(output_file, key=key, mode="w")
 
-    def to_csv(self, output_file: str = "all_freqs.csv"):
-        """Write the resulting allele frequency dataframe to disk.
+    def to_afm(self, output_file: str = "multialg.afm"):
+        """Write the multialignment and its reference to disk in binary
+        .afm format, which can be opened again using `from_afm()`.
 
         Args:
             output_file: output file name
         """
-        self.frequencies.to_csv(output_file, index=False)
+        matrix = self._sample_matrix()
+        with profile_stage(self.profiler, "write"):
+            write_afm(output_file, matrix, self.multialg.ids,
+                      repr(self.reference))
 
     def __repr__(self):
         return "<{} ({} sequences, {} positions)>".format(
-            self.__class__.__name__, len(self.multialg), len(self.reference)
+            self.__class__.__name__, self.n_seqs, len(self.reference)
         )
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import allfreqs
+from allfreqs.allfreqs import AlleleFreqs
+
+STAGES = ["parse", "matrix", "count", "write"]
+
+_BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+_AMBIGUOUS = np.frombuffer(b"RYKMSWBDHVN", dtype=np.uint8)
+
+
+def generate_alignment(n_seqs: int = 1000,
+                       length: int = 16569,
+                       gap_rate: float = 0.005,
+                       insertions: int = 50,
+                       ambiguity_rate: float = 0.001,
+                       mutation_rate: float = 0.005,
+                       seed: int = 0) -> Tuple[str, Dict[str, str]]:
+    """Generate a synthetic mtDNA-like multialignment.
+
+    A random reference sequence of `length` bases is created, and
+    `insertions` gap columns are added to it; aligned sequences are copies
+    of the reference with random substitutions, gaps and ambiguous
+    nucleotides, while insertion columns are mostly gaps.
+
+    Args:
+        n_seqs: number of aligned sequences [default: 1000]
+        length: number of bases of the reference [default: 16569]
+        gap_rate: fraction of gaps in aligned sequences [default: 0.005]
+        insertions: number of insertion columns [default: 50]
+        ambiguity_rate: fraction of ambiguous nucleotides in aligned
+            sequences [default: 0.001]
+        mutation_rate: fraction of substitutions in aligned sequences
+            [default: 0.005]
+        seed: seed of the random number generator [default: 0]
+
+    Returns:
+        reference: reference sequence, including insertion columns
+        sequences: dictionary of the form {"sequence id": "sequence"}
+    """
+    rng = np.random.default_rng(seed)
+    width = length + insertions
+    ref = _BASES[rng.integers(0, 4, size=length)]
+    is_insertion = np.zeros(width, dtype=bool)
+    is_insertion[rng.choice(np.arange(1, width), size=insertions,
+                            replace=False)] = True
+    reference = np.full(width, ord("-"), dtype=np.uint8)
+    reference[~is_insertion] = ref
+
+    matrix = np.tile(reference, (n_seqs, 1))
+    # most sequences do not carry insertions
+    matrix[:, is_insertion] = np.where(
+        rng.random((n_seqs, insertions)) < 0.1,
+        _BASES[rng.integers(0, 4, size=(n_seqs, insertions))], ord("-")
+    )
+    draws = rng.random((n_seqs, width))
+    mutated = draws < mutation_rate
+    matrix[mutated] = _BASES[rng.integers(0, 4, size=mutated.sum())]
+    gaps = (draws >= mutation_rate) & (draws < mutation_rate + gap_rate)
+    matrix[gaps] = ord("-")
+    ambiguous = (draws >= mutation_rate + gap_rate) & \
+        (draws < mutation_rate + gap_rate + ambiguity_rate)
+    matrix[ambiguous] = _AMBIGUOUS[rng.integers(0, len(_AMBIGUOUS),
+                                                size=ambiguous.sum())]
+
+    sequences = {f"seq{n + 1}": row.tobytes().decode("ascii")
+                 for n, row in enumerate(matrix)}
+
+    return reference.tobytes().decode("ascii"), sequences
+
+
+def write_fasta(output_file: str, reference: str, sequences: Dict[str, str]):
+    """Write a multialignment to a fasta file, with the reference sequence
+    in the first position.
+
+    Args:
+        output_file: output file name
+        reference: reference sequence
+        sequences: dictionary of the form {"sequence id": "sequence"}
+    """
+    with open(output_file, "w") as f:
+        f.write(f">ref\n{reference}\n")
+        for seq_id, seq in sequences.items():
+            f.write(f">{seq_id}\n{seq}\n")
+
+
+def _stages(input_file: str, output_file: str) -> List[Tuple[str, Callable]]:
+    """Return the stages of an allele frequency calculation, each one
+    using the result of the previous ones."""
+    state = {}
+
+    def parse():
+        state["af"] = AlleleFreqs.from_fasta(input_file)
+
+    def matrix():
+        state["af"].matrix
+
+    def count():
+        state["af"].frequencies
+
+    def write():
+        state["af"].to_csv(output_file)
+
+    return list(zip(STAGES, (parse, matrix, count, write)))
+
+
+def _run_stages(input_file: str,
+                output_file: str,
+                memory: bool = False) -> Dict[str, float]:
+    """Run all stages once, returning either the elapsed seconds or the
+    peak memory (in bytes) of each stage."""
+    results = {}
+    for stage, func in _stages(input_file, output_file):
+        if memory:
+            tracemalloc.start()
+            func()
+            results[stage] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            func()
+            results[stage] = time.perf_counter() - start
+
+    return results
+
+
+def run_benchmark(n_seqs: int = 1000,
+                  length: int = 16569,
+                  repeat: int = 3,
+                  **kwargs) -> Dict[str, Any]:
+    """Time each stage of the allele frequency calculation on a synthetic
+    multialignment, and record its peak memory.
+
+    Timings are the best of `repeat` runs; peak memory is measured in a
+    separate run, since tracing memory allocations slows down execution.
+
+    Args:
+        n_seqs: number of aligned sequences [default: 1000]
+        length: number of bases of the reference [default: 16569]
+        repeat: number of timed runs [default: 3]
+        **kwargs: additional options for generate_alignment()
+
+    Returns:
+        result: dictionary with the benchmark parameters and, for each
+            stage, the elapsed seconds and peak memory in bytes
+    """
+    params = {"n_seqs": n_seqs, "length": length, **kwargs}
+    reference, sequences = generate_alignment(n_seqs, length, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = os.path.join(tmpdir, "multialg.fasta")
+        output_file = os.path.join(tmpdir, "all_freqs.csv")
+        write_fasta(input_file, reference, sequences)
+        del sequences
+        timings = [_run_stages(input_file, output_file)
+                   for _ in range(repeat)]
+        memory = _run_stages(input_file, output_file, memory=True)
+
+    stages = {stage: {"seconds": min(run[stage] for run in timings),
+                      "peak_memory": memory[stage]}
+              for stage in STAGES}
+
+    return {"params": params,
+            "stages": stages,
+            "seconds": sum(stage["seconds"] for stage in stages.values())}
+
+
+def environment() -> Dict[str, str]:
+    """Return the versions of Python and the main libraries, to be stored
+    together with benchmark results."""
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "allfreqs": allfreqs.__version__,
+            "numpy": np.__version__,
+            "pandas": pd.__version__}
+
+
+def compare(results: List[Dict[str, Any]],
+            baseline: List[Dict[str, Any]],
+            tolerance: float = 0.2) -> List[str]:
+    """Compare benchmark results with a baseline.
+
+    Results are matched using their parameters, and a stage is reported
+    when either its time or its peak memory is more than `tolerance`
+    times larger than in the baseline.
+
+    Args:
+        results: benchmark results, as returned by run_benchmark()
+        baseline: baseline results, as returned by run_benchmark()
+        tolerance: relative slowdown or memory increase allowed
+            [default: 0.2]
+
+    Returns:
+        regressions: description of each regression found
+    """
+    baselines = {json.dumps(base["params"], sort_keys=True): base
+                 for base in baseline}
+    regressions = []
+    for result in results:
+        base = baselines.get(json.dumps(result["params"], sort_keys=True))
+        if base is None:
+            continue
+        label = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+        for stage, values in result["stages"].items():
+            if stage not in base["stages"]:
+                continue
+            for metric, unit in (("seconds", "s"), ("peak_memory", "B")):
+                old, new = base["stages"][stage][metric], values[metric]
+                if new > old * (1 + tolerance):
+                    regressions.append(
+                        f"{label}: {stage} {metric} increased from "
+                        f"{old:.4g} {unit} to {new:.4g} {unit}."
+                    )
+
+    return regressions
+
+
+def read_results(input_file: str) -> List[Dict[str, Any]]:
+    """Read benchmark results saved as JSON.
+
+    Args:
+        input_file: input JSON file
+    """
+    with open(input_file) as f:
+        return json.load(f)["results"]
+
+
+def write_results(output_file: Optional[str],
+                  results: List[Dict[str, Any]]) -> str:
+    """Serialise benchmark results as JSON, together with the current
+    environment, and write them to `output_file` if provided.
+
+    Args:
+        output_file: output JSON file, or None
+        results: benchmark results, as returned by run_benchmark()
+
+    Returns:
+        text: the JSON document
+    """
+    text = json.dumps({"environment": environment(), "results": results},
+                      indent=2)
+    if output_file:
+        with open(output_file, "w") as f:
+            f.write(text + "\n")
+
+    return text
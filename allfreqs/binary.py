@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import struct
+from typing import List, Tuple
+
+import numpy as np
+
+# Binary alignment (.afm) files are composed of:
+#   - a fixed-size header with magic string, format version, number of
+#     sequences, alignment width and size of the following two fields;
+#   - the reference sequence (ASCII);
+#   - the sequence ids (UTF-8, newline-separated);
+#   - the (sequences x positions) matrix of ASCII bytes, starting at a
+#     64-byte aligned offset so that it can be memory-mapped.
+AFM_MAGIC = b"AFM\x00"
+AFM_VERSION = 1
+AFM_HEADER = struct.Struct("<4sH2xQQQQ")
+AFM_ALIGNMENT = 64
+
+
+def _matrix_offset(ref_len: int, ids_len: int) -> int:
+    """Return the offset of the matrix in the file, aligned to
+    AFM_ALIGNMENT bytes."""
+    offset = AFM_HEADER.size + ref_len + ids_len
+    return -(-offset // AFM_ALIGNMENT) * AFM_ALIGNMENT
+
+
+def write_afm(output_file: str,
+              matrix: np.ndarray,
+              ids: List[str],
+              reference: str):
+    """Write a multialignment to disk in binary .afm format.
+
+    Args:
+        output_file: output file name
+        matrix: (sequences x positions) matrix of ASCII bytes
+        ids: sequence ids, one for each row of the matrix
+        reference: reference sequence
+    """
+    if len(ids) != matrix.shape[0]:
+        raise ValueError("Please provide one id for each row of the matrix.")
+    if len(reference) != matrix.shape[1]:
+        raise ValueError("Reference and aligned sequences must have "
+                         "the same length.")
+    ref_bytes = reference.encode("ascii")
+    ids_bytes = "\n".join(ids).encode("utf-8")
+    offset = _matrix_offset(len(ref_bytes), len(ids_bytes))
+    header = AFM_HEADER.pack(AFM_MAGIC, AFM_VERSION, matrix.shape[0],
+                             matrix.shape[1], len(ref_bytes), len(ids_bytes))
+
+    with open(output_file, "wb") as f:
+        f.write(header)
+        f.write(ref_bytes)
+        f.write(ids_bytes)
+        f.write(b"\x00" * (offset - f.tell()))
+        f.write(np.ascontiguousarray(matrix, dtype=np.uint8).data)
+
+
+def read_afm(input_file: str) -> Tuple[np.ndarray, List[str], str]:
+    """Open a multialignment stored in binary .afm format.
+
+    The alignment matrix is memory-mapped and not read into memory, so
+    opening is almost instantaneous and the same pages are shared between
+    processes reading the same file.
+
+    Args:
+        input_file: input .afm file
+
+    Returns:
+        matrix: read-only memory-mapped (sequences x positions) matrix
+        ids: sequence ids, one for each row of the matrix
+        reference: reference sequence
+    """
+    with open(input_file, "rb") as f:
+        header = f.read(AFM_HEADER.size)
+        if len(header) < AFM_HEADER.size or header[:4] != AFM_MAGIC:
+            raise ValueError("Input is not a valid .afm file.")
+        _, version, n_seqs, width, ref_len, ids_len = \
+            AFM_HEADER.unpack(header)
+        if version != AFM_VERSION:
+            raise ValueError(f"Unsupported .afm version {version}.")
+        reference = f.read(ref_len).decode("ascii")
+        ids = f.read(ids_len).decode("utf-8").split("\n") if n_seqs else []
+
+    if n_seqs * width == 0:
+        matrix = np.empty((n_seqs, width), dtype=np.uint8)
+    else:
+        matrix = np.memmap(input_file, dtype=np.uint8, mode="r",
+                           offset=_matrix_offset(ref_len, ids_len),
+                           shape=(n_seqs, width))
+
+    return matrix, ids, reference
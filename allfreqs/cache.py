@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from contextlib import contextmanager
+import hashlib
+import os
+import tempfile
+from typing import Iterable, Iterator, Optional, Union
+import zipfile
+
+import allfreqs
+from allfreqs.classes import AlleleCounts, Reference
+from allfreqs.regions import Region, _expand
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # no locking on Windows, where replacing files is already atomic
+    fcntl = None
+
+# Default maximum size of the cache directory, in bytes
+MAX_SIZE = 2 ** 30
+
+_ENTRY_SUFFIX = ".npz"
+
+
+def _hash_file(digest, input_file: str, block_size: int = 2 ** 20):
+    """Update the digest with the contents of a file."""
+    with open(input_file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+
+
+class ResultCache:
+    """Persistent on-disk cache of allele counts, shared by processes.
+
+    Entries are keyed by a hash of the input bytes, the reference, the
+    selected regions and the allfreqs version, so that unchanged inputs
+    are neither parsed nor counted again; allele frequencies (with or
+    without ambiguous nucleotides) are calculated from the cached counts.
+
+    Entries are written to a temporary file and atomically moved in
+    place, so readers never see partial entries. When the cache grows
+    beyond `max_size` bytes, the least recently used entries are
+    removed, while holding an exclusive lock on the cache directory.
+    """
+
+    def __init__(self, directory: str, max_size: int = MAX_SIZE):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self,
+            sequences: str,
+            reference: Optional[Union[str, Reference]] = None,
+            regions: Optional[Iterable[Region]] = None,
+            exclude: Optional[Iterable[Region]] = None,
+            **options) -> str:
+        """Compute the key of the allele counts of a multialignment.
+
+        Args:
+            sequences: input file with multialignment
+            reference: optional reference file, or Reference object
+            regions: regions of the reference to restrict calculations to
+            exclude: regions of the reference to leave out
+            **options: any other option affecting counts, such as the
+                input format
+
+        Returns:
+            key: hexadecimal digest
+        """
+        digest = hashlib.sha256()
+        digest.update(allfreqs.__version__.encode())
+        _hash_file(digest, sequences)
+        if isinstance(reference, Reference):
+            digest.update(b"reference:" + repr(reference).encode())
+        elif reference:
+            digest.update(b"reference file:")
+            _hash_file(digest, reference)
+        for name, value in (("regions", regions), ("exclude", exclude)):
+            if value is not None:
+                # BED files are read so that their contents are hashed
+                value = _expand(value)
+            digest.update("{}:{!r}".format(name, value).encode())
+        digest.update(repr(sorted(options.items())).encode())
+
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Hold an exclusive lock on the cache directory."""
+        if fcntl is None:  # pragma: no cover
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, key: str) -> Optional[AlleleCounts]:
+        """Return the cached counts with the given key, or None if they
+        are not available.
+
+        Args:
+            key: key returned by `key()`
+        """
+        path = self._path(key)
+        try:
+            counts = AlleleCounts.load(path)
+            # the modification time records the last use of each entry
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+        return counts
+
+    def put(self, key: str, counts: AlleleCounts):
+        """Store counts with the given key, removing the least recently
+        used entries if the cache is larger than `max_size`.
+
+        Args:
+            key: key returned by `key()`
+            counts: allele counts to store
+        """
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                counts.save(f)
+            with self._lock():
+                os.replace(tmp, self._path(key))
+                self._evict()
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits
+        into `max_size`; must be called holding the lock."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(path)
+            size -= entry_size
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached entries, in bytes."""
+        return sum(entry.stat().st_size
+                   for entry in os.scandir(self.directory)
+                   if entry.name.endswith(_ENTRY_SUFFIX))
+
+    def clear(self):
+        """Remove all cached entries."""
+        with self._lock():
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(_ENTRY_SUFFIX):
+                    os.remove(entry.path)
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Created by Roberto Preste
-from typing import Dict, List, Union
+from typing import Any, BinaryIO, Dict, Iterable, List, Tuple, Union
 
 from cached_property import cached_property
+import numpy as np
 import pandas as pd
-from skbio import Sequence
+
+from allfreqs.compression import open_input
+from allfreqs.counting import BLOCK_CELLS, N_CODES, frequency_table
+from allfreqs.fasta import read_fasta
+from allfreqs.packing import GAP_BYTE, pack, pack_sequence, unpack
+from allfreqs.sparse import densify, diff_rows, stack_rows
 
 
 class MultiAlignment:
@@ -15,8 +21,11 @@ class MultiAlignment:
     is then used to create the resulting dataframe.
     """
 
+    # Number of sequences represented by each row of `matrix`, if not 1
+    weights = None
+
     def __init__(self, msa: Dict[str, str]):
-        self._msa = msa
+        self._msa = dict(msa)
 
     @cached_property
     def tabmsa(self) -> pd.DataFrame:
@@ -31,23 +40,739 @@ class MultiAlignment:
 
         return df
 
+    @cached_property
+    def ids(self) -> List[str]:
+        """List of sequence ids, in the same order as `matrix` rows."""
+        return list(self._msa.keys())
+
+    @cached_property
+    def matrix(self) -> np.ndarray:
+        """Create a (sequences x positions) matrix of ASCII bytes.
+
+        Each sequence is stored as a row of ``uint8`` values, one byte
+        per base, which is much more compact than one Python string per
+        base. Sequences shorter than the longest one are padded with gaps.
+        """
+        matrix = np.full((len(self._msa), self.width), ord("-"),
+                         dtype=np.uint8)
+        for row, seq in zip(matrix, self._msa.values()):
+            row[:len(seq)] = np.frombuffer(
+                seq.encode("ascii", errors="replace"), dtype=np.uint8
+            )
+
+        return matrix
+
+    @property
+    def width(self) -> int:
+        """Number of columns of `matrix`, without building it."""
+        if "matrix" in self.__dict__:
+            return self.matrix.shape[1]
+        return max((len(seq) for seq in self._msa.values()), default=0)
+
+    def add(self, msa: Dict[str, str]):
+        """Add sequences to the multialignment.
+
+        Args:
+            msa: dictionary of the form {"sequence id": "sequence"}
+        """
+        duplicated = [seq_id for seq_id in msa if seq_id in self._msa]
+        if duplicated:
+            raise ValueError("Sequence ids already present in the "
+                             "multialignment: {}.".format(
+                                 ", ".join(duplicated)))
+        self._msa.update(msa)
+        self._invalidate()
+
+    def remove(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Remove sequences from the multialignment.
+
+        Args:
+            ids: ids of the sequences to remove
+
+        Returns:
+            msa: dictionary of the form {"sequence id": "sequence"} with
+                the removed sequences
+        """
+        ids = list(ids)
+        missing = [seq_id for seq_id in ids if seq_id not in self._msa]
+        if missing:
+            raise ValueError("Sequence ids not present in the "
+                             "multialignment: {}.".format(", ".join(missing)))
+        removed = {seq_id: self._msa.pop(seq_id) for seq_id in ids}
+        self._invalidate()
+
+        return removed
+
+    def _invalidate(self):
+        """Clear the cached properties derived from the sequences."""
+        for attr in ("tabmsa", "ids", "matrix"):
+            self.__dict__.pop(attr, None)
+
     def __len__(self):
-        return self.tabmsa.shape[0]
+        return len(self.ids)
 
     def __repr__(self):
         return repr(self.tabmsa)
 
 
+class MatrixAlignment(MultiAlignment):
+    """Class that holds a multialignment as a matrix of ASCII bytes.
+
+    Input is a (sequences x positions) matrix, for example a memory-mapped
+    one, and the list of sequence ids. It behaves like MultiAlignment,
+    but sequences are only decoded to strings when `tabmsa` is needed,
+    while added or removed sequences update the rows of `matrix`.
+    """
+
+    def __init__(self, matrix: np.ndarray, ids: List[str]):
+        if len(ids) != matrix.shape[0]:
+            raise ValueError("Please provide one id for each row of the "
+                             "matrix.")
+        self.matrix = matrix
+        self.ids = list(ids)
+
+    @cached_property
+    def _msa(self) -> Dict[str, str]:
+        return {seq_id: row.tobytes().decode("ascii")
+                for seq_id, row in zip(self.ids, self.matrix)}
+
+    @cached_property
+    def _rows(self) -> Dict[str, int]:
+        """Row of each sequence id in `matrix`."""
+        return {seq_id: row for row, seq_id in enumerate(self.ids)}
+
+    def add(self, msa: Dict[str, str]):
+        """Add sequences to the multialignment, appending them to `matrix`
+        without decoding the existing rows; spare rows are allocated, so
+        that the existing rows are not copied on every addition.
+
+        Args:
+            msa: dictionary of the form {"sequence id": "sequence"}
+        """
+        duplicated = [seq_id for seq_id in msa if seq_id in self._rows]
+        if duplicated:
+            raise ValueError("Sequence ids already present in the "
+                             "multialignment: {}.".format(
+                                 ", ".join(duplicated)))
+        new = MultiAlignment(msa)
+        n_rows, width = self.matrix.shape
+        n_total = n_rows + len(new)
+        buffer = self.__dict__.get("_buffer")
+        if buffer is None or len(buffer) < n_total or \
+                buffer.shape[1] < new.width:
+            # grow by a quarter at least, so that repeated additions only
+            # copy the existing rows once in a while
+            width = max(width, new.width)
+            buffer = np.empty((max(n_total, n_rows + n_rows // 4), width),
+                              dtype=np.uint8)
+            buffer[:n_rows, :self.matrix.shape[1]] = self.matrix
+            buffer[:n_rows, self.matrix.shape[1]:] = ord("-")
+            self._buffer = buffer
+        buffer[n_rows:n_total] = ord("-")
+        buffer[n_rows:n_total, :new.width] = new.matrix
+        self.matrix = buffer[:n_total]
+        rows = self._rows
+        for seq_id in msa:
+            rows[seq_id] = len(self.ids)
+            self.ids.append(seq_id)
+        self._invalidate()
+
+    def remove(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Remove sequences from the multialignment, dropping their rows
+        from `matrix` without decoding the remaining ones (in place, if
+        rows were added before).
+
+        Args:
+            ids: ids of the sequences to remove
+
+        Returns:
+            msa: dictionary of the form {"sequence id": "sequence"} with
+                the removed sequences
+        """
+        ids = list(dict.fromkeys(ids))
+        missing = [seq_id for seq_id in ids if seq_id not in self._rows]
+        if missing:
+            raise ValueError("Sequence ids not present in the "
+                             "multialignment: {}.".format(", ".join(missing)))
+        removed = {seq_id: self.matrix[self._rows[seq_id]].tobytes()
+                   .decode("ascii") for seq_id in ids}
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[[self._rows[seq_id] for seq_id in ids]] = False
+        kept = np.flatnonzero(keep)
+        if "_buffer" in self.__dict__:
+            # move up the rows following the first removed one in place
+            first = int(np.argmin(keep))
+            self.matrix[first:len(kept)] = self.matrix[kept[first:]]
+            self.matrix = self._buffer[:len(kept)]
+        else:
+            self.matrix = self.matrix[kept]
+        self.ids = [self.ids[row] for row in kept]
+        self.__dict__.pop("_rows", None)
+        self._invalidate()
+
+        return removed
+
+    def _invalidate(self):
+        """Clear the cached properties derived from the sequences, keeping
+        `matrix` and `ids` which are updated in place."""
+        for attr in ("tabmsa", "_msa"):
+            self.__dict__.pop(attr, None)
+
+
+class HaplotypeAlignment(MultiAlignment):
+    """Class that holds a multialignment as its unique haplotypes.
+
+    Input is an iterable of (sequence id, sequence) tuples (or a
+    dictionary of the form {"sequence id": "sequence"}), whose sequences
+    are hashed while being read, so that identical sequences are stored
+    once. It behaves like MultiAlignment, but `matrix` holds one row per
+    unique haplotype, `weights` holds the number of sequences sharing
+    each haplotype and `haplotype_index` the row of each sequence.
+    """
+
+    def __init__(self, msa: Union[Dict[str, str], Iterable[Tuple[str, str]]]):
+        self._haplotypes: Dict[str, int] = {}
+        self._samples: Dict[str, int] = {}
+        self._add(msa.items() if isinstance(msa, dict) else msa)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, ids: List[str]):
+        """Create the unique haplotypes of a (sequences x positions) matrix
+        of ASCII bytes, such as the one stored in .afm files.
+
+        Args:
+            matrix: (sequences x positions) matrix of ASCII bytes
+            ids: id of each row of the matrix
+        """
+        if len(ids) != matrix.shape[0]:
+            raise ValueError("Please provide one id for each row of the "
+                             "matrix.")
+        return cls((seq_id, row.tobytes().decode("ascii"))
+                   for seq_id, row in zip(ids, matrix))
+
+    def _add(self, records: Iterable[Tuple[str, str]]):
+        """Add (sequence id, sequence) tuples to the haplotypes."""
+        haplotypes = self._haplotypes
+        for seq_id, seq in records:
+            self._samples[seq_id] = haplotypes.setdefault(seq,
+                                                          len(haplotypes))
+
+    @property
+    def _msa(self) -> Dict[str, str]:
+        sequences = list(self._haplotypes)
+        return {seq_id: sequences[row]
+                for seq_id, row in self._samples.items()}
+
+    @cached_property
+    def ids(self) -> List[str]:
+        """List of sequence ids, in the same order as `haplotype_index`."""
+        return list(self._samples)
+
+    @cached_property
+    def haplotype_index(self) -> np.ndarray:
+        """Row of `matrix` holding the haplotype of each sequence."""
+        return np.fromiter(self._samples.values(), dtype=np.intp,
+                           count=len(self._samples))
+
+    @cached_property
+    def weights(self) -> np.ndarray:
+        """Number of sequences sharing the haplotype of each row of
+        `matrix`; haplotypes of removed sequences have weight 0."""
+        return np.bincount(self.haplotype_index,
+                           minlength=len(self._haplotypes))
+
+    @property
+    def n_haplotypes(self) -> int:
+        """Number of unique haplotypes."""
+        return int(np.count_nonzero(self.weights))
+
+    @cached_property
+    def matrix(self) -> np.ndarray:
+        """Create a (haplotypes x positions) matrix of ASCII bytes, with
+        one row per unique haplotype."""
+        matrix = np.full((len(self._haplotypes), self.width), ord("-"),
+                         dtype=np.uint8)
+        for row, seq in zip(matrix, self._haplotypes):
+            row[:len(seq)] = np.frombuffer(
+                seq.encode("ascii", errors="replace"), dtype=np.uint8
+            )
+
+        return matrix
+
+    @property
+    def width(self) -> int:
+        """Number of columns of `matrix`, without building it."""
+        if "matrix" in self.__dict__:
+            return self.matrix.shape[1]
+        return max((len(seq) for seq in self._haplotypes), default=0)
+
+    def add(self, msa: Dict[str, str]):
+        """Add sequences to the multialignment.
+
+        Args:
+            msa: dictionary of the form {"sequence id": "sequence"}
+        """
+        duplicated = [seq_id for seq_id in msa if seq_id in self._samples]
+        if duplicated:
+            raise ValueError("Sequence ids already present in the "
+                             "multialignment: {}.".format(
+                                 ", ".join(duplicated)))
+        self._add(msa.items())
+        self._invalidate()
+
+    def remove(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Remove sequences from the multialignment.
+
+        Args:
+            ids: ids of the sequences to remove
+
+        Returns:
+            msa: dictionary of the form {"sequence id": "sequence"} with
+                the removed sequences
+        """
+        ids = list(ids)
+        missing = [seq_id for seq_id in ids if seq_id not in self._samples]
+        if missing:
+            raise ValueError("Sequence ids not present in the "
+                             "multialignment: {}.".format(", ".join(missing)))
+        sequences = list(self._haplotypes)
+        removed = {seq_id: sequences[self._samples.pop(seq_id)]
+                   for seq_id in ids}
+        # haplotypes are kept as rows with weight 0, so that rows of an
+        # already built matrix do not change
+        for attr in ("tabmsa", "ids", "haplotype_index", "weights"):
+            self.__dict__.pop(attr, None)
+
+        return removed
+
+    def _invalidate(self):
+        """Clear the cached properties derived from the sequences."""
+        for attr in ("tabmsa", "ids", "matrix", "haplotype_index",
+                     "weights"):
+            self.__dict__.pop(attr, None)
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class PackedAlignment(MultiAlignment):
+    """Class that holds a multialignment packed with two bases per byte.
+
+    Input is an iterable of (sequence id, sequence) tuples (or a
+    dictionary of the form {"sequence id": "sequence"}), whose sequences
+    are packed while being read, so that the whole multialignment takes
+    half the memory of `matrix`; sequences can only contain the 16 IUPAC
+    symbols (including gaps). It behaves like MultiAlignment, but
+    `matrix` is unpacked every time it is needed, so allele counts should
+    be calculated from `packed` directly.
+    """
+
+    def __init__(self, msa: Union[Dict[str, str], Iterable[Tuple[str, str]]]):
+        self.packed = np.empty((0, 0), dtype=np.uint8)
+        self.ids = []
+        self._width = 0
+        self._append(msa.items() if isinstance(msa, dict) else msa)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, ids: List[str]):
+        """Pack a (sequences x positions) matrix of ASCII bytes, such as
+        the one stored in .afm files.
+
+        Args:
+            matrix: (sequences x positions) matrix of ASCII bytes
+            ids: id of each row of the matrix
+        """
+        if len(ids) != matrix.shape[0]:
+            raise ValueError("Please provide one id for each row of the "
+                             "matrix.")
+        packed = cls.__new__(cls)
+        packed.packed = pack(matrix)
+        packed.ids = list(ids)
+        packed._width = matrix.shape[1]
+
+        return packed
+
+    @cached_property
+    def _rows(self) -> Dict[str, int]:
+        """Row of each sequence id in `packed`."""
+        return {seq_id: row for row, seq_id in enumerate(self.ids)}
+
+    def _append(self, records: Iterable[Tuple[str, str]]):
+        """Pack (sequence id, sequence) tuples and append them to `packed`,
+        padding all rows with gaps to the length of the longest sequence.
+
+        Sequences are packed in chunks of about BLOCK_CELLS bytes, which
+        are moved to the spare rows of `packed` one at a time, so that the
+        packed sequences are not held twice in memory; spare rows are
+        allocated, so that the existing rows are not copied on every
+        addition. A repeated id replaces the sequence read before.
+        """
+        n_rows = len(self.ids)
+        width = self._width
+        new: Dict[str, int] = {}
+        replaced: Dict[int, np.ndarray] = {}
+        chunks = []
+        chunk = np.empty((0, 0), dtype=np.uint8)
+        filled = 0
+        for seq_id, seq in records:
+            packed = pack_sequence(seq)
+            width = max(width, len(seq))
+            if seq_id in new:
+                replaced[new[seq_id]] = packed
+                continue
+            if filled == len(chunk):
+                chunks.append(chunk[:filled])
+                n_bytes = (width + 1) // 2
+                chunk = np.empty((max(1, BLOCK_CELLS // max(n_bytes, 1)),
+                                  n_bytes), dtype=np.uint8)
+                filled = 0
+            elif chunk.shape[1] < len(packed):
+                wider = np.empty((len(chunk), len(packed)), dtype=np.uint8)
+                wider[:filled, :chunk.shape[1]] = chunk[:filled]
+                wider[:filled, chunk.shape[1]:] = GAP_BYTE
+                chunk = wider
+            chunk[filled, :len(packed)] = packed
+            chunk[filled, len(packed):] = GAP_BYTE
+            filled += 1
+            new[seq_id] = n_rows + len(new)
+        chunks.append(chunk[:filled])
+        del chunk
+
+        n_total = n_rows + len(new)
+        n_bytes = (width + 1) // 2
+        buffer = self.__dict__.get("_buffer")
+        if buffer is None or len(buffer) < n_total or \
+                buffer.shape[1] < n_bytes:
+            # grow by a quarter at least, so that repeated additions only
+            # copy the existing rows once in a while
+            buffer = np.empty((max(n_total, n_rows + n_rows // 4), n_bytes),
+                              dtype=np.uint8)
+            buffer[:n_rows, :self.packed.shape[1]] = self.packed
+            buffer[:n_rows, self.packed.shape[1]:] = GAP_BYTE
+            self._buffer = buffer
+        row = n_rows
+        while chunks:
+            chunk = chunks.pop(0)
+            buffer[row:row + len(chunk), :chunk.shape[1]] = chunk
+            buffer[row:row + len(chunk), chunk.shape[1]:] = GAP_BYTE
+            row += len(chunk)
+        for row, packed in replaced.items():
+            buffer[row, :len(packed)] = packed
+            buffer[row, len(packed):] = GAP_BYTE
+        self.packed = buffer[:n_total]
+        self._width = width
+        self.ids.extend(new)
+        self._rows.update(new)
+
+    @property
+    def _msa(self) -> Dict[str, str]:
+        return {seq_id: row.tobytes().decode("ascii")
+                for seq_id, row in zip(self.ids, self.matrix)}
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Unpack the multialignment to a (sequences x positions) matrix
+        of ASCII bytes; the result is not cached."""
+        return unpack(self.packed, self._width)
+
+    @property
+    def width(self) -> int:
+        """Number of positions of the multialignment."""
+        return self._width
+
+    def add(self, msa: Dict[str, str]):
+        """Add sequences to the multialignment, appending them to `packed`
+        without unpacking the existing rows.
+
+        Args:
+            msa: dictionary of the form {"sequence id": "sequence"}
+        """
+        duplicated = [seq_id for seq_id in msa if seq_id in self._rows]
+        if duplicated:
+            raise ValueError("Sequence ids already present in the "
+                             "multialignment: {}.".format(
+                                 ", ".join(duplicated)))
+        self._append(msa.items())
+        self._invalidate()
+
+    def remove(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Remove sequences from the multialignment, dropping their rows
+        from `packed` without unpacking the remaining ones (in place, if
+        `packed` was built from sequences).
+
+        Args:
+            ids: ids of the sequences to remove
+
+        Returns:
+            msa: dictionary of the form {"sequence id": "sequence"} with
+                the removed sequences
+        """
+        ids = list(dict.fromkeys(ids))
+        missing = [seq_id for seq_id in ids if seq_id not in self._rows]
+        if missing:
+            raise ValueError("Sequence ids not present in the "
+                             "multialignment: {}.".format(", ".join(missing)))
+        removed = {seq_id: unpack(self.packed[self._rows[seq_id]],
+                                  self._width).tobytes().decode("ascii")
+                   for seq_id in ids}
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[[self._rows[seq_id] for seq_id in ids]] = False
+        kept = np.flatnonzero(keep)
+        if "_buffer" in self.__dict__:
+            # move up the rows following the first removed one in place
+            first = int(np.argmin(keep))
+            self.packed[first:len(kept)] = self.packed[kept[first:]]
+            self.packed = self._buffer[:len(kept)]
+        else:
+            self.packed = self.packed[kept]
+        self.ids = [self.ids[row] for row in kept]
+        self.__dict__.pop("_rows", None)
+        self._invalidate()
+
+        return removed
+
+    def _invalidate(self):
+        """Clear the cached properties derived from the sequences."""
+        self.__dict__.pop("tabmsa", None)
+
+
+class SparseAlignment(MultiAlignment):
+    """Class that holds a multialignment as differences from its reference.
+
+    Input is an iterable of (sequence id, sequence) tuples (or a
+    dictionary of the form {"sequence id": "sequence"}) and the reference
+    sequence. Only the (sequence, column, symbol) differences from the
+    reference are stored, in compressed sparse row format, so memory
+    usage depends on the number of variants instead of the size of the
+    multialignment; sequences shorter than the reference are padded with
+    gaps. It behaves like MultiAlignment, but `matrix` is rebuilt every
+    time it is needed, so allele counts should be calculated from the
+    differences directly.
+    """
+
+    def __init__(self,
+                 msa: Union[Dict[str, str], Iterable[Tuple[str, str]]],
+                 reference: str):
+        self.reference = np.frombuffer(
+            reference.encode("ascii", errors="replace"), dtype=np.uint8
+        )
+        self._set_rows({}, msa.items() if isinstance(msa, dict) else msa)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, ids: List[str],
+                    reference: str):
+        """Find the differences of a (sequences x positions) matrix of
+        ASCII bytes, such as the one stored in .afm files.
+
+        Args:
+            matrix: (sequences x positions) matrix of ASCII bytes
+            ids: id of each row of the matrix
+            reference: reference sequence
+        """
+        if len(ids) != matrix.shape[0]:
+            raise ValueError("Please provide one id for each row of the "
+                             "matrix.")
+        sparse = cls({}, reference)
+        if matrix.shape[1] != len(sparse.reference):
+            raise ValueError("Reference and aligned sequences must have "
+                             "the same length.")
+        step = max(1, BLOCK_CELLS // max(matrix.shape[1], 1))
+        sparse.indptr, sparse.indices, sparse.symbols = stack_rows(
+            [diff_rows(matrix[start:start + step], sparse.reference)
+             for start in range(0, len(matrix), step)]
+        )
+        sparse.ids = list(ids)
+
+        return sparse
+
+    def _set_rows(self,
+                  rows: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                  records: Iterable[Tuple[str, str]]):
+        """Store the differences of the given rows, followed by the ones
+        of (sequence id, sequence) records, which are compared with the
+        reference one block of sequences at a time."""
+        rows = dict(rows)
+        width = len(self.reference)
+        step = max(1, BLOCK_CELLS // max(width, 1))
+        block_ids, block = [], []
+
+        def flush():
+            matrix = np.full((len(block), width), ord("-"), dtype=np.uint8)
+            for row, seq in zip(matrix, block):
+                row[:len(seq)] = np.frombuffer(seq, dtype=np.uint8)
+            indptr, indices, symbols = diff_rows(matrix, self.reference)
+            for n, seq_id in enumerate(block_ids):
+                rows[seq_id] = (indices[indptr[n]:indptr[n + 1]],
+                                symbols[indptr[n]:indptr[n + 1]])
+            block_ids.clear()
+            block.clear()
+
+        for seq_id, seq in records:
+            seq = seq.encode("ascii", errors="replace")
+            if len(seq) > width:
+                raise ValueError("Reference and aligned sequences must have "
+                                 "the same length.")
+            block_ids.append(seq_id)
+            block.append(seq)
+            if len(block) >= step:
+                flush()
+        if block:
+            flush()
+
+        lengths = [len(indices) for indices, _ in rows.values()]
+        self.indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        self.indices = np.concatenate(
+            [np.empty(0, dtype=np.int32),
+             *(indices for indices, _ in rows.values())])
+        self.symbols = np.concatenate(
+            [np.empty(0, dtype=np.uint8),
+             *(symbols for _, symbols in rows.values())])
+        self.ids = list(rows)
+
+    def _rows(self) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        return {seq_id: (self.indices[start:stop], self.symbols[start:stop])
+                for seq_id, start, stop in zip(self.ids, self.indptr[:-1],
+                                               self.indptr[1:])}
+
+    @property
+    def n_variants(self) -> int:
+        """Total number of differences from the reference."""
+        return len(self.indices)
+
+    @property
+    def _msa(self) -> Dict[str, str]:
+        return {seq_id: row.tobytes().decode("ascii")
+                for seq_id, row in zip(self.ids, self.matrix)}
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Rebuild the (sequences x positions) matrix of ASCII bytes; the
+        result is not cached."""
+        return densify(self.indptr, self.indices, self.symbols,
+                       self.reference)
+
+    @property
+    def width(self) -> int:
+        """Number of positions of the multialignment."""
+        return len(self.reference)
+
+    def add(self, msa: Dict[str, str]):
+        """Add sequences to the multialignment.
+
+        Args:
+            msa: dictionary of the form {"sequence id": "sequence"}
+        """
+        rows = self._rows()
+        duplicated = [seq_id for seq_id in msa if seq_id in rows]
+        if duplicated:
+            raise ValueError("Sequence ids already present in the "
+                             "multialignment: {}.".format(
+                                 ", ".join(duplicated)))
+        self._set_rows(rows, msa.items())
+        self._invalidate()
+
+    def remove(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Remove sequences from the multialignment.
+
+        Args:
+            ids: ids of the sequences to remove
+
+        Returns:
+            msa: dictionary of the form {"sequence id": "sequence"} with
+                the removed sequences
+        """
+        ids = list(ids)
+        rows = self._rows()
+        missing = [seq_id for seq_id in ids if seq_id not in rows]
+        if missing:
+            raise ValueError("Sequence ids not present in the "
+                             "multialignment: {}.".format(", ".join(missing)))
+        removed = {}
+        for seq_id in ids:
+            indices, symbols = rows.pop(seq_id)
+            seq = self.reference.copy()
+            seq[indices] = symbols
+            removed[seq_id] = seq.tobytes().decode("ascii")
+        self._set_rows(rows, [])
+        self._invalidate()
+
+        return removed
+
+    def _invalidate(self):
+        """Clear the cached properties derived from the sequences."""
+        self.__dict__.pop("tabmsa", None)
+
+
 class Reference:
     """Class to read and process a reference genome.
 
-    Input is a reference genome in string format, which is used to create
-    the reference positions.
+    Input is a reference genome in string format (or any object which
+    can be converted to string, such as a scikit-bio Sequence), which is
+    used to create the reference positions.
     """
 
-    def __init__(self, ref: Union[str, Sequence]):
+    def __init__(self, ref: Any):
         self._ref = str(ref)
 
+    @classmethod
+    def from_fasta(cls, reference: str, parser: str = "native"):
+        """Read the reference sequence from a fasta file.
+
+        Only the first sequence of the file is used.
+
+        Args:
+            reference: fasta file with reference sequence
+            parser: fasta parser, either "native" or "skbio"
+                [default: "native"]
+        """
+        for _, seq in read_fasta(reference, parser):
+            return cls(seq)
+        raise ValueError("No sequences found in {}.".format(reference))
+
+    @classmethod
+    def from_csv(cls, reference: str, **kwargs):
+        """Read the reference sequence from a csv file.
+
+        The csv file must be composed of two columns only, one for the
+        sequence id and the other for the actual sequence.
+
+        Args:
+            reference: csv file with reference sequence
+            **kwargs: additional options for pandas.read_csv()
+        """
+        with open_input(reference) as handle:
+            refer = pd.read_csv(handle, **kwargs)
+        if refer.shape[1] != 2:
+            raise ValueError("Please make sure the input only contains "
+                             "two columns.")
+        return cls(refer.iloc[0, 1])
+
+    @cached_property
+    def positions(self) -> np.ndarray:
+        """Create a structured array describing each reference position.
+
+        Each element has three fields: `position` (number of the last
+        non-gap reference base), `insertion` (number of gaps since that
+        base, 0 for the base itself) and `base` (reference symbol). They
+        are derived from the gap mask of the reference using cumulative
+        sums, without looping over single bases.
+        """
+        ref = np.frombuffer(self._ref.encode("ascii", errors="replace"),
+                            dtype=np.uint8)
+        is_base = ref != ord("-")
+        cols = np.arange(len(ref))
+        last_base = np.maximum.accumulate(np.where(is_base, cols, -1))
+
+        positions = np.empty(len(ref), dtype=[("position", np.int64),
+                                              ("insertion", np.int64),
+                                              ("base", "U1")])
+        positions["position"] = np.cumsum(is_base)
+        positions["insertion"] = cols - last_base
+        positions["base"] = ref.view("S1").astype("U1")
+
+        return positions
+
     @cached_property
     def indexes(self) -> List[str]:
         """Create a set of indexes based on the reference genome.
@@ -57,21 +782,191 @@ class Reference:
             1.1_-       insertion in position 1 (determines a gap in ref)
         and so on.
         """
-        indexes = []
-        n = 0
-        i = 0
-        for nt in self._ref:
-            if nt != "-":  # non-gap position
-                i = 0
-                n += 1
-            else:  # gap position
-                i += 1
-            indexes.append("{}.{}_{}".format(n, i, nt))
+        positions = self.positions
+        indexes = np.char.add(positions["position"].astype(str), ".")
+        indexes = np.char.add(indexes, positions["insertion"].astype(str))
+        indexes = np.char.add(indexes, "_")
+        indexes = np.char.add(indexes, positions["base"])
+
+        return indexes.tolist()
+
+    @cached_property
+    def _columns(self) -> Dict[Tuple[int, int], int]:
+        """Map each (position, insertion) pair to its column."""
+        return {(pos, ins): col for col, (pos, ins) in enumerate(zip(
+            self.positions["position"].tolist(),
+            self.positions["insertion"].tolist()))}
+
+    def locate(self, position: int, insertion: int = 0) -> int:
+        """Return the column of the given reference position.
+
+        Args:
+            position: reference position
+            insertion: insertion offset after the reference position
+                [default: 0]
+
+        Returns:
+            column: index of the column in the multialignment, which is
+                also the row of the position in `AlleleFreqs.frequencies`
+        """
+        try:
+            return self._columns[(position, insertion)]
+        except KeyError:
+            name = "{}.{}".format(position, insertion) if insertion \
+                else str(position)
+            raise ValueError("Position {} not found in the reference."
+                             .format(name)) from None
+
+    def span(self, start: int, end: int) -> slice:
+        """Return the columns of a range of reference positions.
+
+        Args:
+            start: first reference position
+            end: last reference position (included, together with the
+                insertions following it)
+
+        Returns:
+            columns: slice of the corresponding columns, which can also be
+                used to select rows of `AlleleFreqs.frequencies`
+        """
+        position = self.positions["position"]
+        return slice(int(np.searchsorted(position, start, side="left")),
+                     int(np.searchsorted(position, end, side="right")))
 
-        return indexes
+    def select(self, columns: np.ndarray) -> "Reference":
+        """Restrict the reference to the given columns.
+
+        The resulting reference keeps the original `positions` (and hence
+        `indexes`) of the selected columns, so that it can be used for
+        allele counts of a subset of positions.
+
+        Args:
+            columns: indexes of the columns to keep
+
+        Returns:
+            reference: new Reference with the selected columns only
+        """
+        positions = self.positions[columns]
+        ref = Reference("".join(positions["base"].tolist()))
+        ref.positions = positions
+
+        return ref
 
     def __len__(self):
         return len(self._ref)
 
     def __repr__(self):
         return self._ref
+
+
+class AlleleCounts:
+    """Class holding the symbol counts of each position of a multialignment.
+
+    Counts are stored as integers together with the number of sequences
+    used to calculate them, so that counts from separate multialignments
+    sharing the same reference can be merged (using either `merge()` or
+    the `+` operator) before calculating allele frequencies.
+    """
+
+    def __init__(self,
+                 counts: np.ndarray,
+                 n_seqs: int,
+                 reference: Reference):
+        if counts.shape != (len(reference), N_CODES):
+            raise ValueError("Counts must have one row per reference "
+                             "position and one column per symbol.")
+        self.counts = counts
+        self.n_seqs = n_seqs
+        self.reference = reference
+
+    def merge(self, other: "AlleleCounts") -> "AlleleCounts":
+        """Merge these counts with the ones from another multialignment.
+
+        Args:
+            other: counts calculated using the same reference positions
+
+        Returns:
+            counts: new object with the sum of both counts
+        """
+        if self.reference.indexes != other.reference.indexes:
+            raise ValueError("Counts must share the same reference "
+                             "positions to be merged.")
+        return AlleleCounts(self.counts + other.counts,
+                            self.n_seqs + other.n_seqs, self.reference)
+
+    def subtract(self, other: "AlleleCounts") -> "AlleleCounts":
+        """Remove the counts of a subset of sequences from these counts.
+
+        Args:
+            other: counts of the sequences to remove, calculated using the
+                same reference positions
+
+        Returns:
+            counts: new object with the difference of both counts
+        """
+        if self.reference.indexes != other.reference.indexes:
+            raise ValueError("Counts must share the same reference "
+                             "positions to be subtracted.")
+        return AlleleCounts(self.counts - other.counts,
+                            self.n_seqs - other.n_seqs, self.reference)
+
+    def frequencies(self, ambiguous: bool = False) -> pd.DataFrame:
+        """Calculate allele frequencies from the stored counts.
+
+        Args:
+            ambiguous: show frequencies for ambiguous nucleotides too
+                [default: False]
+
+        Returns:
+            frequencies: dataframe with the same layout as
+                AlleleFreqs.frequencies
+        """
+        return frequency_table(self.counts, self.n_seqs,
+                               self.reference.indexes, ambiguous)
+
+    def save(self, output_file: Union[str, BinaryIO]):
+        """Write counts to disk in numpy .npz format, so that they can be
+        loaded and merged later.
+
+        Args:
+            output_file: output file name, or binary file object
+        """
+        np.savez_compressed(output_file, counts=self.counts,
+                            n_seqs=self.n_seqs,
+                            reference=np.array(repr(self.reference)),
+                            positions=self.reference.positions)
+
+    @classmethod
+    def load(cls, input_file: str):
+        """Read counts previously written to disk using `save()`.
+
+        Args:
+            input_file: input .npz file
+        """
+        with np.load(input_file) as data:
+            reference = Reference(str(data["reference"]))
+            if "positions" in data.files:
+                # keep the original positions of region-restricted counts
+                reference.positions = data["positions"]
+            return cls(data["counts"], int(data["n_seqs"]), reference)
+
+    def __add__(self, other):
+        if not isinstance(other, AlleleCounts):
+            return NotImplemented
+        return self.merge(other)
+
+    def __sub__(self, other):
+        if not isinstance(other, AlleleCounts):
+            return NotImplemented
+        return self.subtract(other)
+
+    def __radd__(self, other):
+        # allow using sum() over a list of counts
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __repr__(self):
+        return "<{} ({} sequences, {} positions)>".format(
+            self.__class__.__name__, self.n_seqs, len(self.reference)
+        )
@@ -1,42 +1,642 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Created by Roberto Preste
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import os
 import sys
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
 import click
 
-from allfreqs import AlleleFreqs
+from allfreqs import __version__
+from allfreqs.compression import strip_compression_suffix
+from allfreqs.constants import STORAGES
 
+if TYPE_CHECKING:  # pragma: no cover
+    from allfreqs.allfreqs import AlleleFreqs
+    from allfreqs.cache import ResultCache
+    from allfreqs.classes import Reference
+    from allfreqs.profiling import Profiler
 
-@click.command()
-@click.argument("input_file")
-@click.option("--out", "-o", default="all_freqs.csv", show_default=True,
-              help="Output filename")
+# Modules depending on numpy and pandas are imported inside commands, so
+# that --help, --version and argument errors do not need to load them.
+
+
+FASTA_EXTENSIONS = ("fasta", "fa", "fas", "fna")
+
+
+class DefaultGroup(click.Group):
+    """Command group which invokes a default command when the first
+    argument is not one of its subcommands, so that `allfreqs INPUT_FILE`
+    works as a shortcut for `allfreqs run INPUT_FILE`."""
+
+    default_command = "run"
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and \
+                args[0] not in ctx.help_option_names + ["--version"]:
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+
+def _input_format(input_file: str) -> Optional[str]:
+    """Return the format of a file (either fasta, csv or afm) according to
+    its extension, ignoring compression suffixes such as .gz, or None if
+    the extension is not recognised."""
+    input_ext = strip_compression_suffix(input_file).split(".")[-1].lower()
+    if input_ext in FASTA_EXTENSIONS:
+        return "fasta"
+    elif input_ext in ("csv", "afm"):
+        return input_ext
+    return None
+
+
+def _read_input(input_file: str,
+                reference: Optional[Union[str, "Reference"]] = None,
+                ambiguous: bool = False,
+                chunksize: Optional[int] = None,
+                jobs: int = 1,
+                regions: Optional[Tuple[str, ...]] = None,
+                exclude: Optional[Tuple[str, ...]] = None,
+                profiler: Optional["Profiler"] = None,
+                cache: Optional["ResultCache"] = None,
+                dedup: bool = False,
+                storage: str = "bytes",
+                index: bool = False
+                ) -> Optional["AlleleFreqs"]:
+    """Read the input multialignment according to its extension, or
+    return None if the extension is not recognised."""
+    from allfreqs.allfreqs import AlleleFreqs
+
+    input_format = _input_format(input_file)
+    if input_format == "fasta":
+        return AlleleFreqs.from_fasta(input_file, reference, ambiguous,
+                                      n_jobs=jobs, regions=regions,
+                                      exclude=exclude, profiler=profiler,
+                                      cache=cache, dedup=dedup,
+                                      storage=storage, index=index)
+    elif input_format == "csv":
+        return AlleleFreqs.from_csv(input_file, reference, ambiguous,
+                                    chunksize=chunksize, n_jobs=jobs,
+                                    regions=regions, exclude=exclude,
+                                    profiler=profiler, cache=cache,
+                                    dedup=dedup, storage=storage)
+    elif input_format == "afm":
+        return AlleleFreqs.from_afm(input_file, ambiguous, n_jobs=jobs,
+                                    regions=regions, exclude=exclude,
+                                    profiler=profiler, cache=cache,
+                                    dedup=dedup, storage=storage)
+    return None
+
+
+def _output_format(out: str) -> str:
+    """Return the output format matching the extension of the output file,
+    using csv if the extension is not recognised (or for stdout)."""
+    output_ext = out.split(".")[-1].lower()
+    if output_ext in ("parquet", "pq"):
+        return "parquet"
+    elif output_ext in ("feather", "arrow"):
+        return "feather"
+    elif output_ext in ("h5", "hdf5", "hdf"):
+        return "hdf"
+    elif output_ext in ("tsv", "tab"):
+        return "tsv"
+    return "csv"
+
+
+def _write_output(a: "AlleleFreqs",
+                  out: str,
+                  groups: Optional[Dict[str, str]] = None,
+                  precision: Optional[int] = None):
+    """Write allele frequencies in the format matching the extension of
+    the output file, or as csv to stdout if `out` is "-"; if groups are
+    provided, grouped allele frequencies are written instead."""
+    from allfreqs.writer import write_frequencies
+
+    output_format = _output_format(out)
+    sep = "\t" if output_format == "tsv" else ","
+    if groups is None:
+        if output_format in ("csv", "tsv"):
+            a.to_csv(out, sep=sep, precision=precision)
+        else:
+            getattr(a, f"to_{output_format}")(out)
+        return
+
+    if output_format in ("csv", "tsv"):
+        counts = a.grouped_counts(groups)
+        if not counts:
+            raise ValueError("None of the sequences belongs to the given "
+                             "groups.")
+        for n, (label, group_counts) in enumerate(counts.items()):
+            write_frequencies(group_counts, out, a.ambiguous, sep, precision,
+                              group=label, header=n == 0, append=n > 0)
+        return
+
+    table = a.grouped_frequencies(groups)
+    if output_format == "parquet":
+        table.to_parquet(out, index=False)
+    elif output_format == "feather":
+        table.to_feather(out)
+    else:
+        table.to_hdf(out, key="frequencies", mode="w")
+
+
+def _read_groups(groups: str) -> Dict[str, str]:
+    """Read the csv file with an id,group header, followed by sequence
+    ids in the first column and their group in the second one."""
+    import pandas as pd
+
+    table = pd.read_csv(groups, dtype=str)
+    if table.columns.tolist() != ["id", "group"]:
+        raise click.BadParameter("Please make sure the groups file only "
+                                 "contains two columns, with an id,group "
+                                 "header row.")
+    return dict(zip(table["id"], table["group"]))
+
+
+def _read_reference(reference: str) -> Optional["Reference"]:
+    """Read the reference sequence according to its extension, or return
+    None if the extension is not recognised."""
+    from allfreqs.classes import Reference
+
+    reference_format = _input_format(reference)
+    if reference_format == "fasta":
+        return Reference.from_fasta(reference)
+    elif reference_format == "csv":
+        return Reference.from_csv(reference)
+    return None
+
+
+def _expand_inputs(input_files: Tuple[str, ...],
+                   manifest: Optional[str] = None) -> List[str]:
+    """Return the list of input files, reading the manifest file (if any)
+    and expanding glob patterns."""
+    inputs = []
+    if manifest:
+        with open(manifest) as f:
+            inputs.extend(line.strip() for line in f
+                          if line.strip() and not line.startswith("#"))
+    for input_file in input_files:
+        matches = []
+        if any(char in input_file for char in "*?["):
+            matches = sorted(glob.glob(input_file))
+        inputs.extend(matches or [input_file])
+
+    return inputs
+
+
+def _output_name(template: str, input_file: str) -> str:
+    """Create the output filename for the given input file, replacing
+    {name} and {stem} with the input file name with and without
+    extension."""
+    name = os.path.basename(input_file)
+    stem = os.path.splitext(strip_compression_suffix(name))[0]
+
+    return template.format(name=name, stem=stem)
+
+
+def _process_file(input_file: str,
+                  out: str,
+                  reference: Optional["Reference"],
+                  ambiguous: bool,
+                  chunksize: Optional[int],
+                  groups: Optional[Dict[str, str]],
+                  regions: Optional[Tuple[str, ...]],
+                  exclude: Optional[Tuple[str, ...]],
+                  profile: bool = False,
+                  precision: Optional[int] = None,
+                  cache: Optional["ResultCache"] = None,
+                  dedup: bool = False,
+                  storage: str = "bytes",
+                  index: bool = False
+                  ) -> Tuple[float, Optional[str], Optional[str]]:
+    """Calculate and save allele frequencies for a single input file in
+    batch mode, returning the elapsed time, the error message (if any)
+    and the profiling report (if requested)."""
+    from allfreqs.profiling import Profiler
+
+    start = time.perf_counter()
+    profiler = Profiler() if profile else None
+    try:
+        a = _read_input(input_file, reference, ambiguous, chunksize,
+                        regions=regions, exclude=exclude, profiler=profiler,
+                        cache=cache, dedup=dedup, storage=storage,
+                        index=index)
+        if a is None:
+            raise ValueError("input not recognised")
+        _write_output(a, out, groups, precision)
+    except Exception as e:
+        return (time.perf_counter() - start, str(e) or e.__class__.__name__,
+                None)
+
+    return (time.perf_counter() - start, None,
+            profiler.format() if profile else None)
+
+
+def _run_batch(inputs: List[str],
+               out: str,
+               reference: Optional[str],
+               ambiguous: bool,
+               chunksize: Optional[int],
+               groups: Optional[Dict[str, str]],
+               regions: Optional[Tuple[str, ...]],
+               exclude: Optional[Tuple[str, ...]],
+               jobs: int,
+               profile: bool = False,
+               precision: Optional[int] = None,
+               cache: Optional["ResultCache"] = None,
+               dedup: bool = False,
+               storage: str = "bytes",
+               index: bool = False):
+    """Process several input files, using a pool of `jobs` worker
+    processes, and print a summary at the end."""
+    outputs = [_output_name(out, input_file) for input_file in inputs]
+    if len(set(outputs)) < len(outputs):
+        click.echo("Output filenames are not unique. Please use {stem} or "
+                   "{name} in --out when providing multiple inputs.")
+        sys.exit(1)
+
+    ref = None
+    if reference:
+        ref = _read_reference(reference)
+        if ref is None:
+            click.echo("Reference not recognised. "
+                       "Please provide either a fasta or csv file.")
+            sys.exit(1)
+
+    start = time.perf_counter()
+    args = [(input_file, output, ref, ambiguous, chunksize, groups, regions,
+             exclude, profile, precision, cache, dedup, storage, index)
+            for input_file, output in zip(inputs, outputs)]
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(_process_file, *zip(*args)))
+    else:
+        results = [_process_file(*arg) for arg in args]
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for input_file, output, (seconds, error, report) in zip(inputs, outputs,
+                                                            results):
+        if error is None:
+            click.echo(f"{input_file}: allele frequencies saved to "
+                       f"{output} ({seconds:.2f} s).")
+            if report:
+                click.echo(f"{input_file}:\n{report}", err=True)
+        else:
+            failed += 1
+            click.echo(f"{input_file}: failed, {error} ({seconds:.2f} s).")
+    click.echo(f"Processed {len(inputs)} files in {elapsed:.2f} s: "
+               f"{len(inputs) - failed} succeeded, {failed} failed.")
+    if failed:
+        sys.exit(1)
+
+
+@click.group(cls=DefaultGroup)
+@click.version_option(version=__version__)
+def main():
+    """Calculate allele frequencies from multialignments.
+
+    If no command is given, `run` is used, so that `allfreqs INPUT_FILE`
+    is the same as `allfreqs run INPUT_FILE`.
+    """
+    pass
+
+
+@main.command(name="run")
+@click.argument("input_files", nargs=-1)
+@click.option("--out", "-o", default=None,
+              help="Output filename [default: all_freqs.csv], or - to "
+                   "write csv to stdout; use a .tsv, .parquet, .feather or "
+                   ".h5 extension to save in tsv, Parquet, Feather or HDF5 "
+                   "format instead of csv. With multiple "
+                   "inputs, {stem} and {name} are replaced by the name of "
+                   "each input file without and with extension "
+                   "[default: {stem}_freqs.csv]")
+@click.option("--manifest", "-m", default=None,
+              help="Text file with a list of input files, one per line")
 @click.option("--reference", "-r", default=None,
-              help="Optional reference file (if not present in INPUT_FILE)")
+              help="Optional reference file (if not present in INPUT_FILES)")
 @click.option("--ambiguous", "-a", default=False, is_flag=True,
               show_default=True,
               help="Show frequencies for ambiguous nucleotides too")
-@click.version_option()
-def main(input_file, out, reference, ambiguous):
-    """Calculate allele frequencies from the given input multialignment.
+@click.option("--chunksize", "-c", default=None, type=int,
+              help="Read csv input in chunks of this many rows, without "
+                   "keeping the whole multialignment in memory")
+@click.option("--jobs", "-j", default=1, show_default=True,
+              help="Number of worker processes used to count alleles, or to "
+                   "process input files when multiple inputs are provided")
+@click.option("--groups", "-g", default=None,
+              help="Csv file with sequence ids and their group (e.g. "
+                   "haplogroup or population), used to calculate allele "
+                   "frequencies separately for each group")
+@click.option("--regions", "-R", multiple=True,
+              help="Only calculate allele frequencies for these reference "
+                   "positions, either as a comma-separated list of positions "
+                   "and ranges (e.g. 16024-576,310.1) or as a BED file; can "
+                   "be used multiple times")
+@click.option("--exclude", "-x", multiple=True,
+              help="Leave out these reference positions, in the same format "
+                   "used by --regions; can be used multiple times")
+@click.option("--profile", default=False, is_flag=True,
+              help="Print wall time, CPU time and peak memory of each stage "
+                   "to stderr")
+@click.option("--precision", "-p", default=None, type=click.IntRange(0),
+              help="Number of decimal digits of frequencies in csv and tsv "
+                   "output [default: full precision]")
+@click.option("--cache-dir", default=None,
+              help="Directory of a persistent cache of allele counts, so "
+                   "that unchanged inputs are neither parsed nor counted "
+                   "again")
+@click.option("--cache-size", default=1024, show_default=True,
+              type=click.IntRange(0),
+              help="Maximum size of the cache directory in MB; least "
+                   "recently used results are removed beyond this size")
+@click.option("--dedup", default=False, is_flag=True,
+              help="Store and count identical sequences (haplotypes) once, "
+                   "and report the number of unique haplotypes")
+@click.option("--storage", default="bytes", show_default=True,
+              type=click.Choice(STORAGES),
+              help="Keep the multialignment in memory with one byte per "
+                   "base, packed with two bases per byte (only for "
+                   "sequences made of IUPAC nucleotides and gaps), or as "
+                   "sparse differences from the reference")
+@click.option("--index", "use_index", default=False, is_flag=True,
+              help="Read uncompressed fasta inputs through a .fai offset "
+                   "index, built next to each file if missing, splitting "
+                   "records across --jobs worker processes; compressed "
+                   "inputs are read as usual")
+def run(input_files, out, manifest, reference, ambiguous, chunksize, jobs,
+        groups, regions, exclude, profile, precision, cache_dir,
+        cache_size, dedup, storage, use_index):
+    """Calculate allele frequencies from the given input multialignments.
 
     Input can be either a fasta or csv file with multialigned sequences,
     which may or may not contain the reference sequence in the first
     position. In the latter case, an additional reference sequence file
-    is needed, either in fasta or csv format.
+    is needed, either in fasta or csv format. Binary .afm files created
+    with `allfreqs convert` can be used as well, and already include
+    the reference sequence. Fasta files can have a .fasta, .fa, .fas or
+    .fna extension, and fasta or csv files compressed with gzip, bgzip or
+    xz (e.g. .fasta.gz) are decompressed while being read.
+
+    Multiple input files (or glob patterns, or a manifest file) can be
+    provided, in which case the reference is read only once and a summary
+    is printed at the end.
+
+    With --cache-dir, allele counts are stored in a persistent cache, and
+    inputs counted in a previous run are neither parsed nor counted again.
     """
-    input_ext = input_file.split(".")[-1]
-    if input_ext == "fasta":
-        a = AlleleFreqs.from_fasta(input_file, reference, ambiguous)
-    elif input_ext == "csv":
-        a = AlleleFreqs.from_csv(input_file, reference, ambiguous)
-    else:
+    from allfreqs.cache import ResultCache
+    from allfreqs.profiling import Profiler
+    from allfreqs.regions import RegionError
+
+    inputs = _expand_inputs(input_files, manifest)
+    if not inputs:
+        raise click.UsageError("Please provide at least one input file.")
+    if dedup and chunksize:
+        raise click.UsageError("Please use either --dedup or --chunksize.")
+    if groups and chunksize:
+        raise click.UsageError("Please use either --groups or --chunksize.")
+    if storage != "bytes" and (dedup or chunksize):
+        raise click.UsageError("Please use --storage {} without --dedup "
+                               "or --chunksize.".format(storage))
+    if groups:
+        groups = _read_groups(groups)
+    regions = regions or None
+    exclude = exclude or None
+    cache = ResultCache(cache_dir, cache_size * 2 ** 20) if cache_dir \
+        else None
+    if len(inputs) > 1:
+        _run_batch(inputs, out or "{stem}_freqs.csv", reference, ambiguous,
+                   chunksize, groups, regions, exclude, jobs, profile,
+                   precision, cache, dedup, storage, use_index)
+        return 0
+
+    input_file = inputs[0]
+    out = _output_name(out or "all_freqs.csv", input_file)
+    profiler = Profiler() if profile else None
+    try:
+        a = _read_input(input_file, reference, ambiguous, chunksize, jobs,
+                        regions, exclude, profiler, cache, dedup, storage,
+                        use_index)
+    except RegionError as e:
+        raise click.BadParameter(str(e),
+                                 param_hint="'--regions' / '--exclude'")
+    if a is None:
+        click.echo("Input not recognised. "
+                   "Please provide either a fasta, csv or afm file.")
+        return 1
+    _write_output(a, out, groups, precision)
+    if out != "-":
+        click.echo(f"Allele frequencies saved to {out}.")
+    if dedup and not a.cache_hit and a.multialg is not None:
+        click.echo(f"{a.n_seqs} sequences, {a.n_haplotypes} unique "
+                   f"haplotypes.", err=True)
+    if profiler is not None:
+        click.echo(profiler.format(), err=True)
+
+    return 0
+
+
+@main.command(name="convert")
+@click.argument("input_file")
+@click.argument("output_file")
+@click.option("--reference", "-r", default=None,
+              help="Optional reference file (if not present in INPUT_FILE)")
+def convert(input_file, output_file, reference):
+    """Convert the given input multialignment to binary .afm format.
+
+    Input can be either a fasta or csv file with multialigned sequences,
+    with the same rules used by `allfreqs run`. The resulting .afm file
+    can be used as input for `allfreqs run`, and is memory-mapped instead
+    of being parsed, so that repeated runs on the same multialignment
+    can start counting right away.
+    """
+    a = _read_input(input_file, reference)
+    if a is None:
         click.echo("Input not recognised. "
                    "Please provide either a fasta or csv file.")
         return 1
-    a.to_csv(out)
-    click.echo(f"Allele frequencies saved to {out}.")
+    a.to_afm(output_file)
+    click.echo(f"Multialignment saved to {output_file}.")
+
+    return 0
+
+
+@main.command(name="index")
+@click.argument("input_files", nargs=-1, required=True)
+def index(input_files):
+    """Build the .fai offset index of the given fasta files.
+
+    The index records the byte offset and line layout of each sequence,
+    as done by samtools faidx, and is saved next to each file. It is used
+    by `allfreqs run --index` to read records in parallel, and to read
+    single sequences by id without reading the whole file.
+    """
+    from allfreqs.faidx import INDEX_SUFFIX, build_index, write_index
+
+    failed = 0
+    for input_file in input_files:
+        try:
+            records = build_index(input_file)
+            write_index(records, input_file + INDEX_SUFFIX)
+        except (OSError, ValueError) as e:
+            failed += 1
+            click.echo(f"{input_file}: failed, {e}")
+            continue
+        click.echo(f"{input_file}: indexed {len(records)} sequences.")
+    if failed:
+        sys.exit(1)
+
+    return 0
+
+
+@main.command(name="serve")
+@click.argument("input_files", nargs=-1)
+@click.option("--manifest", "-m", default=None,
+              help="Text file with a list of input files, one per line")
+@click.option("--reference", "-r", default=None,
+              help="Optional reference file (if not present in INPUT_FILES)")
+@click.option("--host", default="127.0.0.1", show_default=True,
+              help="Address to listen on")
+@click.option("--port", default=8000, show_default=True,
+              type=click.IntRange(0, 65535),
+              help="Port to listen on")
+@click.option("--jobs", "-j", default=1, show_default=True,
+              help="Number of worker processes used to load each input")
+@click.option("--dedup", default=False, is_flag=True,
+              help="Store identical sequences (haplotypes) once")
+@click.option("--storage", default="bytes", show_default=True,
+              type=click.Choice(STORAGES),
+              help="Keep multialignments in memory with one byte per base, "
+                   "packed with two bases per byte, or as sparse "
+                   "differences from the reference")
+@click.option("--index", "use_index", default=False, is_flag=True,
+              help="Read uncompressed fasta inputs through a .fai offset "
+                   "index")
+@click.option("--quiet", "-q", default=False, is_flag=True,
+              help="Do not log requests to stderr")
+def serve(input_files, manifest, reference, host, port, jobs, dedup,
+          storage, use_index, quiet):
+    """Serve allele frequencies of the given multialignments over HTTP.
+
+    Input files are read once and kept in memory, with the same rules used
+    by `allfreqs run`, and each one is available with the name of the
+    file without extension. Frequencies are then queried with
+    GET /frequencies, using the alignment, regions, exclude, ids,
+    ambiguous, format (json, csv or tsv) and precision parameters, or
+    with POST /frequencies and the same parameters as a JSON object;
+    GET /alignments lists the loaded multialignments.
+    """
+    from allfreqs.server import FrequencyService, create_server
+
+    inputs = _expand_inputs(input_files, manifest)
+    if not inputs:
+        raise click.UsageError("Please provide at least one input file.")
+    if dedup and storage != "bytes":
+        raise click.UsageError("Please use --storage {} without --dedup."
+                               .format(storage))
+    names = [_output_name("{stem}", input_file) for input_file in inputs]
+    if len(set(names)) < len(names):
+        raise click.UsageError("Input file names without extension must be "
+                               "unique.")
+    ref = None
+    if reference:
+        ref = _read_reference(reference)
+        if ref is None:
+            raise click.UsageError("Reference not recognised. Please "
+                                   "provide either a fasta or csv file.")
+
+    alignments = {}
+    for name, input_file in zip(names, inputs):
+        a = _read_input(input_file, ref, jobs=jobs, dedup=dedup,
+                        storage=storage, index=use_index)
+        if a is None:
+            raise click.UsageError(f"Input not recognised: {input_file}. "
+                                   f"Please provide either a fasta, csv or "
+                                   f"afm file.")
+        alignments[name] = a
+    server = create_server(FrequencyService(alignments), host, port,
+                           verbose=not quiet)
+    host, port = server.server_address[:2]
+    click.echo(f"Serving {len(alignments)} alignments on "
+               f"http://{host}:{port}/ (press Ctrl+C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+@main.command(name="benchmark")
+@click.option("--seqs", "-n", multiple=True, type=int, default=[1000],
+              show_default=True,
+              help="Number of sequences of the synthetic multialignment; can "
+                   "be used multiple times to get a scaling curve")
+@click.option("--length", "-l", multiple=True, type=int, default=[16569],
+              show_default=True,
+              help="Length of the synthetic reference; can be used multiple "
+                   "times to get a scaling curve")
+@click.option("--gap-rate", default=0.005, show_default=True,
+              help="Fraction of gaps in the synthetic sequences")
+@click.option("--insertions", default=50, show_default=True,
+              help="Number of insertion columns in the synthetic reference")
+@click.option("--ambiguity-rate", default=0.001, show_default=True,
+              help="Fraction of ambiguous nucleotides in the synthetic "
+                   "sequences")
+@click.option("--repeat", default=3, show_default=True,
+              help="Number of timed runs of each benchmark")
+@click.option("--seed", default=0, show_default=True,
+              help="Seed used to generate synthetic multialignments")
+@click.option("--out", "-o", default=None,
+              help="Save results to this JSON file instead of printing them")
+@click.option("--baseline", "-b", default=None,
+              help="JSON file with baseline results to compare with")
+@click.option("--tolerance", default=0.2, show_default=True,
+              help="Relative slowdown or memory increase allowed with "
+                   "respect to the baseline")
+def benchmark(seqs, length, gap_rate, insertions, ambiguity_rate, repeat,
+              seed, out, baseline, tolerance):
+    """Measure time and peak memory of each stage (parse, matrix, count,
+    write) on synthetic mtDNA-like multialignments.
+
+    Results are printed (or saved with --out) as JSON; if a --baseline
+    file from a previous run is provided, the command fails when any stage
+    is slower or uses more memory than the baseline, beyond --tolerance.
+    """
+    from allfreqs.benchmark import (
+        compare, read_results, run_benchmark, write_results
+    )
+
+    results = []
+    for n_seqs in seqs:
+        for width in length:
+            result = run_benchmark(n_seqs, width, repeat=repeat,
+                                   gap_rate=gap_rate, insertions=insertions,
+                                   ambiguity_rate=ambiguity_rate, seed=seed)
+            click.echo(f"{n_seqs} sequences x {width} positions: "
+                       f"{result['seconds']:.3f} s", err=True)
+            results.append(result)
+
+    text = write_results(out, results)
+    if out:
+        click.echo(f"Benchmark results saved to {out}.")
+    else:
+        click.echo(text)
+
+    if baseline:
+        regressions = compare(results, read_results(baseline), tolerance)
+        for regression in regressions:
+            click.echo(regression)
+        if regressions:
+            sys.exit(1)
+        click.echo("No regressions found with respect to the baseline.")
 
     return 0
 
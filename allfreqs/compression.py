@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import io
+import lzma
+import os
+import struct
+from typing import BinaryIO, Iterator, Optional
+import zlib
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+# File name suffixes of compressed files, removed to find the input format
+COMPRESSION_SUFFIXES = (".gz", ".bgz", ".xz")
+
+_GZIP_HEADER = struct.Struct("<4BI2BH")
+
+
+def detect_compression(input_file: str) -> Optional[str]:
+    """Detect the compression of a file from its first bytes.
+
+    Args:
+        input_file: input file name
+
+    Returns:
+        compression: either "bgzip", "gzip", "xz" or None for
+            uncompressed files
+    """
+    with open(input_file, "rb") as f:
+        head = f.read(16)
+    if head.startswith(GZIP_MAGIC):
+        # BGZF blocks are gzip members with a BC extra subfield
+        if len(head) >= 14 and head[3] & 4 and head[12:14] == b"BC":
+            return "bgzip"
+        return "gzip"
+    if head.startswith(XZ_MAGIC):
+        return "xz"
+    return None
+
+
+def _bgzf_blocks(handle: BinaryIO) -> Iterator[bytes]:
+    """Read the raw BGZF blocks of a bgzip-compressed file."""
+    while True:
+        header = handle.read(_GZIP_HEADER.size)
+        if not header:
+            return
+        if len(header) < _GZIP_HEADER.size or header[:2] != GZIP_MAGIC:
+            raise ValueError("Invalid BGZF block header.")
+        xlen = _GZIP_HEADER.unpack(header)[-1]
+        extra = handle.read(xlen)
+        bsize = None
+        pos = 0
+        while pos + 4 <= len(extra):
+            slen = struct.unpack_from("<H", extra, pos + 2)[0]
+            if extra[pos:pos + 2] == b"BC" and slen == 2:
+                bsize = struct.unpack_from("<H", extra, pos + 4)[0]
+            pos += 4 + slen
+        if bsize is None:
+            raise ValueError("Invalid BGZF block without block size.")
+        rest = handle.read(bsize + 1 - _GZIP_HEADER.size - xlen)
+        yield rest
+
+
+def _inflate(block: bytes) -> bytes:
+    """Decompress the data of a single BGZF block and check its CRC."""
+    crc, size = struct.unpack("<II", block[-8:])
+    data = zlib.decompress(block[:-8], wbits=-15)
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise ValueError("Corrupted BGZF block.")
+    return data
+
+
+class BgzfReader(io.RawIOBase):
+    """Read-only file object decompressing a bgzip-compressed file.
+
+    BGZF blocks are independent gzip members, so they are decompressed
+    by a pool of threads (zlib releases the GIL while inflating), keeping
+    at most a few blocks per thread in flight to bound memory usage.
+    """
+
+    def __init__(self, input_file: str, threads: Optional[int] = None):
+        self._handle = open(input_file, "rb")
+        self._threads = threads or min(4, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(self._threads)
+        self._chunks = self._decompress()
+        self._buffer = b""
+
+    def _decompress(self) -> Iterator[bytes]:
+        pending = deque()
+        for block in _bgzf_blocks(self._handle):
+            pending.append(self._pool.submit(_inflate, block))
+            if len(pending) >= self._threads * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._chunks.close()
+            self._pool.shutdown(wait=True)
+            self._handle.close()
+        super().close()
+
+
+def open_input(input_file: str, threads: Optional[int] = None) -> BinaryIO:
+    """Open a possibly compressed file for reading in binary mode.
+
+    Compression is detected from the first bytes of the file, and data
+    are decompressed while being read; bgzip-compressed files are
+    decompressed using several threads.
+
+    Args:
+        input_file: input file name
+        threads: number of threads used to decompress bgzip files
+            [default: up to 4]
+
+    Returns:
+        handle: binary file object with decompressed data
+    """
+    compression = detect_compression(input_file)
+    if compression == "bgzip":
+        return io.BufferedReader(BgzfReader(input_file, threads),
+                                 buffer_size=2 ** 16)
+    elif compression == "gzip":
+        return gzip.open(input_file, "rb")
+    elif compression == "xz":
+        return lzma.open(input_file, "rb")
+    return open(input_file, "rb")
+
+
+def strip_compression_suffix(filename: str) -> str:
+    """Remove the compression suffix (if any) from a file name."""
+    for suffix in COMPRESSION_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
@@ -6,3 +6,7 @@ STANDARD_COLS = ["A", "C", "G", "T", "gap", "oth"]
 
 AMBIGUOUS_COLS = ["A", "C", "G", "T", "R", "Y", "K", "M", "S", "W", "B", "D",
                   "H", "V", "N", "gap"]
+
+SYMBOLS = "ACGTRYKMSWBDHVN-"
+
+STORAGES = ("bytes", "packed", "sparse")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from allfreqs.constants import AMBIGUOUS_COLS, STANDARD_COLS, SYMBOLS
+
+# Code assigned to any byte which is not one of the known SYMBOLS
+OTHER = len(SYMBOLS)
+N_CODES = OTHER + 1
+
+SYMBOL_CODES = np.full(256, OTHER, dtype=np.uint8)
+SYMBOL_CODES[np.frombuffer(SYMBOLS.encode("ascii"), dtype=np.uint8)] = \
+    np.arange(len(SYMBOLS), dtype=np.uint8)
+
+# Maximum number of cells encoded and counted at once
+BLOCK_CELLS = 2 ** 22
+
+
+def encode(matrix: np.ndarray) -> np.ndarray:
+    """Convert a matrix of ASCII bytes to symbol codes.
+
+    Each known symbol is replaced by its index in SYMBOLS, while any other
+    byte is replaced by OTHER.
+
+    Args:
+        matrix: (sequences x positions) matrix of ASCII bytes
+
+    Returns:
+        codes: matrix of the same shape with symbol codes
+    """
+    return SYMBOL_CODES[matrix]
+
+
+def count_alleles(matrix: np.ndarray,
+                  columns: Optional[np.ndarray] = None,
+                  weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """Count the occurrences of each symbol in each position of a
+    multialignment.
+
+    All positions are counted at once, using a single bincount over the
+    encoded alignment (one block of rows at a time, to keep memory usage
+    bounded). If `columns` is provided, only those columns are encoded
+    and counted. If `weights` are provided, each row is counted as many
+    times as its weight, e.g. the number of samples sharing a haplotype.
+
+    Args:
+        matrix: (sequences x positions) matrix of ASCII bytes
+        columns: indexes of the columns to count [default: all columns]
+        weights: integer weight of each row [default: 1 for each row]
+
+    Returns:
+        counts: (positions x N_CODES) matrix of symbol counts, where
+            columns follow the order of SYMBOLS plus OTHER
+    """
+    n_seqs, n_pos = matrix.shape
+    if columns is not None:
+        n_pos = len(columns)
+    offsets = np.arange(n_pos, dtype=np.intp) * N_CODES
+    counts = np.zeros(n_pos * N_CODES, dtype=np.int64)
+    step = max(1, BLOCK_CELLS // max(n_pos, 1))
+    for start in range(0, n_seqs, step):
+        block = matrix[start:start + step]
+        if columns is not None:
+            block = block[:, columns]
+        codes = encode(block)
+        if weights is None:
+            counts += np.bincount((codes + offsets).ravel(),
+                                  minlength=n_pos * N_CODES)
+        else:
+            # float weights are exact for counts up to 2 ** 53
+            cell_weights = np.repeat(weights[start:start + step], n_pos)
+            counts += np.rint(np.bincount(
+                (codes + offsets).ravel(), weights=cell_weights,
+                minlength=n_pos * N_CODES
+            )).astype(np.int64)
+
+    return counts.reshape(n_pos, N_CODES)
+
+
+def count_alleles_grouped(matrix: np.ndarray,
+                          groups: np.ndarray,
+                          n_groups: int,
+                          columns: Optional[np.ndarray] = None
+                          ) -> np.ndarray:
+    """Count the occurrences of each symbol in each position of a
+    multialignment, separately for each group of sequences.
+
+    Sequences are sorted by group and counted in a single pass, using a
+    bincount over the encoded alignment offset by group, position and
+    symbol (one block of rows at a time, to keep memory usage bounded).
+    Each block also covers a limited number of groups, so that the counts
+    of a block stay about as large as the block itself.
+
+    Args:
+        matrix: (sequences x positions) matrix of ASCII bytes
+        groups: group code (from 0 to n_groups - 1) of each sequence, or -1
+            for sequences which do not belong to any group
+        n_groups: number of groups
+        columns: indexes of the columns to count [default: all columns]
+
+    Returns:
+        counts: (groups x positions x N_CODES) matrix of symbol counts
+    """
+    n_pos = matrix.shape[1] if columns is None else len(columns)
+    group_size = n_pos * N_CODES
+    offsets = np.arange(n_pos, dtype=np.intp) * N_CODES
+    counts = np.zeros((n_groups, group_size), dtype=np.int64)
+    order = np.argsort(groups, kind="stable")
+    order = order[groups[order] >= 0]
+    sorted_groups = groups[order]
+    step = max(1, BLOCK_CELLS // max(n_pos, 1))
+    # groups covered by each block, so that the bincount stays small too
+    max_span = max(1, BLOCK_CELLS // max(group_size, 1))
+    start = 0
+    while start < len(order):
+        stop = min(start + step, int(np.searchsorted(
+            sorted_groups, sorted_groups[start] + max_span, side="left"
+        )))
+        rows = order[start:stop]
+        row_groups = sorted_groups[start:stop]
+        start = stop
+        first = row_groups[0]
+        span = row_groups[-1] - first + 1
+        group_offsets = ((row_groups - first) * group_size).astype(np.intp)
+        block = matrix[rows]
+        if columns is not None:
+            block = block[:, columns]
+        codes = encode(block)
+        counts[first:first + span] += np.bincount(
+            (codes + offsets + group_offsets[:, None]).ravel(),
+            minlength=span * group_size
+        ).reshape(span, group_size)
+
+    return counts.reshape(n_groups, n_pos, N_CODES)
+
+
+def frequency_matrix(counts: np.ndarray,
+                     n_seqs: int,
+                     ambiguous: bool = False) -> Tuple[np.ndarray, List[str]]:
+    """Convert symbol counts to a matrix of allele frequencies.
+
+    Args:
+        counts: (positions x N_CODES) matrix of symbol counts
+        n_seqs: number of sequences used to calculate counts
+        ambiguous: show frequencies for ambiguous nucleotides too
+            [default: False]
+
+    Returns:
+        freqs: (positions x columns) matrix of allele frequencies
+        columns: either STANDARD_COLS or AMBIGUOUS_COLS
+    """
+    freqs = counts / n_seqs
+    if ambiguous:
+        # AMBIGUOUS_COLS follow the same order as SYMBOLS
+        return freqs[:, :len(AMBIGUOUS_COLS)], list(AMBIGUOUS_COLS)
+
+    table = np.empty((len(counts), len(STANDARD_COLS)))
+    for n, col in enumerate(STANDARD_COLS[:-1]):
+        symbol = "-" if col == "gap" else col
+        table[:, n] = freqs[:, SYMBOLS.index(symbol)]
+    known = table[:, 0] + table[:, 1] + table[:, 2] + table[:, 3]
+    table[:, -1] = 1.0 - (known + table[:, 4])
+
+    return table, list(STANDARD_COLS)
+
+
+def frequency_table(counts: np.ndarray,
+                    n_seqs: int,
+                    indexes: List[str],
+                    ambiguous: bool = False) -> pd.DataFrame:
+    """Convert symbol counts to the allele frequency dataframe.
+
+    Args:
+        counts: (positions x N_CODES) matrix of symbol counts
+        n_seqs: number of sequences used to calculate counts
+        indexes: position labels, as returned by Reference.indexes
+        ambiguous: show frequencies for ambiguous nucleotides too
+            [default: False]
+
+    Returns:
+        frequencies: dataframe with a position column followed by either
+            STANDARD_COLS or AMBIGUOUS_COLS
+    """
+    freqs, names = frequency_matrix(counts, n_seqs, ambiguous)
+    columns = {"position": indexes}
+    for n, col in enumerate(names):
+        columns[col] = freqs[:, n]
+
+    return pd.DataFrame(columns)
+
+
+class CountAccumulator:
+    """Class used to accumulate symbol counts from sequences added one at
+    a time.
+
+    Sequences are collected in a fixed-size buffer which is counted and
+    cleared whenever it is full, so that memory usage only depends on the
+    alignment width and not on the number of sequences. If `columns` is
+    provided, only those columns are counted.
+    """
+
+    def __init__(self,
+                 width: int,
+                 columns: Optional[np.ndarray] = None,
+                 batch_size: int = 1024):
+        self.width = width
+        self.columns = columns
+        self.n_seqs = 0
+        n_pos = width if columns is None else len(columns)
+        self._counts = np.zeros((n_pos, N_CODES), dtype=np.int64)
+        self._buffer = np.empty((batch_size, width), dtype=np.uint8)
+        self._filled = 0
+
+    def add(self, seq: str):
+        """Add a single aligned sequence to the counts.
+
+        Sequences shorter than the alignment width are padded with gaps.
+
+        Args:
+            seq: aligned sequence
+        """
+        if len(seq) > self.width:
+            raise ValueError("Reference and aligned sequences must have "
+                             "the same length.")
+        row = self._buffer[self._filled]
+        row[:len(seq)] = np.frombuffer(seq.encode("ascii", errors="replace"),
+                                       dtype=np.uint8)
+        row[len(seq):] = ord("-")
+        self._filled += 1
+        self.n_seqs += 1
+        if self._filled == len(self._buffer):
+            self._flush()
+
+    def update(self, seqs: Iterable[str]):
+        """Add several aligned sequences to the counts.
+
+        Args:
+            seqs: aligned sequences
+        """
+        for seq in seqs:
+            self.add(seq)
+
+    def _flush(self):
+        """Count the sequences collected in the buffer and clear it."""
+        if self._filled:
+            self._counts += count_alleles(self._buffer[:self._filled],
+                                          self.columns)
+            self._filled = 0
+
+    @property
+    def counts(self) -> np.ndarray:
+        """(positions x N_CODES) matrix of the symbol counts accumulated
+        so far."""
+        self._flush()
+        return self._counts
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import mmap
+import multiprocessing
+import os
+from typing import (
+    Any, BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+)
+
+import numpy as np
+
+from allfreqs.compression import detect_compression
+from allfreqs.counting import N_CODES, CountAccumulator
+from allfreqs.fasta import _WHITESPACE, parse_header
+from allfreqs.parallel import attach_matrix, shared_matrix
+
+# Suffix of the index file, written next to the fasta file
+INDEX_SUFFIX = ".fai"
+
+# Worker state: fasta file, indexed records and shared matrix
+_shared = {}
+
+
+class IndexRecord(NamedTuple):
+    """Location and line layout of a single fasta record, as in the .fai
+    indexes created by samtools faidx."""
+    name: str
+    length: int
+    offset: int
+    linebases: int
+    linewidth: int
+
+
+def _index_record(header: bytes, offset: int, body: bytes) -> IndexRecord:
+    """Describe the record with the given header, whose sequence lines
+    start at byte `offset` of the file."""
+    name = parse_header(header)
+    lines = body.split(b"\n")
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if not lines:
+        raise ValueError("Found header without sequence data: {}".format(
+            header.decode("utf-8", errors="replace").strip()))
+    linewidth = len(lines[0]) + 1
+    linebases = len(lines[0].rstrip())
+    length = len(body.translate(None, _WHITESPACE))
+    if any(len(line) != linewidth - 1 for line in lines[:-1]) or \
+            len(lines[-1]) > linewidth - 1 or \
+            length != linebases * (len(lines) - 1) + len(lines[-1].rstrip()):
+        raise ValueError("Different line lengths in record {}. Please make "
+                         "sure all lines of a sequence have the same length "
+                         "to index the file.".format(name))
+
+    return IndexRecord(name, length, offset, linebases, linewidth)
+
+
+def build_index(input_file: str) -> List[IndexRecord]:
+    """Find the byte offset and line layout of each record of a fasta
+    file.
+
+    Only uncompressed files can be indexed, and all the lines of each
+    sequence except the last one must have the same length.
+
+    Args:
+        input_file: input fasta file
+
+    Returns:
+        records: IndexRecord of each fasta record, in file order
+    """
+    if detect_compression(input_file) is not None:
+        raise ValueError("Only uncompressed fasta files can be indexed.")
+    records = []
+    with open(input_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return records
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = data.find(b">")
+            if data[:len(data) if start < 0 else start].strip():
+                raise ValueError("Found non-header line when attempting to "
+                                 "read the first fasta record.")
+            while start >= 0:
+                header_end = data.find(b"\n", start)
+                if header_end < 0:
+                    header_end = len(data)
+                stop = data.find(b"\n>", header_end)
+                next_start = stop + 1 if stop >= 0 else -1
+                if stop < 0:
+                    stop = len(data)
+                records.append(_index_record(data[start:header_end],
+                                             header_end + 1,
+                                             data[header_end + 1:stop]))
+                start = next_start
+
+    return records
+
+
+def write_index(records: List[IndexRecord], index_file: str):
+    """Write records to a tab-separated .fai index file.
+
+    Args:
+        records: IndexRecord of each fasta record
+        index_file: output index file
+    """
+    with open(index_file, "w") as f:
+        for record in records:
+            f.write("\t".join(map(str, record)) + "\n")
+
+
+def read_index(index_file: str) -> List[IndexRecord]:
+    """Read records from a .fai index file.
+
+    Args:
+        index_file: index file created by write_index() or samtools faidx
+
+    Returns:
+        records: IndexRecord of each fasta record, in file order
+    """
+    records = []
+    with open(index_file) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5:
+                raise ValueError("Invalid fasta index line: {}".format(
+                    line.strip()))
+            records.append(IndexRecord(fields[0], *map(int, fields[1:5])))
+
+    return records
+
+
+def read_record(handle: BinaryIO, record: IndexRecord) -> bytes:
+    """Read the sequence of a single record, seeking to its offset.
+
+    Args:
+        handle: binary file object of the fasta file
+        record: IndexRecord of the sequence
+
+    Returns:
+        seq: uppercase sequence
+    """
+    handle.seek(record.offset)
+    lines, rest = divmod(record.length, record.linebases)
+    seq = handle.read(lines * record.linewidth + rest).translate(
+        None, _WHITESPACE).upper()
+    if len(seq) != record.length:
+        raise ValueError("Record {} does not match the fasta index. Please "
+                         "remove the index to rebuild it.".format(
+                             record.name))
+
+    return seq
+
+
+class FastaIndex:
+    """Class that provides random access to the records of a fasta file.
+
+    The .fai index next to the fasta file is used if it is newer than the
+    file itself, otherwise the file is indexed and the index is saved (if
+    possible) so that it is built only once. Sequences are then read by
+    id, seeking directly to their offset.
+    """
+
+    def __init__(self, input_file: str, index_file: Optional[str] = None):
+        self.input_file = input_file
+        self.index_file = index_file or input_file + INDEX_SUFFIX
+        self.records = self._load()
+        self._names = {record.name: record for record in self.records}
+
+    def _load(self) -> List[IndexRecord]:
+        """Read the index file, or build it if missing or outdated."""
+        if os.path.exists(self.index_file) and \
+                os.path.getmtime(self.index_file) >= \
+                os.path.getmtime(self.input_file):
+            return read_index(self.index_file)
+        records = build_index(self.input_file)
+        try:
+            write_index(records, self.index_file)
+        except OSError:
+            # the index is still used, and built again next time
+            pass
+
+        return records
+
+    @property
+    def ids(self) -> List[str]:
+        """List of sequence ids, in file order."""
+        return [record.name for record in self.records]
+
+    def fetch(self, seq_id: str) -> str:
+        """Read a single sequence by id, without reading the rest of the
+        file.
+
+        Args:
+            seq_id: sequence id
+
+        Returns:
+            seq: uppercase sequence
+        """
+        if seq_id not in self._names:
+            raise KeyError("Sequence id not present in {}: {}.".format(
+                self.input_file, seq_id))
+        with open(self.input_file, "rb") as f:
+            return read_record(f, self._names[seq_id]).decode("latin-1")
+
+    def unique_records(self) -> List[IndexRecord]:
+        """Records with unique ids, keeping the last record of duplicated
+        ids at the position of the first one, as done by dict()."""
+        return list(self._names.values())
+
+    def __getitem__(self, seq_id: str) -> str:
+        return self.fetch(seq_id)
+
+    def __contains__(self, seq_id: str) -> bool:
+        return seq_id in self._names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.records)
+
+
+def _fill(handle: BinaryIO, matrix: np.ndarray, records: List[IndexRecord]):
+    """Copy the sequences of records to the rows of a gap-filled matrix,
+    replacing non-ASCII bytes as done by MultiAlignment."""
+    for row, record in zip(matrix, records):
+        seq = np.frombuffer(read_record(handle, record), dtype=np.uint8)
+        row[:len(seq)] = np.where(seq > 127, ord("?"), seq)
+
+
+def _attach(input_file: str,
+            records: List[IndexRecord],
+            buffer: Any = None,
+            width: int = 0,
+            columns: Optional[np.ndarray] = None):
+    """Attach the fasta file, its records and the shared alignment matrix
+    (if any) in a worker process."""
+    _shared["input_file"] = input_file
+    _shared["records"] = records
+    _shared["width"] = width
+    _shared["columns"] = columns
+    if buffer is not None:
+        _shared["matrix"] = attach_matrix(buffer, (len(records), width))
+
+
+def _read_block(bounds: Tuple[int, int]):
+    """Read a block of records into the rows of the shared matrix."""
+    start, stop = bounds
+    with open(_shared["input_file"], "rb") as f:
+        _fill(f, _shared["matrix"][start:stop],
+              _shared["records"][start:stop])
+
+
+def _count_records(input_file: str,
+                   records: List[IndexRecord],
+                   width: int,
+                   columns: Optional[np.ndarray]) -> np.ndarray:
+    """Count alleles of the given records, one at a time."""
+    acc = CountAccumulator(width, columns)
+    with open(input_file, "rb") as f:
+        acc.update(read_record(f, record).decode("latin-1")
+                   for record in records)
+
+    return acc.counts
+
+
+def _count_block(bounds: Tuple[int, int]) -> np.ndarray:
+    """Count alleles of a block of records."""
+    start, stop = bounds
+    return _count_records(_shared["input_file"],
+                          _shared["records"][start:stop], _shared["width"],
+                          _shared["columns"])
+
+
+def _bounds(n_records: int, n_jobs: int) -> List[Tuple[int, int]]:
+    """Split records in blocks, a few for each worker."""
+    n_blocks = max(1, min(n_records, n_jobs * 4))
+    bounds = np.linspace(0, n_records, n_blocks + 1).astype(int).tolist()
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_indexed(input_file: str,
+                 records: List[IndexRecord],
+                 n_jobs: int = 1,
+                 width: Optional[int] = None) -> np.ndarray:
+    """Read the given records of an indexed fasta file into a (sequences x
+    positions) matrix of ASCII bytes, using several worker processes.
+
+    Records are split in blocks, and each worker seeks directly to the
+    records of its blocks and copies them to a matrix in shared memory,
+    which is returned without copying it again. Sequences shorter than
+    the longest one are padded with gaps.
+
+    Args:
+        input_file: input fasta file
+        records: IndexRecord of each sequence to read
+        n_jobs: number of worker processes [default: 1]
+        width: number of positions of the matrix [default: length of the
+            longest record]
+
+    Returns:
+        matrix: (sequences x positions) matrix of ASCII bytes, with the
+            same rows as MultiAlignment.matrix
+    """
+    longest = max((record.length for record in records), default=0)
+    if width is None:
+        width = longest
+    elif longest > width:
+        raise ValueError("Reference and aligned sequences must have the "
+                         "same length.")
+    shape = (len(records), width)
+    if n_jobs <= 1 or len(records) * width == 0:
+        matrix = np.full(shape, ord("-"), dtype=np.uint8)
+        with open(input_file, "rb") as f:
+            _fill(f, matrix, records)
+        return matrix
+
+    buffer, matrix = shared_matrix(shape)
+    matrix[:] = ord("-")
+    with multiprocessing.Pool(n_jobs, initializer=_attach,
+                              initargs=(input_file, records, buffer,
+                                        width)) as pool:
+        pool.map(_read_block, _bounds(len(records), n_jobs))
+
+    return matrix
+
+
+def count_indexed(input_file: str,
+                  records: List[IndexRecord],
+                  width: int,
+                  columns: Optional[np.ndarray] = None,
+                  n_jobs: int = 1) -> np.ndarray:
+    """Count the occurrences of each symbol in each position of the given
+    records of an indexed fasta file, using several worker processes.
+
+    Each worker seeks directly to the records of its blocks and counts
+    them without keeping them in memory, so that memory usage only
+    depends on the alignment width.
+
+    Args:
+        input_file: input fasta file
+        records: IndexRecord of each sequence to count
+        width: number of positions of the multialignment
+        columns: indexes of the columns to count [default: all columns]
+        n_jobs: number of worker processes [default: 1]
+
+    Returns:
+        counts: (positions x N_CODES) matrix of symbol counts
+    """
+    if n_jobs <= 1 or not records:
+        return _count_records(input_file, records, width, columns)
+
+    n_pos = width if columns is None else len(columns)
+    counts = np.zeros((n_pos, N_CODES), dtype=np.int64)
+    with multiprocessing.Pool(n_jobs, initializer=_attach,
+                              initargs=(input_file, records, None, width,
+                                        columns)) as pool:
+        for block in pool.imap_unordered(_count_block,
+                                         _bounds(len(records), n_jobs)):
+            counts += block
+
+    return counts
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from typing import BinaryIO, Iterator, Tuple
+
+from allfreqs.compression import open_input
+
+PARSERS = ("native", "skbio")
+
+# Bytes removed from sequence lines
+_WHITESPACE = b" \t\r\n\v\f"
+
+
+def parse_header(header: bytes) -> str:
+    """Extract the sequence id from a fasta header line.
+
+    The id is the text following ">" up to the first whitespace, or an
+    empty string if the header starts with whitespace, as in scikit-bio.
+
+    Args:
+        header: header line, with or without the leading ">"
+
+    Returns:
+        seq_id: sequence id
+    """
+    if header.startswith(b">"):
+        header = header[1:]
+    header = header.rstrip()
+    if not header or header[:1].isspace():
+        return ""
+    return header.split(None, 1)[0].decode("utf-8", errors="replace")
+
+
+def _parse_record(record: bytes) -> Tuple[str, bytes]:
+    """Split a single fasta record (starting from its header) into its id
+    and sequence."""
+    header, _, body = record.partition(b"\n")
+    seq = body.translate(None, _WHITESPACE)
+    if not seq:
+        raise ValueError("Found header without sequence data: {}".format(
+            header.decode("utf-8", errors="replace").strip()))
+
+    return parse_header(header), seq.upper()
+
+
+def iter_fasta(handle: BinaryIO,
+               block_size: int = 2 ** 20) -> Iterator[Tuple[str, bytes]]:
+    """Read fasta records from a binary file object.
+
+    The file is read in blocks of `block_size` bytes, which are split into
+    records using bytes operations instead of processing one line at a
+    time. Sequences can span multiple lines, whitespace within sequences
+    is removed and lowercase symbols are converted to uppercase.
+
+    Args:
+        handle: binary file object
+        block_size: number of bytes read at a time [default: 1 MiB]
+
+    Returns:
+        records: iterator of (sequence id, sequence) tuples
+    """
+    chunks = []
+    first = True
+    while True:
+        block = handle.read(block_size)
+        if not block:
+            break
+        if first:
+            block = block.lstrip()
+            if not block:
+                continue
+            if not block.startswith(b">"):
+                raise ValueError("Found non-header line when attempting to "
+                                 "read the first fasta record.")
+            first = False
+        cut = block.rfind(b"\n>")
+        if cut < 0:
+            chunks.append(block)
+            continue
+        chunks.append(block[:cut])
+        for record in b"".join(chunks).split(b"\n>"):
+            yield _parse_record(record)
+        chunks = [block[cut + 1:]]
+
+    data = b"".join(chunks)
+    if data.strip():
+        for record in data.split(b"\n>"):
+            yield _parse_record(record)
+
+
+def read_fasta(input_file: str,
+               parser: str = "native") -> Iterator[Tuple[str, str]]:
+    """Read sequences from a fasta file.
+
+    The native parser is used by default; scikit-bio (if installed) can be
+    used instead, which also validates sequences against the IUPAC DNA
+    alphabet, but is considerably slower. Files compressed with gzip,
+    bgzip or xz are decompressed while being read.
+
+    Args:
+        input_file: input fasta file
+        parser: either "native" or "skbio" [default: "native"]
+
+    Returns:
+        records: iterator of (sequence id, sequence) tuples
+    """
+    if parser not in PARSERS:
+        raise ValueError("Parser {} not recognised. Please use one of {}."
+                         .format(parser, ", ".join(PARSERS)))
+    if parser == "skbio":
+        import skbio.io
+        from skbio import DNA
+
+        with open_input(input_file) as f:
+            for seq in skbio.io.read(f, format="fasta", constructor=DNA):
+                yield seq.metadata.get("id"), str(seq)
+        return
+
+    with open_input(input_file) as f:
+        for seq_id, seq in iter_fasta(f):
+            yield seq_id, seq.decode("latin-1")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from typing import Optional
+
+import numpy as np
+
+from allfreqs.constants import SYMBOLS
+from allfreqs.counting import (
+    BLOCK_CELLS, N_CODES, OTHER, SYMBOL_CODES
+)
+
+# Code used to pad sequences, as done with gaps in MultiAlignment.matrix
+GAP_CODE = SYMBOLS.index("-")
+
+# Packed byte holding two gaps
+GAP_BYTE = GAP_CODE << 4 | GAP_CODE
+
+# ASCII byte of each symbol code
+SYMBOL_BYTES = np.frombuffer(SYMBOLS.encode("ascii"), dtype=np.uint8)
+
+
+def _codes(matrix: np.ndarray) -> np.ndarray:
+    """Convert ASCII bytes to symbol codes, making sure they all fit in
+    4 bits."""
+    codes = SYMBOL_CODES[matrix]
+    if (codes == OTHER).any():
+        invalid = np.unique(matrix[codes == OTHER]).tobytes()
+        raise ValueError("Symbols {} cannot be packed. Please make sure "
+                         "sequences only contain IUPAC nucleotides and "
+                         "gaps.".format(invalid.decode("latin-1")))
+    return codes
+
+
+def pack(matrix: np.ndarray) -> np.ndarray:
+    """Pack a matrix of ASCII bytes, storing two symbols per byte.
+
+    Each symbol is replaced by its 4-bit index in SYMBOLS, with the even
+    columns in the high nibble and the odd ones in the low nibble; if the
+    number of columns is odd, the last low nibble holds a gap.
+
+    Args:
+        matrix: (sequences x positions) matrix of ASCII bytes, or a single
+            sequence as a 1-dimensional array
+
+    Returns:
+        packed: (sequences x ceil(positions / 2)) matrix of packed bytes
+    """
+    n_pos = matrix.shape[-1]
+    packed = np.empty(matrix.shape[:-1] + ((n_pos + 1) // 2,),
+                      dtype=np.uint8)
+    rows = packed.reshape(-1, packed.shape[-1])
+    matrix = matrix.reshape(-1, n_pos)
+    step = max(1, BLOCK_CELLS // max(n_pos, 1))
+    for start in range(0, len(rows), step):
+        codes = _codes(matrix[start:start + step])
+        high = codes[:, 0::2] << 4
+        rows[start:start + step] = high
+        rows[start:start + step, :n_pos // 2] |= codes[:, 1::2]
+        if n_pos % 2:
+            rows[start:start + step, -1] |= GAP_CODE
+
+    return packed
+
+
+def pack_sequence(seq: str) -> np.ndarray:
+    """Pack a single sequence, storing two symbols per byte.
+
+    Args:
+        seq: aligned sequence
+
+    Returns:
+        packed: 1-dimensional array of packed bytes
+    """
+    return pack(np.frombuffer(seq.encode("ascii", errors="replace"),
+                              dtype=np.uint8))
+
+
+def unpack(packed: np.ndarray, width: int) -> np.ndarray:
+    """Convert packed bytes back to a matrix of ASCII bytes.
+
+    Args:
+        packed: (sequences x ceil(width / 2)) matrix of packed bytes
+        width: number of positions of the unpacked matrix
+
+    Returns:
+        matrix: (sequences x width) matrix of ASCII bytes
+    """
+    codes = np.empty(packed.shape[:-1] + (packed.shape[-1] * 2,),
+                     dtype=np.uint8)
+    codes[..., 0::2] = packed >> 4
+    codes[..., 1::2] = packed & 0x0f
+
+    return SYMBOL_BYTES[codes[..., :width]]
+
+
+def count_packed(packed: np.ndarray,
+                 width: int,
+                 columns: Optional[np.ndarray] = None) -> np.ndarray:
+    """Count the occurrences of each symbol in each position of a packed
+    multialignment, without unpacking it.
+
+    Each packed byte holds the pair of symbols of two adjacent positions,
+    so the 256 possible bytes are counted for each column of the packed
+    matrix with a single bincount (one block of rows at a time), and the
+    counts of each position are then obtained by summing over the other
+    symbol of the pair. If `columns` are provided, only the packed bytes
+    holding them are counted.
+
+    Args:
+        packed: (sequences x ceil(width / 2)) matrix of packed bytes
+        width: number of positions of the multialignment
+        columns: indexes of the columns to count [default: all columns]
+
+    Returns:
+        counts: (positions x N_CODES) matrix of symbol counts, identical
+            to the one returned by count_alleles() on the unpacked matrix
+    """
+    n_seqs = packed.shape[0]
+    byte_columns = None if columns is None else np.unique(columns // 2)
+    n_bytes = packed.shape[1] if columns is None else len(byte_columns)
+    offsets = np.arange(n_bytes, dtype=np.intp) * 256
+    pairs = np.zeros(n_bytes * 256, dtype=np.int64)
+    step = max(1, BLOCK_CELLS // max(n_bytes, 1))
+    for start in range(0, n_seqs, step):
+        block = packed[start:start + step]
+        if byte_columns is not None:
+            block = block[:, byte_columns]
+        pairs += np.bincount((block + offsets).ravel(),
+                             minlength=n_bytes * 256)
+    pairs = pairs.reshape(n_bytes, 16, 16)
+
+    counts = np.zeros((n_bytes * 2, N_CODES), dtype=np.int64)
+    counts[0::2, :16] = pairs.sum(axis=2)
+    counts[1::2, :16] = pairs.sum(axis=1)
+    if columns is None:
+        return counts[:width]
+
+    rows = np.searchsorted(byte_columns, columns // 2) * 2 + columns % 2
+
+    return counts[rows]
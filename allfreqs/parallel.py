@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import ctypes
+import multiprocessing
+from typing import Any, Optional, Tuple
+import weakref
+
+import numpy as np
+
+from allfreqs.counting import count_alleles
+
+# Shared matrix attached by each worker process
+_shared = {}
+
+# Buffers created by shared_matrix(), by id
+_buffers = weakref.WeakValueDictionary()
+
+
+def shared_matrix(shape: Tuple[int, int]) -> Tuple[Any, np.ndarray]:
+    """Create a matrix of bytes in memory shared with worker processes.
+
+    The memory is a multiprocessing.RawArray, which is kept alive as long
+    as the matrix (or any view of it) is referenced.
+
+    Args:
+        shape: shape of the matrix
+
+    Returns:
+        buffer: RawArray to pass to worker processes, which can view it
+            as a matrix with attach_matrix()
+        matrix: uninitialised matrix of uint8 backed by the buffer
+    """
+    buffer = multiprocessing.RawArray("B", max(1, shape[0] * shape[1]))
+    _buffers[id(buffer)] = buffer
+
+    return buffer, attach_matrix(buffer, shape)
+
+
+def shared_buffer(matrix: np.ndarray) -> Optional[Any]:
+    """Return the RawArray backing a matrix created by shared_matrix(),
+    or None if the matrix is not a whole, contiguous view of one.
+
+    Args:
+        matrix: (sequences x positions) matrix of uint8
+    """
+    base = matrix
+    while isinstance(base, np.ndarray):
+        base = base.base
+    if base is None or _buffers.get(id(base)) is not base:
+        return None
+    if matrix.dtype != np.uint8 or not matrix.flags.c_contiguous or \
+            matrix.ctypes.data != ctypes.addressof(base):
+        return None
+    return base
+
+
+def attach_matrix(buffer: Any, shape: Tuple[int, int]) -> np.ndarray:
+    """View the buffer of a shared_matrix() as a matrix of uint8.
+
+    Args:
+        buffer: RawArray backing the shared matrix
+        shape: shape of the matrix
+    """
+    return np.frombuffer(buffer, dtype=np.uint8,
+                         count=shape[0] * shape[1]).reshape(shape)
+
+
+def _attach(buffer: Any,
+            shape: Tuple[int, int],
+            weights: Optional[np.ndarray] = None):
+    """Attach the shared alignment matrix in a worker process.
+
+    Args:
+        buffer: RawArray holding the alignment matrix
+        shape: shape of the alignment matrix
+        weights: integer weight of each row of the matrix, or None
+    """
+    _shared["matrix"] = attach_matrix(buffer, shape)
+    _shared["weights"] = weights
+
+
+def _count_block(bounds: Tuple[int, int]) -> np.ndarray:
+    """Count alleles in a block of positions of the shared matrix.
+
+    Args:
+        bounds: first and last (excluded) position of the block
+
+    Returns:
+        counts: (positions x N_CODES) matrix of symbol counts
+    """
+    start, stop = bounds
+    return count_alleles(_shared["matrix"][:, start:stop],
+                         weights=_shared["weights"])
+
+
+def count_alleles_parallel(matrix: np.ndarray,
+                           n_jobs: int,
+                           weights: Optional[np.ndarray] = None
+                           ) -> np.ndarray:
+    """Count the occurrences of each symbol in each position of a
+    multialignment, using several worker processes.
+
+    Positions are split in blocks which are counted independently by the
+    workers. The alignment matrix is copied once to shared memory (unless
+    it was created there by shared_matrix(), e.g. by read_indexed()),
+    where each worker can read it without pickling.
+
+    Args:
+        matrix: (sequences x positions) matrix of ASCII bytes
+        n_jobs: number of worker processes
+        weights: integer weight of each row [default: 1 for each row]
+
+    Returns:
+        counts: (positions x N_CODES) matrix of symbol counts, identical
+            to the one returned by count_alleles()
+    """
+    n_pos = matrix.shape[1]
+    if n_jobs <= 1 or matrix.size == 0:
+        return count_alleles(matrix, weights=weights)
+
+    n_blocks = min(n_pos, n_jobs * 4)
+    bounds = np.linspace(0, n_pos, n_blocks + 1).astype(int).tolist()
+    buffer = shared_buffer(matrix)
+    if buffer is None:
+        buffer, shared = shared_matrix(matrix.shape)
+        shared[:] = matrix
+    with multiprocessing.Pool(n_jobs, initializer=_attach,
+                              initargs=(buffer, matrix.shape,
+                                        weights)) as pool:
+        blocks = pool.map(_count_block, list(zip(bounds[:-1], bounds[1:])))
+
+    return np.concatenate(blocks)
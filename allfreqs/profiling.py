@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from contextlib import contextmanager
+import time
+import tracemalloc
+from typing import Callable, ContextManager, List, NamedTuple, Optional
+
+import pandas as pd
+
+
+class _NoProfiling:
+    """Reusable no-op context, used when profiling is disabled
+    (contextlib.nullcontext is not available on Python 3.6)."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_DISABLED = _NoProfiling()
+
+
+class StageRecord(NamedTuple):
+    """Resources used by a single stage of the calculation."""
+    stage: str
+    wall_time: float
+    cpu_time: float
+    peak_memory: Optional[int]
+
+
+class Profiler:
+    """Class used to record wall time, CPU time and peak memory of each
+    stage of an allele frequency calculation.
+
+    Peak memory is the largest amount of memory allocated during each
+    stage (as traced by tracemalloc), and is only recorded if `memory` is
+    True, since tracing allocations slows down execution. If `callback`
+    is provided, it is called with the StageRecord of each stage as soon
+    as it ends, for example to send it to a metrics system.
+    """
+
+    def __init__(self,
+                 memory: bool = True,
+                 callback: Optional[Callable[[StageRecord], None]] = None):
+        self.memory = memory
+        self.callback = callback
+        self.records: List[StageRecord] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """Record the resources used by the code run in this context.
+
+        Args:
+            name: name of the stage
+        """
+        if self.memory:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            else:
+                # Python < 3.9 can only reset the peak with the traces
+                tracemalloc.clear_traces()
+            base = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            peak = None
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                if started:
+                    tracemalloc.stop()
+            record = StageRecord(name, wall, cpu, peak)
+            self.records.append(record)
+            if self.callback is not None:
+                self.callback(record)
+
+    def report(self) -> pd.DataFrame:
+        """Return the recorded stages as a dataframe, with one row per
+        stage and the wall_time, cpu_time (in seconds) and peak_memory (in
+        bytes) columns."""
+        return pd.DataFrame(self.records, columns=StageRecord._fields)
+
+    def format(self) -> str:
+        """Return the recorded stages as a human-readable table."""
+        lines = ["{:<14}{:>12}{:>12}{:>18}".format(
+            "stage", "wall (s)", "cpu (s)", "peak memory (MB)")]
+        for record in self.records:
+            memory = "-" if record.peak_memory is None \
+                else "{:.1f}".format(record.peak_memory / 2 ** 20)
+            lines.append("{:<14}{:>12.3f}{:>12.3f}{:>18}".format(
+                record.stage, record.wall_time, record.cpu_time, memory))
+        lines.append("{:<14}{:>12.3f}{:>12.3f}".format(
+            "total", sum(r.wall_time for r in self.records),
+            sum(r.cpu_time for r in self.records)))
+
+        return "\n".join(lines)
+
+
+def profile_stage(profiler: Optional[Profiler],
+                  name: str) -> ContextManager:
+    """Return the context recording the given stage, or a reusable no-op
+    context if profiling is disabled.
+
+    Args:
+        profiler: Profiler used to record the stage, or None
+        name: name of the stage
+    """
+    if profiler is None:
+        return _DISABLED
+    return profiler.stage(name)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import re
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from allfreqs.classes import Reference
+
+Region = Union[str, int, Tuple[int, int]]
+
+_REGION = re.compile(r"^(\d+)(?:\.(\d+))?(?:-(\d+)(?:\.(\d+))?)?$")
+
+
+class RegionError(ValueError):
+    """Raised when a region is not recognised or not found in the
+    reference."""
+
+
+def read_bed(bed_file: str) -> List[Tuple[int, int]]:
+    """Read regions from a BED file.
+
+    Only the start and end columns are used, since the multialignment
+    refers to a single reference sequence; header lines (track, browser
+    and comments) are skipped. BED coordinates are 0-based and half-open,
+    so they are converted to 1-based inclusive reference positions; empty
+    intervals (start equal to end) are skipped. BED intervals never wrap
+    around the end of the reference, so their start cannot follow their
+    end.
+
+    Args:
+        bed_file: input BED file
+
+    Returns:
+        regions: list of (start, end) reference positions
+    """
+    regions = []
+    with open(bed_file) as f:
+        for line in f:
+            if not line.strip() or \
+                    line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.split()
+            if len(fields) < 3:
+                raise RegionError("Please make sure the BED file contains "
+                                  "at least three columns.")
+            try:
+                start, end = int(fields[1]), int(fields[2])
+            except ValueError:
+                raise RegionError("BED interval {} not recognised. Please "
+                                  "use integer start and end columns."
+                                  .format(line.strip())) from None
+            if start < 0 or start > end:
+                raise RegionError("BED interval {} not valid. Please make "
+                                  "sure that 0 <= start <= end."
+                                  .format(line.strip()))
+            if start < end:
+                regions.append((start + 1, end))
+
+    return regions
+
+
+def _expand(regions: Iterable[Region]) -> List[Region]:
+    """Split comma-separated region strings and read BED files."""
+    if isinstance(regions, (str, int)):
+        regions = [regions]
+    expanded = []
+    for region in regions:
+        if isinstance(region, str) and region.lower().endswith(".bed"):
+            expanded.extend(read_bed(region))
+        elif isinstance(region, str):
+            expanded.extend(r.strip() for r in region.split(",")
+                            if r.strip())
+        else:
+            expanded.append(region)
+
+    return expanded
+
+
+def _bounds(reference: Reference,
+            region: Region) -> Tuple[int, int, bool]:
+    """Convert a single region to the first and last (excluded) column of
+    the multialignment, and whether it wraps around the end of the
+    reference."""
+    if isinstance(region, tuple):
+        start, start_ins, end, end_ins = region[0], 0, region[1], None
+    elif isinstance(region, (int, np.integer)):
+        start, start_ins, end, end_ins = region, 0, region, 0
+    else:
+        match = _REGION.match(region)
+        if match is None:
+            raise RegionError("Region {} not recognised. Please use either "
+                              "a position (e.g. 73 or 310.1) or a range "
+                              "(e.g. 16024-576).".format(region))
+        start, start_ins, end, end_ins = match.groups()
+        start, start_ins = int(start), int(start_ins or 0)
+        if end is None:
+            end, end_ins = start, start_ins
+        else:
+            end, end_ins = int(end), end_ins and int(end_ins)
+
+    if (start, start_ins) == (end, end_ins):
+        # single positions must exist in the reference
+        try:
+            col = reference.locate(start, start_ins)
+        except ValueError as e:
+            raise RegionError(str(e)) from None
+        return col, col + 1, False
+
+    position = reference.positions["position"]
+    insertion = reference.positions["insertion"]
+
+    def column(pos, ins, side):
+        left = int(np.searchsorted(position, pos, side="left"))
+        right = int(np.searchsorted(position, pos, side="right"))
+        if ins is None:
+            return right
+        return left + int(np.searchsorted(insertion[left:right], ins,
+                                          side=side))
+
+    first = column(start, start_ins, "left")
+    last = column(end, end_ins, "right")
+    wraps = (start, start_ins) > (end, np.inf if end_ins is None else end_ins)
+
+    return first, last, wraps
+
+
+def select_columns(reference: Reference,
+                   regions: Optional[Iterable[Region]] = None,
+                   exclude: Optional[Iterable[Region]] = None
+                   ) -> Optional[np.ndarray]:
+    """Find the columns of the multialignment included in the given
+    regions and not in the excluded ones.
+
+    Each region can be a single reference position, either numeric (73)
+    or with an insertion offset ("310.1"), a range of positions including
+    the insertions after its end ("16024-576", which wraps around the end
+    of the circular reference, or a (start, end) tuple), a string with
+    several comma-separated regions, or a BED file.
+
+    Args:
+        reference: reference of the multialignment
+        regions: regions to select [default: all positions]
+        exclude: regions to exclude [default: None]
+
+    Returns:
+        columns: sorted indexes of the selected columns, or None if
+            neither regions nor exclude are provided
+    """
+    if regions is None and exclude is None:
+        return None
+
+    n_cols = len(reference)
+    mask = np.zeros(n_cols, dtype=bool) if regions is not None \
+        else np.ones(n_cols, dtype=bool)
+    for value, items in ((True, regions), (False, exclude)):
+        for region in _expand(items if items is not None else []):
+            first, last, wraps = _bounds(reference, region)
+            if wraps:
+                mask[first:] = value
+                mask[:last] = value
+            else:
+                mask[first:last] = value
+
+    columns = np.flatnonzero(mask)
+    if not len(columns):
+        raise RegionError("None of the reference positions is included "
+                          "in the given regions.")
+
+    return columns
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import io
+import json
+from socketserver import ThreadingMixIn
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from allfreqs.allfreqs import AlleleFreqs
+from allfreqs.classes import AlleleCounts
+from allfreqs.counting import frequency_matrix
+from allfreqs.writer import write_frequencies
+
+# Output formats of frequency queries
+FORMATS = ("json", "csv", "tsv")
+
+_TRUE = ("1", "true", "yes")
+
+
+def _split(value: Any) -> Optional[List[str]]:
+    """Convert a query parameter to a list of strings, splitting
+    comma-separated values."""
+    if value is None:
+        return None
+    if isinstance(value, (str, int)):
+        value = [value]
+    return [item.strip() for part in value for item in str(part).split(",")
+            if item.strip()]
+
+
+class AlignmentNotFoundError(KeyError):
+    """Raised when a query refers to a multialignment which is not
+    loaded."""
+
+
+class FrequencyService:
+    """Class used to answer allele frequency queries on multialignments
+    loaded once and kept in memory.
+
+    Input is a dictionary of the form {"name": AlleleFreqs}. Allele counts
+    of each multialignment are calculated when the service is created, so
+    that queries on all sequences only select the requested positions,
+    while queries on a subset of sequences count them from the stored
+    multialignment, whatever its storage. Queries only read shared data,
+    so they can be answered concurrently by several threads.
+    """
+
+    def __init__(self, alignments: Dict[str, AlleleFreqs]):
+        self.alignments = dict(alignments)
+        for af in self.alignments.values():
+            # build the cached data shared by queries before serving them
+            af.counts
+            af.reference.indexes
+            if af.multialg is not None and len(af.multialg):
+                af.subset_counts(af.multialg.ids[:1])
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Name, number of sequences, number of positions and storage of
+        each multialignment."""
+        return [{"name": name, "n_seqs": af.n_seqs,
+                 "n_positions": len(af.counted_reference),
+                 "storage": type(af.multialg).__name__
+                 if af.multialg is not None else None}
+                for name, af in self.alignments.items()]
+
+    def query(self,
+              alignment: str,
+              regions: Optional[List[str]] = None,
+              exclude: Optional[List[str]] = None,
+              ids: Optional[List[str]] = None) -> AlleleCounts:
+        """Count alleles of a multialignment, restricted to the given
+        positions and/or sequences.
+
+        Args:
+            alignment: name of the multialignment
+            regions: regions of the reference to restrict counts to, as
+                positions or ranges [default: all positions]
+            exclude: regions of the reference to leave out [default: None]
+            ids: ids of the sequences to count [default: all sequences]
+
+        Returns:
+            counts: allele counts of the selected sequences and positions
+        """
+        if alignment not in self.alignments:
+            raise AlignmentNotFoundError("Alignment {} not found."
+                                         .format(alignment))
+        for value in (regions or []) + (exclude or []):
+            if value.lower().endswith(".bed"):
+                # queries must not read files from the server
+                raise ValueError("BED files cannot be used in queries.")
+        if ids is not None and not ids:
+            raise ValueError("Please provide at least one sequence id.")
+
+        return self.alignments[alignment].subset_counts(ids, regions,
+                                                        exclude)
+
+    def frequencies(self,
+                    params: Dict[str, Any]) -> Tuple[str, str]:
+        """Answer a frequency query.
+
+        Args:
+            params: query parameters, i.e. alignment (required unless a
+                single multialignment is loaded), regions, exclude, ids,
+                ambiguous, format and precision
+
+        Returns:
+            content_type: MIME type of the response
+            body: allele frequencies, as JSON or delimited text
+        """
+        alignment = params.get("alignment")
+        if alignment is None:
+            if len(self.alignments) != 1:
+                raise ValueError("Please provide the alignment to query.")
+            alignment = next(iter(self.alignments))
+        ambiguous = str(params.get("ambiguous", "")).lower() in _TRUE
+        output_format = params.get("format", "json")
+        if output_format not in FORMATS:
+            raise ValueError("Format {} not recognised. Please use one of "
+                             "{}.".format(output_format, ", ".join(FORMATS)))
+        precision = params.get("precision")
+        precision = int(precision) if precision is not None else None
+        counts = self.query(alignment, _split(params.get("regions")),
+                            _split(params.get("exclude")),
+                            _split(params.get("ids")))
+
+        if output_format != "json":
+            text = io.StringIO()
+            write_frequencies(counts, text, ambiguous,
+                              sep="," if output_format == "csv" else "\t",
+                              precision=precision)
+            return "text/{}".format(output_format), text.getvalue()
+
+        freqs, columns = frequency_matrix(counts.counts, counts.n_seqs,
+                                          ambiguous)
+        table = {"position": counts.reference.indexes}
+        for n, column in enumerate(columns):
+            values = freqs[:, n]
+            if precision is not None:
+                values = values.round(precision)
+            table[column] = values.tolist()
+
+        return "application/json", json.dumps({
+            "alignment": alignment, "n_seqs": counts.n_seqs,
+            "ambiguous": ambiguous, "frequencies": table
+        })
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler of the frequency server.
+
+    GET /alignments lists the loaded multialignments, while frequencies
+    are queried with GET /frequencies (with parameters in the query
+    string) or POST /frequencies (with a JSON object as body, useful for
+    long lists of ids).
+    """
+
+    server_version = "allfreqs"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/alignments":
+            self._send(HTTPStatus.OK, "application/json",
+                       json.dumps(self.server.service.describe()))
+        elif url.path == "/frequencies":
+            params = {key: values if key in ("regions", "exclude", "ids")
+                      else values[-1]
+                      for key, values in parse_qs(url.query).items()}
+            self._frequencies(params)
+        else:
+            self._error(HTTPStatus.NOT_FOUND, "Path not found.")
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/frequencies":
+            self._error(HTTPStatus.NOT_FOUND, "Path not found.")
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self._error(HTTPStatus.LENGTH_REQUIRED,
+                        "Please provide the Content-Length of the body.")
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._error(HTTPStatus.BAD_REQUEST,
+                        "Content-Length {} not valid.".format(
+                            self.headers.get("Content-Length")))
+            return
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            params = None
+        if not isinstance(params, dict):
+            self._error(HTTPStatus.BAD_REQUEST,
+                        "Please provide a JSON object as body.")
+            return
+        self._frequencies(params)
+
+    def _frequencies(self, params: Dict[str, Any]):
+        try:
+            content_type, body = self.server.service.frequencies(params)
+        except AlignmentNotFoundError as e:
+            self._error(HTTPStatus.NOT_FOUND, e.args[0])
+        except ValueError as e:
+            self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except Exception:
+            traceback.print_exc()
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR,
+                        "Query failed because of an internal error.")
+        else:
+            self._send(HTTPStatus.OK, content_type, body)
+
+    def _error(self, status: HTTPStatus, message: str):
+        self._send(status, "application/json",
+                   json.dumps({"error": message}))
+
+    def _send(self, status: HTTPStatus, content_type: str, body: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type",
+                         "{}; charset=utf-8".format(content_type))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """HTTP server using a thread for each request, as
+    http.server.ThreadingHTTPServer (only available from Python 3.7)."""
+
+    daemon_threads = True
+
+
+def create_server(service: FrequencyService,
+                  host: str = "127.0.0.1",
+                  port: int = 8000,
+                  verbose: bool = False) -> HTTPServer:
+    """Create an HTTP server answering queries with the given service,
+    using a thread for each request.
+
+    Args:
+        service: service with the loaded multialignments
+        host: address to listen on [default: "127.0.0.1"]
+        port: port to listen on, or 0 for any free port [default: 8000]
+        verbose: log each request to stderr [default: False]
+
+    Returns:
+        server: server ready to `serve_forever()`
+    """
+    server = _Server((host, port), _Handler)
+    server.service = service
+    server.verbose = verbose
+
+    return server
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from allfreqs.counting import N_CODES, SYMBOL_CODES
+
+
+def diff_rows(matrix: np.ndarray,
+              reference: np.ndarray) -> Tuple[np.ndarray, np.ndarray,
+                                              np.ndarray]:
+    """Find the differences of each row of a matrix from the reference.
+
+    Differences are returned in compressed sparse row (CSR) format: the
+    differences of row `i` are stored from `indptr[i]` to
+    `indptr[i + 1]` (excluded) of `indices` and `symbols`.
+
+    Args:
+        matrix: (sequences x positions) matrix of ASCII bytes
+        reference: reference sequence as an array of ASCII bytes
+
+    Returns:
+        indptr: (sequences + 1) offsets of the differences of each row
+        indices: column of each difference
+        symbols: ASCII byte of each difference
+    """
+    rows, indices = np.nonzero(matrix != reference)
+    indptr = np.zeros(len(matrix) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(matrix)), out=indptr[1:])
+
+    return indptr, indices.astype(np.int32), matrix[rows, indices]
+
+
+def stack_rows(blocks: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+               ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Concatenate the differences of consecutive blocks of rows, as
+    returned by diff_rows().
+
+    Args:
+        blocks: list of (indptr, indices, symbols) tuples
+
+    Returns:
+        indptr: (sequences + 1) offsets of the differences of each row
+        indices: column of each difference
+        symbols: ASCII byte of each difference
+    """
+    indptrs = [np.zeros(1, dtype=np.int64)]
+    for indptr, _, _ in blocks:
+        indptrs.append(indptr[1:] + indptrs[-1][-1])
+    indices = np.concatenate([np.empty(0, dtype=np.int32),
+                              *(block[1] for block in blocks)])
+    symbols = np.concatenate([np.empty(0, dtype=np.uint8),
+                              *(block[2] for block in blocks)])
+
+    return np.concatenate(indptrs), indices, symbols
+
+
+def select_rows(indptr: np.ndarray,
+                indices: np.ndarray,
+                symbols: np.ndarray,
+                rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray,
+                                           np.ndarray]:
+    """Select the differences of some rows, as returned by diff_rows().
+
+    Args:
+        indptr: (sequences + 1) offsets of the differences of each row
+        indices: column of each difference
+        symbols: ASCII byte of each difference
+        rows: indexes of the rows to select
+
+    Returns:
+        indptr: (rows + 1) offsets of the differences of each row
+        indices: column of each difference
+        symbols: ASCII byte of each difference
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    selected = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=selected[1:])
+    cells = np.repeat(starts - selected[:-1], lengths) + \
+        np.arange(selected[-1])
+
+    return selected, indices[cells], symbols[cells]
+
+
+def densify(indptr: np.ndarray,
+            indices: np.ndarray,
+            symbols: np.ndarray,
+            reference: np.ndarray) -> np.ndarray:
+    """Rebuild the (sequences x positions) matrix of ASCII bytes from the
+    differences returned by diff_rows().
+
+    Args:
+        indptr: (sequences + 1) offsets of the differences of each row
+        indices: column of each difference
+        symbols: ASCII byte of each difference
+        reference: reference sequence as an array of ASCII bytes
+
+    Returns:
+        matrix: (sequences x positions) matrix of ASCII bytes
+    """
+    matrix = np.tile(reference, (len(indptr) - 1, 1))
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    matrix[rows, indices] = symbols
+
+    return matrix
+
+
+def count_sparse(indptr: np.ndarray,
+                 indices: np.ndarray,
+                 symbols: np.ndarray,
+                 reference: np.ndarray,
+                 columns: Optional[np.ndarray] = None) -> np.ndarray:
+    """Count the occurrences of each symbol in each position of a
+    multialignment stored as differences from the reference.
+
+    Every sequence is first counted as the reference symbol, and then
+    each difference moves one count from the reference symbol to the
+    symbol of the difference, so that time and memory only depend on the
+    number of differences and positions.
+
+    Args:
+        indptr: (sequences + 1) offsets of the differences of each row
+        indices: column of each difference
+        symbols: ASCII byte of each difference
+        reference: reference sequence as an array of ASCII bytes
+        columns: indexes of the columns to count [default: all columns]
+
+    Returns:
+        counts: (positions x N_CODES) matrix of symbol counts, identical
+            to the one returned by count_alleles() on the dense matrix
+    """
+    n_pos = len(reference)
+    ref_codes = SYMBOL_CODES[reference].astype(np.intp)
+    offsets = np.arange(n_pos, dtype=np.intp) * N_CODES
+    counts = np.zeros(n_pos * N_CODES, dtype=np.int64)
+    counts[offsets + ref_codes] = len(indptr) - 1
+    cells = indices.astype(np.intp) * N_CODES
+    counts -= np.bincount(cells + ref_codes[indices],
+                          minlength=n_pos * N_CODES)
+    counts += np.bincount(cells + SYMBOL_CODES[symbols],
+                          minlength=n_pos * N_CODES)
+    counts = counts.reshape(n_pos, N_CODES)
+    if columns is not None:
+        counts = counts[columns]
+
+    return counts
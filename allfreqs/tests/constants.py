@@ -8,6 +8,10 @@ import pandas as pd
 
 DATADIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
 TEST_CSV = os.path.join(DATADIR, "test.csv")
+TEST_AFM = os.path.join(DATADIR, "test.afm")
+TEST_PARQUET = os.path.join(DATADIR, "test.parquet")
+TEST_FEATHER = os.path.join(DATADIR, "test.feather")
+TEST_HDF = os.path.join(DATADIR, "test.h5")
 
 SAMPLE_MULTIALG_FASTA = os.path.join(DATADIR, "sample_multialg.fasta")
 SAMPLE_MULTIALG_NOREF_FASTA = os.path.join(DATADIR,
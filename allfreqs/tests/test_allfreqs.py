@@ -1,13 +1,23 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Created by Roberto Preste
+import gzip
+import importlib.util
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
 import pandas as pd
 import pandas.testing as pdtest
 
 from allfreqs import AlleleFreqs
-from allfreqs.classes import Reference, MultiAlignment
+from allfreqs.classes import (
+    HaplotypeAlignment, MultiAlignment, PackedAlignment, Reference,
+    SparseAlignment
+)
+from allfreqs.profiling import Profiler
 from allfreqs.tests.constants import (
     REAL_ALG_X_FASTA, REAL_ALG_X_NOREF_FASTA, REAL_RSRS_FASTA,
     REAL_ALG_L6_FASTA, REAL_ALG_L6_NOREF_FASTA,
@@ -16,9 +26,14 @@ from allfreqs.tests.constants import (
     sample_sequences_df, SAMPLE_SEQUENCES_DICT, sample_sequences_freqs,
     sample_sequences_freqs_amb, SAMPLE_FREQUENCIES,
     SAMPLE_FREQUENCIES_AMB, REAL_ALG_X_DF, REAL_X_FREQUENCIES, REAL_ALG_L6_DF,
-    REAL_L6_FREQUENCIES, TEST_CSV
+    REAL_L6_FREQUENCIES, TEST_CSV, TEST_AFM, TEST_PARQUET, TEST_FEATHER,
+    TEST_HDF
 )
 
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+HAS_TABLES = importlib.util.find_spec("tables") is not None
+HAS_SKBIO = importlib.util.find_spec("skbio") is not None
+
 
 class TestBasic(unittest.TestCase):
 
@@ -50,19 +65,6 @@ class TestBasic(unittest.TestCase):
         # Then
         pdtest.assert_frame_equal(self.af_amb.frequencies, exp_freqs)
 
-    def test__get_frequencies(self):
-        # Given
-        test_freq = pd.Series({'A': 0.2, 'C': 0.2, 'G': 0.1, 'T': 0.3,
-                               '-': 0.1, 'N': 0.1})
-        exp_freq = {'A': 0.2, 'C': 0.2, 'G': 0.1, 'T': 0.3, 'gap': 0.1,
-                    'oth': 0.1}
-
-        # When
-        result = self.af._get_frequencies(test_freq)
-
-        # Then
-        self._dict_almost_equal(result, exp_freq)
-
     def test_to_csv(self):
         # Given/When
         self.af.to_csv(TEST_CSV)
@@ -72,6 +74,14 @@ class TestBasic(unittest.TestCase):
         # Then
         pdtest.assert_frame_equal(result, expected)
 
+    def test_from_counts(self):
+        # Given/When
+        af = AlleleFreqs.from_counts(self.af.counts)
+
+        # Then
+        self.assertEqual(5, af.n_seqs)
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+
     def test_to_csv_ambiguous(self):
         # Given/When
         self.af_amb.to_csv(TEST_CSV)
@@ -81,26 +91,582 @@ class TestBasic(unittest.TestCase):
         # Then
         pdtest.assert_frame_equal(result, expected)
 
-    @staticmethod
-    def _dict_almost_equal(expected: dict, result: dict, acc=10**-8) -> bool:
-        """Compare to dictionaries and ensure that all their values are the
-        same, accounting for some fluctuation up to the given accuracy value.
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow not installed")
+    def test_to_parquet(self):
+        # Given/When
+        self.af.to_parquet(TEST_PARQUET)
+        result = pd.read_parquet(TEST_PARQUET)
+
+        # Then
+        pdtest.assert_frame_equal(result, self.af.frequencies,
+                                  check_exact=True)
+        # Cleanup
+        os.remove(TEST_PARQUET)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow not installed")
+    def test_to_feather(self):
+        # Given/When
+        self.af_amb.to_feather(TEST_FEATHER)
+        result = pd.read_feather(TEST_FEATHER)
+
+        # Then
+        pdtest.assert_frame_equal(result, self.af_amb.frequencies,
+                                  check_exact=True)
+        # Cleanup
+        os.remove(TEST_FEATHER)
+
+    @unittest.skipUnless(HAS_TABLES, "PyTables not installed")
+    def test_to_hdf(self):
+        # Given/When
+        self.af.to_hdf(TEST_HDF)
+        result = pd.read_hdf(TEST_HDF, "frequencies")
+
+        # Then
+        pdtest.assert_frame_equal(result, self.af.frequencies,
+                                  check_exact=True)
+        # Cleanup
+        os.remove(TEST_HDF)
+
+
+class TestUpdate(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+        ids = list(SAMPLE_SEQUENCES_DICT.keys())
+        self.first = {k: SAMPLE_SEQUENCES_DICT[k] for k in ids[:3]}
+        self.last = {k: SAMPLE_SEQUENCES_DICT[k] for k in ids[3:]}
+
+    def test_add_sequences(self):
+        # Given
+        af = AlleleFreqs(multialg=MultiAlignment(self.first),
+                         reference=self.ref)
+        af.frequencies
+
+        # When
+        af.add_sequences(self.last)
+
+        # Then
+        self.assertEqual(5, af.n_seqs)
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+        pdtest.assert_frame_equal(af.df, sample_sequences_df())
+
+    def test_add_sequences_duplicated(self):
+        # Given
+        af = AlleleFreqs(multialg=MultiAlignment(SAMPLE_SEQUENCES_DICT),
+                         reference=self.ref)
+        af.frequencies
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            af.add_sequences(self.last)
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+
+    def test_remove_sequences(self):
+        # Given
+        af = AlleleFreqs(multialg=MultiAlignment(SAMPLE_SEQUENCES_DICT),
+                         reference=self.ref)
+        expected = AlleleFreqs(multialg=MultiAlignment(self.first),
+                               reference=self.ref)
+        af.frequencies
+
+        # When
+        af.remove_sequences(self.last.keys())
+
+        # Then
+        self.assertEqual(3, af.n_seqs)
+        pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+        np.testing.assert_array_equal(af.counts.counts,
+                                      expected.counts.counts)
+        pdtest.assert_frame_equal(af.df, expected.df)
+
+    def test_remove_sequences_missing(self):
+        # Given
+        af = AlleleFreqs(multialg=MultiAlignment(self.first),
+                         reference=self.ref)
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            af.remove_sequences(self.last.keys())
+
+    def test_add_sequences_streaming(self):
+        # Given
+        counts = AlleleFreqs(multialg=MultiAlignment(self.first),
+                             reference=self.ref).counts
+        af = AlleleFreqs.from_counts(counts)
+
+        # When
+        af.add_sequences(self.last)
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+
+    def test_grouped_frequencies(self):
+        # Given
+        af = AlleleFreqs(multialg=MultiAlignment(SAMPLE_SEQUENCES_DICT),
+                         reference=self.ref)
+        groups = {**{k: "first" for k in self.first},
+                  **{k: "last" for k in self.last}}
+
+        # When
+        result = af.grouped_frequencies(groups)
+
+        # Then
+        for label, sequences in (("first", self.first),
+                                 ("last", self.last)):
+            expected = AlleleFreqs(multialg=MultiAlignment(sequences),
+                                   reference=self.ref).frequencies
+            freqs = result[result["group"] == label].drop(columns="group")
+            pdtest.assert_frame_equal(freqs.reset_index(drop=True),
+                                      expected)
+
+    def test_grouped_frequencies_missing(self):
+        # Given
+        af = AlleleFreqs(multialg=MultiAlignment(self.first),
+                         reference=self.ref)
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            af.grouped_frequencies({k: "last" for k in self.last})
+
+    def test_remove_sequences_streaming(self):
+        # Given
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    streaming=True)
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            af.remove_sequences(self.last.keys())
+
+
+class TestSubsetCounts(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+        self.ids = ["seq4", "seq2", "seq5"]
+        self.expected = AlleleFreqs(
+            multialg=MultiAlignment({k: SAMPLE_SEQUENCES_DICT[k]
+                                     for k in self.ids}),
+            reference=self.ref, regions=["2-12"]
+        ).frequencies
+
+    def test_subset_counts(self):
+        for multialg in (MultiAlignment(SAMPLE_SEQUENCES_DICT),
+                         HaplotypeAlignment(SAMPLE_SEQUENCES_DICT),
+                         PackedAlignment(SAMPLE_SEQUENCES_DICT),
+                         SparseAlignment(SAMPLE_SEQUENCES_DICT,
+                                         repr(self.ref))):
+            # Given
+            af = AlleleFreqs(multialg=multialg, reference=self.ref)
+
+            # When
+            counts = af.subset_counts(self.ids + ["seq2"], regions=["2-12"])
+
+            # Then
+            self.assertEqual(3, counts.n_seqs)
+            pdtest.assert_frame_equal(counts.frequencies(), self.expected)
+
+    def test_positions(self):
+        # Given
+        af = AlleleFreqs(multialg=MultiAlignment(SAMPLE_SEQUENCES_DICT),
+                         reference=self.ref, regions=["1-20"])
+        expected = AlleleFreqs(multialg=MultiAlignment(SAMPLE_SEQUENCES_DICT),
+                               reference=self.ref, regions=["10-20"],
+                               exclude=["15"])
+
+        # When
+        counts = af.subset_counts(regions=["10-30"], exclude=["15"])
+
+        # Then
+        self.assertIs(af.counts, af.subset_counts())
+        pdtest.assert_frame_equal(counts.frequencies(), expected.frequencies)
+
+    def test_wrong_ids(self):
+        # Given
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+        streaming = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                           streaming=True)
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            af.subset_counts(["seq1", "seq9"])
+        with self.assertRaises(ValueError):
+            streaming.subset_counts(["seq1"])
+
+
+class TestRegions(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.expected = pd.read_csv(SAMPLE_FREQUENCIES)
+        self.positions = ["1.0_A", "2.0_A", "3.1_-", "41.0_A", "42.0_T"]
+        self.expected = self.expected[
+            self.expected["position"].isin(self.positions)
+        ].reset_index(drop=True)
+
+    def test_frequencies(self):
+        # Given/When
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    regions=["41-2", "3.1"])
+
+        # Then
+        self.assertEqual(self.positions, af.frequencies["position"].tolist())
+        pdtest.assert_frame_equal(af.frequencies, self.expected)
+        self.assertEqual(self.positions, af.df.columns.tolist())
+
+    def test_exclude(self):
+        # Given/When
+        af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV,
+                                  exclude=["3-40", "3.1"], n_jobs=2)
+
+        # Then
+        self.assertEqual(["1.0_A", "2.0_A", "41.0_A", "42.0_T"],
+                         af.frequencies["position"].tolist())
+
+    def test_streaming(self):
+        # Given/When
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    regions=["41-2", "3.1"],
+                                    streaming=True)
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, self.expected)
+
+    def test_chunks(self):
+        # Given/When
+        af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV,
+                                  regions=["41-2", "3.1"], chunksize=2)
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, self.expected)
+
+    def test_add_sequences(self):
+        # Given
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    regions=["41-2", "3.1"])
+        full = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+        af.frequencies
+        seq = {"new": SAMPLE_SEQUENCES_DICT["seq1"]}
+
+        # When
+        af.add_sequences(seq)
+        full.add_sequences(seq)
+
+        # Then
+        expected = full.frequencies[
+            full.frequencies["position"].isin(self.positions)
+        ].reset_index(drop=True)
+        pdtest.assert_frame_equal(af.frequencies, expected)
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_profile(self):
+        # Given
+        records = []
+        profiler = Profiler(callback=records.append)
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    profiler=profiler)
+
+        # When
+        af.to_csv(TEST_CSV)
+
+        # Then
+        self.assertEqual(["parse", "matrix", "count", "write"],
+                         af.profile["stage"].tolist())
+        self.assertEqual(af.profile["stage"].tolist(),
+                         [r.stage for r in records])
+        # Cleanup
+        os.remove(TEST_CSV)
+
+    def test_profile_streaming(self):
+        # Given
+        af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV,
+                                  chunksize=2, profiler=Profiler())
+
+        # When
+        af.frequencies
+
+        # Then
+        self.assertEqual(["stream", "frequencies"],
+                         af.profile["stage"].tolist())
+
+    def test_profile_disabled(self):
+        # Given
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            af.profile
+
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+        # three copies of each sample sequence
+        self.msa = {f"{seq_id}_{n}": seq for n in range(3)
+                    for seq_id, seq in SAMPLE_SEQUENCES_DICT.items()}
+        self.af = AlleleFreqs(multialg=HaplotypeAlignment(self.msa),
+                              reference=self.ref)
+        self.expected = AlleleFreqs(multialg=MultiAlignment(self.msa),
+                                    reference=self.ref)
+
+    def test_frequencies(self):
+        # Given/When
+        freqs = self.af.frequencies
+
+        # Then
+        self.assertEqual((5, 44), self.af.matrix.shape)
+        self.assertEqual(15, self.af.n_seqs)
+        self.assertEqual(5, self.af.n_haplotypes)
+        self.assertEqual(5, self.expected.n_haplotypes)
+        pdtest.assert_frame_equal(freqs, sample_sequences_freqs())
+
+    def test_frequencies_parallel(self):
+        # Given
+        af = AlleleFreqs(multialg=HaplotypeAlignment(self.msa),
+                         reference=self.ref, ambiguous=True, n_jobs=2)
+
+        # When/Then
+        pdtest.assert_frame_equal(af.frequencies,
+                                  sample_sequences_freqs_amb())
+
+    def test_df(self):
+        # Given/When/Then
+        pdtest.assert_frame_equal(self.af.df, self.expected.df)
+
+    def test_grouped_frequencies(self):
+        # Given
+        groups = {seq_id: seq_id[-1] for seq_id in self.msa}
+
+        # When
+        freqs = self.af.grouped_frequencies(groups)
+
+        # Then
+        pdtest.assert_frame_equal(
+            freqs, self.expected.grouped_frequencies(groups)
+        )
+
+    def test_update(self):
+        # Given
+        self.af.frequencies
+        self.expected.frequencies
+
+        # When
+        for af in (self.af, self.expected):
+            af.remove_sequences(["seq1_0", "seq2_0", "seq2_1", "seq2_2"])
+            af.add_sequences({"new": SAMPLE_SEQUENCES_DICT["seq3"]})
+
+        # Then
+        self.assertEqual(4, self.af.n_haplotypes)
+        pdtest.assert_frame_equal(self.af.frequencies,
+                                  self.expected.frequencies)
+
+    def test_from_files(self):
+        # Given
+        expected = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA)
+        expected.to_afm(TEST_AFM)
+
+        # When
+        results = [
+            AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA, dedup=True),
+            AlleleFreqs.from_afm(sequences=TEST_AFM, dedup=True),
+            AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV, dedup=True)
+        ]
+
+        # Then
+        for af in results[:2]:
+            self.assertEqual(11, af.n_haplotypes)
+            pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+        pdtest.assert_frame_equal(results[2].frequencies,
+                                  sample_sequences_freqs())
+        # Cleanup
+        os.remove(TEST_AFM)
+
+    def test_to_afm(self):
+        # Given
+        self.af.to_afm(TEST_AFM)
+
+        # When
+        af = AlleleFreqs.from_afm(sequences=TEST_AFM)
+
+        # Then
+        pdtest.assert_frame_equal(af.df, self.expected.df)
+        # Cleanup
+        del af
+        os.remove(TEST_AFM)
+
+    def test_streaming(self):
+        with self.assertRaises(ValueError):
+            AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                   streaming=True, dedup=True)
+
+
+class TestPacked(unittest.TestCase):
+
+    def test_frequencies(self):
+        # Given
+        ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+        af = AlleleFreqs(multialg=PackedAlignment(SAMPLE_SEQUENCES_DICT),
+                         reference=ref, ambiguous=True)
+
+        # When/Then
+        pdtest.assert_frame_equal(af.frequencies,
+                                  sample_sequences_freqs_amb())
+        pdtest.assert_frame_equal(af.df, sample_sequences_df())
+
+    def test_from_files(self):
+        # Given
+        expected = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA)
+        expected.to_afm(TEST_AFM)
+
+        # When
+        results = [
+            AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                   storage="packed", regions=["1-3000"]),
+            AlleleFreqs.from_afm(sequences=TEST_AFM, storage="packed",
+                                 regions=["1-3000"]),
+        ]
+        expected = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                          regions=["1-3000"])
+
+        # Then
+        for af in results:
+            self.assertIsInstance(af.multialg, PackedAlignment)
+            pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+        af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV,
+                                  storage="packed")
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+        # Cleanup
+        os.remove(TEST_AFM)
+
+    def test_update(self):
+        # Given
+        ids = list(SAMPLE_SEQUENCES_DICT)
+        ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+        af = AlleleFreqs(multialg=PackedAlignment(
+            {k: SAMPLE_SEQUENCES_DICT[k] for k in ids[:3]}), reference=ref)
+        af.frequencies
 
-        Args:
-            expected: expected dictionary
-            result: resulting dictionary
-            acc: accuracy to use [default: 10**-8]
-        """
-        if expected.keys() == result.keys():
-            for key in expected.keys():
-                if abs(expected[key] - result[key]) < acc:
-                    continue
-            return True
-        return False
+        # When
+        af.add_sequences({k: SAMPLE_SEQUENCES_DICT[k] for k in ids[3:]})
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+
+    def test_wrong_options(self):
+        for kwargs in ({"storage": "bits"},
+                       {"storage": "packed", "streaming": True},
+                       {"storage": "packed", "dedup": True}):
+            with self.assertRaises(ValueError):
+                AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                       **kwargs)
 
 
 # From Fasta
 
+class TestSparse(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+
+    def test_frequencies(self):
+        # Given
+        af = AlleleFreqs(
+            multialg=SparseAlignment(SAMPLE_SEQUENCES_DICT, repr(self.ref)),
+            reference=self.ref, ambiguous=True
+        )
+
+        # When/Then
+        pdtest.assert_frame_equal(af.frequencies,
+                                  sample_sequences_freqs_amb())
+        pdtest.assert_frame_equal(af.df, sample_sequences_df())
+
+    def test_from_files(self):
+        # Given
+        expected = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA)
+        expected.to_afm(TEST_AFM)
+
+        # When
+        results = [
+            AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                   storage="sparse", regions=["1-3000"]),
+            AlleleFreqs.from_afm(sequences=TEST_AFM, storage="sparse",
+                                 regions=["1-3000"]),
+        ]
+        expected = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                          regions=["1-3000"])
+
+        # Then
+        for af in results:
+            self.assertIsInstance(af.multialg, SparseAlignment)
+            pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+        af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV,
+                                  storage="sparse")
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+        # Cleanup
+        os.remove(TEST_AFM)
+
+    def test_variants(self):
+        # Given
+        msa = {"seq1": "AAGGCTNGGG", "seq2": "AAG-CTNGGG", "seq3": "CAG-CT"}
+        ref = Reference("AAG-CTNGGG")
+        expected = pd.DataFrame({
+            "id": ["seq1", "seq3", "seq3", "seq3", "seq3", "seq3"],
+            "position": ["3.1_-", "1.0_A", "6.0_N", "7.0_G", "8.0_G",
+                         "9.0_G"],
+            "ref": ["-", "A", "N", "G", "G", "G"],
+            "alt": ["G", "C", "-", "-", "-", "-"],
+        })
+
+        # When
+        results = [
+            AlleleFreqs(multialg=SparseAlignment(msa, repr(ref)),
+                        reference=ref).variants(),
+            AlleleFreqs(multialg=MultiAlignment(msa),
+                        reference=ref).variants(),
+            AlleleFreqs(multialg=HaplotypeAlignment(msa),
+                        reference=ref).variants(),
+        ]
+
+        # Then
+        for variants in results:
+            pdtest.assert_frame_equal(variants, expected)
+
+    def test_variants_regions(self):
+        # Given
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    storage="sparse", regions=["1-3"])
+
+        # When
+        variants = af.variants()
+
+        # Then
+        self.assertEqual({"2.0_A", "3.0_G", "3.1_-"},
+                         set(variants["position"]))
+        self.assertTrue((variants["ref"] != variants["alt"]).all())
+
+    def test_update(self):
+        # Given
+        ids = list(SAMPLE_SEQUENCES_DICT)
+        af = AlleleFreqs(multialg=SparseAlignment(
+            {k: SAMPLE_SEQUENCES_DICT[k] for k in ids[:3]}, repr(self.ref)
+        ), reference=self.ref)
+        af.frequencies
+
+        # When
+        af.add_sequences({k: SAMPLE_SEQUENCES_DICT[k] for k in ids[3:]})
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, sample_sequences_freqs())
+
+    def test_wrong_options(self):
+        for kwargs in ({"storage": "sparse", "streaming": True},
+                       {"storage": "sparse", "dedup": True}):
+            with self.assertRaises(ValueError):
+                AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                       **kwargs)
+
+
 class TestFromFasta(unittest.TestCase):
 
     def setUp(self) -> None:
@@ -130,6 +696,99 @@ class TestFromFasta(unittest.TestCase):
         pdtest.assert_frame_equal(result, expected)
 
 
+class TestFromFastaIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.tmpdir.name, "alg_L6.fasta")
+        shutil.copy(REAL_ALG_L6_FASTA, self.fasta)
+        self.expected = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_frequencies(self):
+        for kwargs in ({}, {"n_jobs": 2}, {"storage": "packed"},
+                       {"storage": "sparse", "n_jobs": 2}, {"dedup": True}):
+            # When
+            af = AlleleFreqs.from_fasta(sequences=self.fasta, index=True,
+                                        **kwargs)
+
+            # Then
+            self.assertTrue(os.path.exists(self.fasta + ".fai"))
+            self.assertEqual(self.expected.multialg.ids, af.multialg.ids)
+            pdtest.assert_frame_equal(af.frequencies,
+                                      self.expected.frequencies)
+        pdtest.assert_frame_equal(af.df, self.expected.df)
+
+    def test_streaming(self):
+        # Given
+        expected = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                          regions=["1-3000"])
+
+        for n_jobs in (1, 2):
+            # When
+            af = AlleleFreqs.from_fasta(sequences=self.fasta, index=True,
+                                        streaming=True, n_jobs=n_jobs,
+                                        regions=["1-3000"])
+
+            # Then
+            self.assertIsNone(af.multialg)
+            pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+
+    def test_reference(self):
+        # Given
+        fasta = os.path.join(self.tmpdir.name, "alg_L6_noref.fasta")
+        shutil.copy(REAL_ALG_L6_NOREF_FASTA, fasta)
+
+        # When
+        af = AlleleFreqs.from_fasta(sequences=fasta, index=True,
+                                    reference=REAL_RSRS_FASTA)
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, self.expected.frequencies)
+
+    def test_compressed(self):
+        # Given
+        fasta = self.fasta + ".gz"
+        with open(self.fasta, "rb") as f_in, gzip.open(fasta, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+        for kwargs in ({}, {"streaming": True}):
+            # When
+            af = AlleleFreqs.from_fasta(sequences=fasta, index=True,
+                                        **kwargs)
+
+            # Then
+            self.assertFalse(os.path.exists(fasta + ".fai"))
+            pdtest.assert_frame_equal(af.frequencies,
+                                      self.expected.frequencies)
+
+    def test_wrong_options(self):
+        with self.assertRaises(ValueError):
+            AlleleFreqs.from_fasta(sequences=self.fasta, index=True,
+                                   parser="skbio")
+        with self.assertRaises(ValueError):
+            AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                   index=True)
+
+
+@unittest.skipUnless(HAS_SKBIO, "scikit-bio is not installed")
+class TestFromFastaSkbio(unittest.TestCase):
+
+    def test_frequencies(self):
+        # Given
+        native = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+
+        # When
+        skbio = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                       parser="skbio")
+
+        # Then
+        self.assertEqual(native.multialg.ids, skbio.multialg.ids)
+        pdtest.assert_frame_equal(native.frequencies, skbio.frequencies)
+
+
 class TestFromFastaNoRef(unittest.TestCase):
 
     def setUp(self) -> None:
@@ -160,6 +819,67 @@ class TestFromFastaNoRef(unittest.TestCase):
         pdtest.assert_frame_equal(result, expected)
 
 
+class TestFromFastaStreaming(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                         streaming=True)
+
+    def test_frequencies(self):
+        # Given/When
+        exp_freqs = sample_sequences_freqs()
+
+        # Then
+        pdtest.assert_frame_equal(self.af.frequencies, exp_freqs)
+
+    def test_frequencies_no_ref(self):
+        # Given
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_NOREF_FASTA,
+                                    reference=SAMPLE_REF_FASTA,
+                                    streaming=True)
+
+        # When
+        exp_freqs = sample_sequences_freqs()
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, exp_freqs)
+
+    def test_n_seqs(self):
+        self.assertEqual(5, self.af.n_seqs)
+
+    def test_matrix(self):
+        with self.assertRaises(ValueError):
+            self.af.matrix
+
+
+# From Afm
+
+class TestFromAfm(unittest.TestCase):
+
+    def setUp(self) -> None:
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+        af.to_afm(TEST_AFM)
+        self.af = AlleleFreqs.from_afm(sequences=TEST_AFM)
+
+    def tearDown(self) -> None:
+        del self.af
+        os.remove(TEST_AFM)
+
+    def test_df(self):
+        # Given/When
+        exp_df = sample_sequences_df()
+
+        # Then
+        pdtest.assert_frame_equal(self.af.df, exp_df)
+
+    def test_frequencies(self):
+        # Given/When
+        exp_freqs = sample_sequences_freqs()
+
+        # Then
+        pdtest.assert_frame_equal(self.af.frequencies, exp_freqs)
+
+
 # From Csv
 
 class TestFromCsv(unittest.TestCase):
@@ -221,6 +941,34 @@ class TestFromCsvNoRef(unittest.TestCase):
         pdtest.assert_frame_equal(result, expected)
 
 
+class TestFromCsvChunks(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV,
+                                       chunksize=2)
+
+    def test_frequencies(self):
+        # Given/When
+        exp_freqs = sample_sequences_freqs()
+
+        # Then
+        pdtest.assert_frame_equal(self.af.frequencies, exp_freqs)
+
+    def test_frequencies_no_ref(self):
+        # Given
+        af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_NOREF_CSV,
+                                  reference=SAMPLE_REF_CSV, chunksize=2)
+
+        # When
+        exp_freqs = sample_sequences_freqs()
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, exp_freqs)
+
+    def test_n_seqs(self):
+        self.assertEqual(5, self.af.n_seqs)
+
+
 # Real Datasets
 
 class TestRealDatasetsX(unittest.TestCase):
@@ -252,6 +1000,20 @@ class TestRealDatasetsX(unittest.TestCase):
         pdtest.assert_frame_equal(result, expected)
 
 
+class TestRealDatasetsXStreaming(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.af = AlleleFreqs.from_fasta(sequences=REAL_ALG_X_FASTA,
+                                         streaming=True)
+
+    def test_frequencies(self):
+        # Given/When
+        exp_freqs = pd.read_csv(REAL_X_FREQUENCIES)
+
+        # Then
+        pdtest.assert_frame_equal(self.af.frequencies, exp_freqs)
+
+
 class TestRealDatasetsXNoRef(unittest.TestCase):
 
     def setUp(self) -> None:
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import copy
+import json
+import os
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from allfreqs import AlleleFreqs, cli
+from allfreqs.benchmark import (
+    STAGES, compare, generate_alignment, run_benchmark, write_fasta
+)
+from allfreqs.classes import MultiAlignment, Reference
+
+
+class TestGenerateAlignment(unittest.TestCase):
+
+    def test_shape(self):
+        # Given/When
+        reference, sequences = generate_alignment(n_seqs=20, length=300,
+                                                  insertions=10)
+
+        # Then
+        self.assertEqual(310, len(reference))
+        self.assertEqual(10, reference.count("-"))
+        self.assertEqual(20, len(sequences))
+        self.assertTrue(all(len(seq) == 310 for seq in sequences.values()))
+
+    def test_rates(self):
+        # Given/When
+        reference, sequences = generate_alignment(n_seqs=200, length=1000,
+                                                  insertions=0,
+                                                  gap_rate=0.05,
+                                                  ambiguity_rate=0.02)
+        af = AlleleFreqs(MultiAlignment(sequences), Reference(reference))
+
+        # Then
+        self.assertAlmostEqual(0.05, af.frequencies["gap"].mean(), delta=0.01)
+        self.assertAlmostEqual(0.02, af.frequencies["oth"].mean(), delta=0.01)
+
+    def test_seed(self):
+        # Given/When/Then
+        self.assertEqual(generate_alignment(5, 100, seed=1),
+                         generate_alignment(5, 100, seed=1))
+        self.assertNotEqual(generate_alignment(5, 100, seed=1),
+                            generate_alignment(5, 100, seed=2))
+
+    def test_write_fasta(self):
+        # Given
+        reference, sequences = generate_alignment(n_seqs=5, length=100)
+
+        # When
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta = os.path.join(tmpdir, "multialg.fasta")
+            write_fasta(fasta, reference, sequences)
+            af = AlleleFreqs.from_fasta(fasta)
+
+        # Then
+        self.assertEqual(reference, repr(af.reference))
+        self.assertEqual(list(sequences), af.multialg.ids)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.result = run_benchmark(n_seqs=10, length=200, repeat=1)
+
+    def test_run_benchmark(self):
+        # Given/When/Then
+        self.assertEqual(10, self.result["params"]["n_seqs"])
+        self.assertEqual(STAGES, list(self.result["stages"]))
+        for stage in self.result["stages"].values():
+            self.assertGreaterEqual(stage["seconds"], 0)
+            self.assertGreaterEqual(stage["peak_memory"], 0)
+
+    def test_compare(self):
+        # Given
+        slower = copy.deepcopy(self.result)
+        slower["stages"]["count"]["seconds"] = \
+            self.result["stages"]["count"]["seconds"] * 2 + 1
+
+        # When
+        same = compare([self.result], [self.result])
+        regressions = compare([slower], [self.result])
+
+        # Then
+        self.assertEqual([], same)
+        self.assertEqual(1, len(regressions))
+        self.assertIn("count seconds", regressions[0])
+
+    def test_compare_different_params(self):
+        # Given
+        other = copy.deepcopy(self.result)
+        other["params"]["n_seqs"] = 20
+        other["stages"]["count"]["seconds"] += 10
+
+        # When/Then
+        self.assertEqual([], compare([other], [self.result]))
+
+
+class TestBenchmarkCLI(unittest.TestCase):
+
+    def test_benchmark(self):
+        # Given
+        runner = CliRunner()
+        args = ["benchmark", "-n", "5", "-n", "10", "-l", "100",
+                "--repeat", "1"]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out = os.path.join(tmpdir, "results.json")
+
+            # When
+            result = runner.invoke(cli.main, args + ["--out", out])
+            with open(out) as f:
+                results = json.load(f)
+            compared = runner.invoke(cli.main, args + ["--baseline", out,
+                                                       "--tolerance", "1e6"])
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual([5, 10], [r["params"]["n_seqs"]
+                                   for r in results["results"]])
+        self.assertIn("numpy", results["environment"])
+        self.assertEqual(0, compared.exit_code)
+        self.assertIn("No regressions", compared.output)
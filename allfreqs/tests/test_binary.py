@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import os
+import unittest
+
+import numpy as np
+
+from allfreqs.binary import read_afm, write_afm
+from allfreqs.classes import MultiAlignment
+from allfreqs.tests.constants import (
+    SAMPLE_SEQUENCES_DICT, SAMPLE_MULTIALG_CSV, TEST_AFM
+)
+
+
+class TestAfm(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.multialg = MultiAlignment(SAMPLE_SEQUENCES_DICT)
+        self.ref = "AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT"
+
+    def tearDown(self) -> None:
+        if os.path.isfile(TEST_AFM):
+            os.remove(TEST_AFM)
+
+    def test_write_read(self):
+        # Given
+        write_afm(TEST_AFM, self.multialg.matrix, self.multialg.ids,
+                  self.ref)
+
+        # When
+        matrix, ids, reference = read_afm(TEST_AFM)
+
+        # Then
+        self.assertIsInstance(matrix, np.memmap)
+        np.testing.assert_array_equal(self.multialg.matrix, matrix)
+        self.assertEqual(self.multialg.ids, ids)
+        self.assertEqual(self.ref, reference)
+
+    def test_write_wrong_reference(self):
+        with self.assertRaises(ValueError):
+            write_afm(TEST_AFM, self.multialg.matrix, self.multialg.ids,
+                      self.ref[1:])
+
+    def test_write_wrong_ids(self):
+        with self.assertRaises(ValueError):
+            write_afm(TEST_AFM, self.multialg.matrix, self.multialg.ids[1:],
+                      self.ref)
+
+    def test_read_invalid(self):
+        with self.assertRaises(ValueError):
+            read_afm(SAMPLE_MULTIALG_CSV)
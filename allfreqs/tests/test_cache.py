@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas.testing as pdtest
+
+from allfreqs import AlleleFreqs
+from allfreqs.cache import ResultCache
+from allfreqs.profiling import Profiler
+from allfreqs.tests.constants import (
+    SAMPLE_MULTIALG_FASTA, SAMPLE_MULTIALG_CSV, SAMPLE_MULTIALG_NOREF_FASTA,
+    SAMPLE_REF_FASTA, REAL_ALG_X_FASTA
+)
+
+
+def _store(directory: str, n: int):
+    af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+    cache = ResultCache(directory, max_size=4000)
+    cache.put(str(n % 5), af.counts)
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, "cache")
+        self.cache = ResultCache(self.directory)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_key(self):
+        # Given
+        copy = os.path.join(self.tmpdir.name, "copy.fasta")
+        shutil.copy(SAMPLE_MULTIALG_FASTA, copy)
+
+        # When
+        key = self.cache.key(SAMPLE_MULTIALG_FASTA)
+
+        # Then
+        self.assertEqual(key, self.cache.key(copy))
+        self.assertNotEqual(key, self.cache.key(REAL_ALG_X_FASTA))
+        self.assertNotEqual(key, self.cache.key(SAMPLE_MULTIALG_FASTA,
+                                                SAMPLE_REF_FASTA))
+        self.assertNotEqual(key, self.cache.key(SAMPLE_MULTIALG_FASTA,
+                                                regions=["1-10"]))
+        self.assertNotEqual(key, self.cache.key(SAMPLE_MULTIALG_FASTA,
+                                                format="csv"))
+
+    def test_get_put(self):
+        # Given
+        counts = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA).counts
+
+        # When
+        missing = self.cache.get("key")
+        self.cache.put("key", counts)
+        result = self.cache.get("key")
+
+        # Then
+        self.assertIsNone(missing)
+        np.testing.assert_array_equal(result.counts, counts.counts)
+        self.assertEqual(counts.n_seqs, result.n_seqs)
+        self.assertEqual(counts.reference.indexes, result.reference.indexes)
+        self.assertEqual(["key.npz"], [name for name in
+                                       os.listdir(self.directory)
+                                       if not name.startswith(".")])
+
+    def test_corrupted_entry(self):
+        # Given
+        with open(os.path.join(self.directory, "key.npz"), "wb") as f:
+            f.write(b"not a npz file")
+
+        # When/Then
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_eviction(self):
+        # Given
+        counts = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA).counts
+        self.cache.put("first", counts)
+        entry_size = self.cache.size
+        self.cache.max_size = entry_size * 2
+        self.cache.put("second", counts)
+        os.utime(os.path.join(self.directory, "first.npz"), (0, 0))
+        os.utime(os.path.join(self.directory, "second.npz"), (1, 1))
+
+        # When
+        self.cache.get("first")
+        self.cache.put("third", counts)
+
+        # Then
+        self.assertIsNotNone(self.cache.get("first"))
+        self.assertIsNone(self.cache.get("second"))
+        self.assertIsNotNone(self.cache.get("third"))
+        self.assertLessEqual(self.cache.size, self.cache.max_size)
+
+    def test_concurrent_access(self):
+        # Given/When
+        with ProcessPoolExecutor(4) as pool:
+            list(pool.map(_store, [self.directory] * 20, range(20)))
+
+        # Then
+        self.assertLessEqual(self.cache.size, 4000)
+        names = [name for name in os.listdir(self.directory)
+                 if not name.startswith(".")]
+        self.assertTrue(names)
+        for name in names:
+            self.assertTrue(name.endswith(".npz"))
+            self.assertIsNotNone(self.cache.get(name[:-len(".npz")]))
+
+    def test_clear(self):
+        # Given
+        counts = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA).counts
+        self.cache.put("key", counts)
+
+        # When
+        self.cache.clear()
+
+        # Then
+        self.assertEqual(0, self.cache.size)
+        self.assertIsNone(self.cache.get("key"))
+
+
+class TestCachedAlleleFreqs(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_from_fasta(self):
+        # Given
+        expected = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+        AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                               cache=self.tmpdir.name).frequencies
+
+        # When
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    cache=self.tmpdir.name,
+                                    profiler=Profiler())
+        freqs = af.frequencies
+
+        # Then
+        self.assertTrue(af.cache_hit)
+        self.assertEqual(["cache", "frequencies"],
+                         af.profile["stage"].tolist())
+        pdtest.assert_frame_equal(freqs, expected.frequencies)
+
+    def test_ambiguous(self):
+        # Given
+        expected = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                          ambiguous=True)
+        AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                               cache=self.tmpdir.name).frequencies
+
+        # When
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    ambiguous=True, cache=self.tmpdir.name)
+
+        # Then
+        self.assertTrue(af.cache_hit)
+        pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+
+    def test_sequences(self):
+        # Given
+        groups = {"seq1": "A", "seq2": "A", "seq3": "B"}
+        expected = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                          regions=["3-20"])
+        AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                               regions=["3-20"],
+                               cache=self.tmpdir.name).frequencies
+
+        # When
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    regions=["3-20"], cache=self.tmpdir.name,
+                                    profiler=Profiler())
+        grouped = af.grouped_frequencies(groups)
+
+        # Then
+        self.assertTrue(af.cache_hit)
+        self.assertIn("parse", af.profile["stage"].tolist())
+        self.assertEqual(5, af.n_seqs)
+        pdtest.assert_frame_equal(grouped,
+                                  expected.grouped_frequencies(groups))
+        pdtest.assert_frame_equal(af.df, expected.df)
+        np.testing.assert_array_equal(af.matrix, expected.matrix)
+        af.remove_sequences(["seq1"])
+        expected.remove_sequences(["seq1"])
+        pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+
+    def test_streaming_sequences(self):
+        # Given
+        AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                               cache=self.tmpdir.name).frequencies
+
+        # When
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    streaming=True, cache=self.tmpdir.name)
+
+        # Then
+        self.assertIsNone(af.multialg)
+        with self.assertRaises(ValueError):
+            af.matrix
+
+    def test_streaming(self):
+        # Given
+        expected = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV)
+        AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV, chunksize=2,
+                             cache=self.tmpdir.name)
+
+        # When
+        af = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV,
+                                  cache=self.tmpdir.name,
+                                  profiler=Profiler())
+        freqs = af.frequencies
+
+        # Then
+        self.assertEqual(["cache", "frequencies"],
+                         af.profile["stage"].tolist())
+        pdtest.assert_frame_equal(freqs, expected.frequencies)
+
+    def test_different_inputs(self):
+        # Given
+        cache = ResultCache(self.tmpdir.name)
+        AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                               cache=cache).frequencies
+        expected = AlleleFreqs.from_fasta(
+            sequences=SAMPLE_MULTIALG_NOREF_FASTA, reference=SAMPLE_REF_FASTA,
+            regions=["1-10"]
+        )
+
+        # When
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_NOREF_FASTA,
+                                    reference=SAMPLE_REF_FASTA,
+                                    regions=["1-10"], cache=cache)
+
+        # Then
+        self.assertIsNotNone(af.multialg)
+        pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+
+    def test_add_sequences(self):
+        # Given
+        af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                    cache=self.tmpdir.name)
+        expected = af.frequencies
+
+        # When
+        af.add_sequences({"new": repr(af.reference)})
+        af.frequencies
+        cached = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA,
+                                        cache=self.tmpdir.name)
+
+        # Then
+        self.assertIsNone(af.cache)
+        pdtest.assert_frame_equal(cached.frequencies, expected)
@@ -1,17 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Created by Roberto Preste
+import importlib.util
+import os
 import unittest
 
-from skbio import Sequence
+import numpy as np
 import pandas.testing as pdtest
 
-from allfreqs.classes import MultiAlignment, Reference
+from allfreqs.classes import (
+    AlleleCounts, HaplotypeAlignment, MatrixAlignment, MultiAlignment,
+    PackedAlignment, Reference, SparseAlignment
+)
+from allfreqs.counting import count_alleles
 from allfreqs.tests.constants import (
     SAMPLE_SEQUENCES_DICT, SAMPLE_SEQUENCES_TABMSA,
-    SAMPLE_REF_FASTA, SAMPLE_REFERENCE_INDEXES
+    SAMPLE_REF_FASTA, SAMPLE_REFERENCE_INDEXES, DATADIR,
+    sample_sequences_freqs, sample_sequences_freqs_amb
 )
 
+HAS_SKBIO = importlib.util.find_spec("skbio") is not None
+
 
 class TestMultiAlignment(unittest.TestCase):
 
@@ -25,6 +34,449 @@ class TestMultiAlignment(unittest.TestCase):
     def test_length(self):
         self.assertEqual(5, len(self.multialg))
 
+    def test_add(self):
+        # Given
+        multialg = MultiAlignment({"seq1": "ACGT"})
+        multialg.matrix
+
+        # When
+        multialg.add({"seq2": "AC-T"})
+
+        # Then
+        self.assertEqual(["seq1", "seq2"], multialg.ids)
+        self.assertEqual((2, 4), multialg.matrix.shape)
+
+    def test_width(self):
+        # Given
+        msa = MultiAlignment({"seq1": "ACGT", "seq2": "AC"})
+
+        # When/Then
+        self.assertEqual(4, msa.width)
+        self.assertNotIn("matrix", msa.__dict__)
+
+    def test_add_duplicated(self):
+        with self.assertRaises(ValueError):
+            self.multialg.add({"seq1": "ACGT"})
+
+    def test_remove(self):
+        # Given
+        multialg = MultiAlignment(SAMPLE_SEQUENCES_DICT)
+        multialg.matrix
+
+        # When
+        removed = multialg.remove(["seq2"])
+
+        # Then
+        self.assertEqual({"seq2": SAMPLE_SEQUENCES_DICT["seq2"]}, removed)
+        self.assertEqual(["seq1", "seq3", "seq4", "seq5"], multialg.ids)
+        self.assertEqual((4, 44), multialg.matrix.shape)
+        self.assertIn("seq2", SAMPLE_SEQUENCES_DICT)
+
+    def test_remove_missing(self):
+        with self.assertRaises(ValueError):
+            self.multialg.remove(["seq6"])
+
+    def test_ids(self):
+        self.assertEqual(list(SAMPLE_SEQUENCES_DICT.keys()), self.multialg.ids)
+
+    def test_matrix(self):
+        # Given/When
+        matrix = self.multialg.matrix
+
+        # Then
+        self.assertEqual(np.uint8, matrix.dtype)
+        self.assertEqual((5, 44), matrix.shape)
+        self.assertEqual(SAMPLE_SEQUENCES_DICT["seq3"],
+                         matrix[2].tobytes().decode())
+
+    def test_matrix_padding(self):
+        # Given
+        multialg = MultiAlignment({"seq1": "ACGT", "seq2": "AC"})
+
+        # When
+        matrix = multialg.matrix
+
+        # Then
+        self.assertEqual(["ACGT", "AC--"],
+                         [row.tobytes().decode() for row in matrix])
+
+
+class TestMatrixAlignment(unittest.TestCase):
+
+    def setUp(self) -> None:
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+        self.multialg = MatrixAlignment(matrix,
+                                        list(SAMPLE_SEQUENCES_DICT.keys()))
+
+    def test_tabmsa(self):
+        pdtest.assert_frame_equal(self.multialg.tabmsa,
+                                  SAMPLE_SEQUENCES_TABMSA)
+
+    def test_length(self):
+        self.assertEqual(5, len(self.multialg))
+
+    def test_wrong_ids(self):
+        with self.assertRaises(ValueError):
+            MatrixAlignment(self.multialg.matrix, ["seq1"])
+
+    def test_add(self):
+        # Given/When
+        self.multialg.add({"seq6": "A" * 44})
+
+        # Then
+        self.assertEqual(6, len(self.multialg))
+        self.assertEqual((6, 44), self.multialg.matrix.shape)
+        self.assertEqual("seq6", self.multialg.ids[-1])
+        self.assertEqual("A" * 44, self.multialg.tabmsa["sequence"].iloc[-1])
+
+    def test_add_longer(self):
+        # Given/When
+        self.multialg.add({"seq6": "A" * 45})
+
+        # Then
+        self.assertEqual((6, 45), self.multialg.matrix.shape)
+        self.assertEqual(SAMPLE_SEQUENCES_DICT["seq1"] + "-",
+                         self.multialg.matrix[0].tobytes().decode())
+
+    def test_add_duplicated(self):
+        with self.assertRaises(ValueError):
+            self.multialg.add({"seq1": "A" * 44})
+
+    def test_remove(self):
+        # Given/When
+        removed = self.multialg.remove(["seq2", "seq4"])
+        self.multialg.add({"seq2": "C" * 44})
+
+        # Then
+        self.assertEqual({"seq2": SAMPLE_SEQUENCES_DICT["seq2"],
+                          "seq4": SAMPLE_SEQUENCES_DICT["seq4"]}, removed)
+        self.assertEqual(["seq1", "seq3", "seq5", "seq2"], self.multialg.ids)
+        self.assertEqual(SAMPLE_SEQUENCES_DICT["seq5"],
+                         self.multialg.matrix[2].tobytes().decode())
+        with self.assertRaises(ValueError):
+            self.multialg.remove(["seq4"])
+
+    def test_remove_all(self):
+        # Given/When
+        self.multialg.remove(list(SAMPLE_SEQUENCES_DICT))
+
+        # Then
+        self.assertEqual(0, len(self.multialg))
+        self.assertEqual((0, 44), self.multialg.matrix.shape)
+
+    def test_add_remove(self):
+        # Given
+        msa = dict(SAMPLE_SEQUENCES_DICT, seq6="C" * 44, seq7="G" * 44)
+        self.multialg.add({"seq6": "C" * 44, "seq7": "G" * 44})
+
+        # When
+        self.multialg.remove(["seq2", "seq6"])
+        self.multialg.add({"seq8": "T" * 44})
+        for seq_id in ("seq2", "seq6"):
+            del msa[seq_id]
+        msa["seq8"] = "T" * 44
+
+        # Then
+        self.assertEqual(list(msa), self.multialg.ids)
+        np.testing.assert_array_equal(self.multialg.matrix,
+                                      MultiAlignment(msa).matrix)
+
+
+class TestHaplotypeAlignment(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.msa = {"seq1": "ACGT", "seq2": "AC-T", "seq3": "ACGT",
+                    "seq4": "ACGT", "seq5": "AC"}
+        self.multialg = HaplotypeAlignment(self.msa)
+
+    def test_haplotypes(self):
+        # Given/When/Then
+        self.assertEqual(5, len(self.multialg))
+        self.assertEqual(list(self.msa), self.multialg.ids)
+        self.assertEqual(3, self.multialg.n_haplotypes)
+        self.assertEqual([3, 1, 1], self.multialg.weights.tolist())
+        self.assertEqual([0, 1, 0, 0, 2],
+                         self.multialg.haplotype_index.tolist())
+        self.assertEqual(["ACGT", "AC-T", "AC--"],
+                         [row.tobytes().decode()
+                          for row in self.multialg.matrix])
+
+    def test_tabmsa(self):
+        pdtest.assert_frame_equal(
+            HaplotypeAlignment(SAMPLE_SEQUENCES_DICT).tabmsa,
+            SAMPLE_SEQUENCES_TABMSA
+        )
+
+    def test_from_records(self):
+        # Given
+        records = iter(self.msa.items())
+
+        # When
+        multialg = HaplotypeAlignment(records)
+
+        # Then
+        np.testing.assert_array_equal(multialg.matrix, self.multialg.matrix)
+
+    def test_from_matrix(self):
+        # Given
+        matrix = MultiAlignment(self.msa).matrix
+
+        # When
+        multialg = HaplotypeAlignment.from_matrix(matrix, list(self.msa))
+
+        # Then
+        np.testing.assert_array_equal(
+            multialg.matrix[multialg.haplotype_index], matrix
+        )
+        self.assertEqual(3, multialg.n_haplotypes)
+
+    def test_add(self):
+        # Given
+        self.multialg.matrix
+
+        # When
+        self.multialg.add({"seq6": "AC-T", "seq7": "TTTT"})
+
+        # Then
+        self.assertEqual(7, len(self.multialg))
+        self.assertEqual([3, 2, 1, 1], self.multialg.weights.tolist())
+        self.assertEqual((4, 4), self.multialg.matrix.shape)
+
+    def test_add_duplicated(self):
+        with self.assertRaises(ValueError):
+            self.multialg.add({"seq1": "ACGT"})
+
+    def test_remove(self):
+        # Given
+        self.multialg.matrix
+
+        # When
+        removed = self.multialg.remove(["seq2", "seq3"])
+
+        # Then
+        self.assertEqual({"seq2": "AC-T", "seq3": "ACGT"}, removed)
+        self.assertEqual(["seq1", "seq4", "seq5"], self.multialg.ids)
+        self.assertEqual([2, 0, 1], self.multialg.weights.tolist())
+        self.assertEqual(2, self.multialg.n_haplotypes)
+
+    def test_remove_missing(self):
+        with self.assertRaises(ValueError):
+            self.multialg.remove(["seq6"])
+
+
+class TestPackedAlignment(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.multialg = PackedAlignment(SAMPLE_SEQUENCES_DICT)
+
+    def test_packed(self):
+        # Given/When/Then
+        self.assertEqual((5, 22), self.multialg.packed.shape)
+        self.assertEqual(44, self.multialg.width)
+        self.assertEqual(list(SAMPLE_SEQUENCES_DICT), self.multialg.ids)
+        np.testing.assert_array_equal(
+            self.multialg.matrix, MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+        )
+
+    def test_tabmsa(self):
+        pdtest.assert_frame_equal(self.multialg.tabmsa,
+                                  SAMPLE_SEQUENCES_TABMSA)
+
+    def test_padding(self):
+        # Given
+        msa = {"seq1": "ACGTA", "seq2": "AC", "seq3": "ACG"}
+
+        # When
+        multialg = PackedAlignment(iter(msa.items()))
+
+        # Then
+        np.testing.assert_array_equal(multialg.matrix,
+                                      MultiAlignment(msa).matrix)
+
+    def test_from_matrix(self):
+        # Given
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+        # When
+        multialg = PackedAlignment.from_matrix(
+            matrix, list(SAMPLE_SEQUENCES_DICT)
+        )
+
+        # Then
+        np.testing.assert_array_equal(multialg.matrix, matrix)
+
+    def test_add(self):
+        # Given/When
+        self.multialg.add({"seq6": "A" * 45})
+
+        # Then
+        self.assertEqual(6, len(self.multialg))
+        self.assertEqual((6, 45), self.multialg.matrix.shape)
+        self.assertEqual(SAMPLE_SEQUENCES_DICT["seq1"] + "-",
+                         self.multialg.matrix[0].tobytes().decode())
+
+    def test_chunks(self):
+        # Given
+        import allfreqs.classes as classes
+        msa = {"seq1": "ACGTA", "seq2": "AC", "seq3": "ACGTACG",
+               "seq4": "A", "seq2b": "ACG"}
+        block_cells = classes.BLOCK_CELLS
+        classes.BLOCK_CELLS = 4  # chunks of one or two rows
+
+        # When
+        try:
+            multialg = PackedAlignment(iter(msa.items()))
+        finally:
+            classes.BLOCK_CELLS = block_cells
+
+        # Then
+        self.assertEqual(list(msa), multialg.ids)
+        np.testing.assert_array_equal(multialg.matrix,
+                                      MultiAlignment(msa).matrix)
+
+    def test_repeated_id(self):
+        # Given
+        records = [("seq1", "ACGT"), ("seq2", "AC"), ("seq1", "GGGTA")]
+
+        # When
+        multialg = PackedAlignment(iter(records))
+
+        # Then
+        self.assertEqual(["seq1", "seq2"], multialg.ids)
+        np.testing.assert_array_equal(multialg.matrix,
+                                      MultiAlignment(dict(records)).matrix)
+
+    def test_add_duplicated(self):
+        with self.assertRaises(ValueError):
+            self.multialg.add({"seq1": "A"})
+        self.assertEqual(5, len(self.multialg))
+
+    def test_add_from_matrix(self):
+        # Given
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+        multialg = PackedAlignment.from_matrix(
+            matrix, list(SAMPLE_SEQUENCES_DICT)
+        )
+        msa = dict(SAMPLE_SEQUENCES_DICT, seq6="ACGT", seq7="A" * 44)
+
+        # When
+        multialg.add({"seq6": "ACGT"})
+        multialg.add({"seq7": "A" * 44})
+
+        # Then
+        self.assertEqual(list(msa), multialg.ids)
+        np.testing.assert_array_equal(multialg.matrix,
+                                      MultiAlignment(msa).matrix)
+
+    def test_remove(self):
+        # Given/When
+        removed = self.multialg.remove(["seq2"])
+
+        # Then
+        self.assertEqual({"seq2": SAMPLE_SEQUENCES_DICT["seq2"]}, removed)
+        self.assertEqual(["seq1", "seq3", "seq4", "seq5"], self.multialg.ids)
+        self.assertEqual((4, 22), self.multialg.packed.shape)
+
+    def test_add_remove(self):
+        # Given
+        msa = dict(SAMPLE_SEQUENCES_DICT)
+        del msa["seq1"], msa["seq4"]
+        msa["seq6"] = "ACGTN"
+
+        # When
+        self.multialg.remove(["seq1", "seq4"])
+        self.multialg.add({"seq6": "ACGTN"})
+
+        # Then
+        self.assertEqual(list(msa), self.multialg.ids)
+        np.testing.assert_array_equal(self.multialg.matrix,
+                                      MultiAlignment(msa).matrix)
+
+    def test_remove_all(self):
+        # Given/When
+        removed = self.multialg.remove(list(SAMPLE_SEQUENCES_DICT))
+
+        # Then
+        self.assertEqual(SAMPLE_SEQUENCES_DICT, removed)
+        self.assertEqual(0, len(self.multialg))
+        self.assertEqual((0, 22), self.multialg.packed.shape)
+        self.assertEqual((0, 44), self.multialg.matrix.shape)
+
+    def test_invalid_symbols(self):
+        with self.assertRaises(ValueError):
+            PackedAlignment({"seq1": "ACGT*"})
+
+
+class TestSparseAlignment(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.reference = "AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT"
+        self.multialg = SparseAlignment(SAMPLE_SEQUENCES_DICT, self.reference)
+
+    def test_sparse(self):
+        # Given
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+        # When/Then
+        self.assertEqual(44, self.multialg.width)
+        self.assertEqual(list(SAMPLE_SEQUENCES_DICT), self.multialg.ids)
+        self.assertEqual(np.count_nonzero(
+            matrix != np.frombuffer(self.reference.encode(), dtype=np.uint8)
+        ), self.multialg.n_variants)
+        np.testing.assert_array_equal(self.multialg.matrix, matrix)
+
+    def test_tabmsa(self):
+        pdtest.assert_frame_equal(self.multialg.tabmsa,
+                                  SAMPLE_SEQUENCES_TABMSA)
+
+    def test_padding(self):
+        # Given
+        msa = {"seq1": "ACGTA", "seq2": "AC", "seq3": "ACG"}
+
+        # When
+        multialg = SparseAlignment(iter(msa.items()), "ACGTT")
+
+        # Then
+        np.testing.assert_array_equal(multialg.matrix,
+                                      MultiAlignment(msa).matrix)
+
+    def test_from_matrix(self):
+        # Given
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+        # When
+        multialg = SparseAlignment.from_matrix(
+            matrix, list(SAMPLE_SEQUENCES_DICT), self.reference
+        )
+
+        # Then
+        np.testing.assert_array_equal(multialg.indptr, self.multialg.indptr)
+        np.testing.assert_array_equal(multialg.matrix, matrix)
+
+    def test_add(self):
+        # Given/When
+        self.multialg.add({"seq6": "A" * 44})
+
+        # Then
+        self.assertEqual(6, len(self.multialg))
+        self.assertEqual("A" * 44,
+                         self.multialg.matrix[5].tobytes().decode())
+        with self.assertRaises(ValueError):
+            self.multialg.add({"seq1": "A" * 44})
+
+    def test_remove(self):
+        # Given/When
+        removed = self.multialg.remove(["seq2"])
+
+        # Then
+        self.assertEqual({"seq2": SAMPLE_SEQUENCES_DICT["seq2"]}, removed)
+        self.assertEqual(["seq1", "seq3", "seq4", "seq5"], self.multialg.ids)
+        self.assertEqual(5, len(self.multialg.indptr))
+
+    def test_longer_than_reference(self):
+        with self.assertRaises(ValueError):
+            SparseAlignment({"seq1": "ACGTA"}, "ACGT")
+
 
 class TestReference(unittest.TestCase):
 
@@ -33,12 +485,166 @@ class TestReference(unittest.TestCase):
         reference = Reference(ref)
         self.assertEqual(SAMPLE_REFERENCE_INDEXES, reference.indexes)
 
+    @unittest.skipUnless(HAS_SKBIO, "scikit-bio is not installed")
     def test_indexes_from_sequence(self):
+        from skbio import Sequence
         ref = Sequence.read(SAMPLE_REF_FASTA)
         reference = Reference(ref)
         self.assertEqual(SAMPLE_REFERENCE_INDEXES, reference.indexes)
 
+    def test_from_fasta(self):
+        reference = Reference.from_fasta(SAMPLE_REF_FASTA)
+        self.assertEqual(SAMPLE_REFERENCE_INDEXES, reference.indexes)
+
+    def test_indexes_leading_gaps(self):
+        reference = Reference("--AC-G")
+        self.assertEqual(["0.1_-", "0.2_-", "1.0_A", "2.0_C", "2.1_-",
+                          "3.0_G"], reference.indexes)
+
+    def test_positions(self):
+        # Given
+        reference = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+
+        # When
+        positions = reference.positions
+
+        # Then
+        self.assertEqual(SAMPLE_REFERENCE_INDEXES,
+                         ["{}.{}_{}".format(*pos) for pos in positions])
+        self.assertEqual((3, 1, "-"), tuple(positions[3]))
+
+    def test_locate(self):
+        # Given
+        reference = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+
+        # When/Then
+        self.assertEqual(2, reference.locate(3))
+        self.assertEqual(3, reference.locate(3, 1))
+        self.assertEqual(40, reference.locate(39, 1))
+        with self.assertRaises(ValueError):
+            reference.locate(3, 2)
+
+    def test_span(self):
+        # Given
+        reference = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+
+        # When
+        columns = reference.span(3, 5)
+
+        # Then
+        self.assertEqual(["3.0_G", "3.1_-", "4.0_C", "5.0_T"],
+                         reference.indexes[columns])
+
+    def test_select(self):
+        # Given
+        reference = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+
+        # When
+        result = reference.select(np.array([2, 3, 43]))
+
+        # Then
+        self.assertEqual("G-T", repr(result))
+        self.assertEqual(["3.0_G", "3.1_-", "42.0_T"], result.indexes)
+        self.assertEqual(1, result.locate(3, 1))
+
     def test_length(self):
         ref = "AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT"
         reference = Reference(ref)
         self.assertEqual(44, len(reference))
+
+
+class TestAlleleCounts(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+        self.counts = AlleleCounts(count_alleles(matrix), 5, self.ref)
+        self.shards = [
+            AlleleCounts(count_alleles(matrix[:2]), 2, self.ref),
+            AlleleCounts(count_alleles(matrix[2:]), 3, self.ref)
+        ]
+
+    def test_frequencies(self):
+        pdtest.assert_frame_equal(self.counts.frequencies(),
+                                  sample_sequences_freqs())
+
+    def test_frequencies_ambiguous(self):
+        pdtest.assert_frame_equal(self.counts.frequencies(ambiguous=True),
+                                  sample_sequences_freqs_amb())
+
+    def test_merge(self):
+        # Given/When
+        result = self.shards[0].merge(self.shards[1])
+
+        # Then
+        self.assertEqual(5, result.n_seqs)
+        np.testing.assert_array_equal(self.counts.counts, result.counts)
+
+    def test_add(self):
+        # Given/When
+        result = self.shards[0] + self.shards[1]
+
+        # Then
+        self.assertEqual(5, result.n_seqs)
+        np.testing.assert_array_equal(self.counts.counts, result.counts)
+
+    def test_sum(self):
+        # Given/When
+        result = sum(self.shards)
+
+        # Then
+        pdtest.assert_frame_equal(result.frequencies(),
+                                  sample_sequences_freqs())
+
+    def test_subtract(self):
+        # Given/When
+        result = self.counts - self.shards[1]
+
+        # Then
+        self.assertEqual(2, result.n_seqs)
+        np.testing.assert_array_equal(self.shards[0].counts, result.counts)
+
+    def test_merge_different_reference(self):
+        # Given
+        ref = Reference("AAGGCTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+        other = AlleleCounts(self.counts.counts, 5, ref)
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            self.counts.merge(other)
+
+    def test_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            AlleleCounts(self.counts.counts[1:], 5, self.ref)
+
+    def test_save_load(self):
+        # Given
+        output_file = os.path.join(DATADIR, "test_counts.npz")
+
+        # When
+        self.counts.save(output_file)
+        result = AlleleCounts.load(output_file)
+
+        # Then
+        self.assertEqual(5, result.n_seqs)
+        self.assertEqual(self.ref.indexes, result.reference.indexes)
+        np.testing.assert_array_equal(self.counts.counts, result.counts)
+        # Cleanup
+        os.remove(output_file)
+
+    def test_save_load_selected(self):
+        # Given
+        output_file = os.path.join(DATADIR, "test_counts.npz")
+        columns = np.array([2, 3, 43])
+        counts = AlleleCounts(self.counts.counts[columns], 5,
+                              self.ref.select(columns))
+
+        # When
+        counts.save(output_file)
+        result = AlleleCounts.load(output_file)
+
+        # Then
+        self.assertEqual(["3.0_G", "3.1_-", "42.0_T"],
+                         result.reference.indexes)
+        # Cleanup
+        os.remove(output_file)
@@ -1,7 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Created by Roberto Preste
+import gzip
+import importlib.util
+import io
 import os
+import shutil
+import tempfile
 import unittest
 
 from click.testing import CliRunner
@@ -12,7 +17,8 @@ from allfreqs import cli
 from allfreqs.tests.constants import (
     SAMPLE_MULTIALG_CSV, SAMPLE_MULTIALG_NOREF_CSV, SAMPLE_REF_CSV,
     SAMPLE_MULTIALG_FASTA, SAMPLE_MULTIALG_NOREF_FASTA, SAMPLE_REF_FASTA,
-    SAMPLE_FREQUENCIES, SAMPLE_FREQUENCIES_AMB, TEST_CSV
+    SAMPLE_FREQUENCIES, SAMPLE_FREQUENCIES_AMB, TEST_CSV, TEST_AFM,
+    TEST_PARQUET, DATADIR, REAL_ALG_L6_FASTA, REAL_L6_FREQUENCIES
 )
 
 
@@ -56,6 +62,22 @@ class TestFromFastaCLI(unittest.TestCase):
         # Cleanup
         os.remove(TEST_CSV)
 
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"),
+                         "pyarrow not installed")
+    def test_output_parquet(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA,
+                                     "--out", TEST_PARQUET])
+        exp_df = pd.read_csv(SAMPLE_FREQUENCIES)
+        test_df = pd.read_parquet(TEST_PARQUET)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_df, exp_df)
+        # Cleanup
+        os.remove(TEST_PARQUET)
+
     def test_ambiguous(self):
         # Given/When
         result = self.runner.invoke(cli.main,
@@ -70,6 +92,237 @@ class TestFromFastaCLI(unittest.TestCase):
         # Cleanup
         os.remove("all_freqs.csv")
 
+    def test_jobs(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA,
+                                     "--jobs", "2"])
+        exp_csv = pd.read_csv(SAMPLE_FREQUENCIES)
+        test_csv = pd.read_csv("all_freqs.csv")
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        # Cleanup
+        os.remove("all_freqs.csv")
+
+    def test_groups(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            groups = os.path.join(tmpdir, "groups.csv")
+            with open(groups, "w") as f:
+                f.write("id,group\nseq1,A\nseq2,A\nseq3,B\nseq4,B\n"
+                        "seq5,B\n")
+            out = os.path.join(tmpdir, "grouped.csv")
+
+            # When
+            result = self.runner.invoke(cli.main,
+                                        [SAMPLE_MULTIALG_FASTA,
+                                         "--groups", groups, "--out", out])
+            test_csv = pd.read_csv(out)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual(["A", "B"], test_csv["group"].unique().tolist())
+        self.assertEqual(["group", "position", "A", "C", "G", "T", "gap",
+                          "oth"], test_csv.columns.tolist())
+        self.assertEqual(88, len(test_csv))
+
+    def test_groups_header(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            groups = os.path.join(tmpdir, "groups.csv")
+            with open(groups, "w") as f:
+                f.write("seq1,A\nseq2,A\nseq3,B\n")
+
+            # When
+            result = self.runner.invoke(cli.main,
+                                        [SAMPLE_MULTIALG_FASTA,
+                                         "--groups", groups])
+
+        # Then
+        self.assertNotEqual(0, result.exit_code)
+        self.assertIn("id,group", result.output)
+
+    def test_tsv_precision(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out = os.path.join(tmpdir, "all_freqs.tsv")
+
+            # When
+            result = self.runner.invoke(cli.main,
+                                        [SAMPLE_MULTIALG_FASTA, "--out", out,
+                                         "--precision", "2"])
+            test_csv = pd.read_csv(out, sep="\t")
+            exp_csv = pd.read_csv(SAMPLE_FREQUENCIES).round(2)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv, check_exact=False,
+                                  atol=1e-12)
+
+    def test_cache_dir(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = [SAMPLE_MULTIALG_FASTA, "--cache-dir", tmpdir,
+                    "--out", os.path.join(tmpdir, "all_freqs.csv")]
+            self.runner.invoke(cli.main, args)
+
+            # When
+            result = self.runner.invoke(cli.main, args + ["--profile"])
+            test_csv = pd.read_csv(os.path.join(tmpdir, "all_freqs.csv"))
+            cached = [name for name in os.listdir(tmpdir)
+                      if name.endswith(".npz")]
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual(1, len(cached))
+        self.assertNotIn("parse", result.stderr)
+        pdtest.assert_frame_equal(test_csv, pd.read_csv(SAMPLE_FREQUENCIES))
+
+    def test_cache_dir_groups(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            groups = os.path.join(tmpdir, "groups.csv")
+            with open(groups, "w") as f:
+                f.write("id,group\nseq1,A\nseq2,A\nseq3,B\n")
+            out = os.path.join(tmpdir, "grouped.csv")
+            args = [SAMPLE_MULTIALG_FASTA, "--cache-dir", tmpdir,
+                    "--groups", groups, "--out", out]
+            self.runner.invoke(cli.main, [SAMPLE_MULTIALG_FASTA,
+                                          "--cache-dir", tmpdir, "--out",
+                                          os.path.join(tmpdir, "all.csv")])
+            self.runner.invoke(cli.main, args)
+            expected = pd.read_csv(out)
+
+            # When
+            result = self.runner.invoke(cli.main, args)
+            test_csv = pd.read_csv(out)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, expected)
+        self.assertEqual(["A", "B"], test_csv["group"].unique().tolist())
+
+    def test_dedup(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [REAL_ALG_L6_FASTA, "--dedup"])
+        exp_csv = pd.read_csv(REAL_L6_FREQUENCIES)
+        test_csv = pd.read_csv("all_freqs.csv")
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertIn("12 sequences, 11 unique haplotypes", result.stderr)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        # Cleanup
+        os.remove("all_freqs.csv")
+
+    def test_packed(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [REAL_ALG_L6_FASTA, "--storage",
+                                     "packed"])
+        exp_csv = pd.read_csv(REAL_L6_FREQUENCIES)
+        test_csv = pd.read_csv("all_freqs.csv")
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        # Cleanup
+        os.remove("all_freqs.csv")
+
+    def test_sparse(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [REAL_ALG_L6_FASTA, "--storage",
+                                     "sparse"])
+        exp_csv = pd.read_csv(REAL_L6_FREQUENCIES)
+        test_csv = pd.read_csv("all_freqs.csv")
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        # Cleanup
+        os.remove("all_freqs.csv")
+
+    def test_stdout(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA, "--out", "-"])
+        test_csv = pd.read_csv(io.StringIO(result.stdout))
+        exp_csv = pd.read_csv(SAMPLE_FREQUENCIES)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        self.assertFalse(os.path.exists("all_freqs.csv"))
+
+    def test_regions(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA,
+                                     "--regions", "41-2", "-R", "3.1",
+                                     "--exclude", "42"])
+        test_csv = pd.read_csv("all_freqs.csv")
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual(["1.0_A", "2.0_A", "3.1_-", "41.0_A"],
+                         test_csv["position"].tolist())
+        # Cleanup
+        os.remove("all_freqs.csv")
+
+    def test_missing_region(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA, "-R", "999"])
+
+        # Then
+        self.assertEqual(2, result.exit_code)
+        self.assertIn("Position 999 not found", result.output)
+        self.assertFalse(os.path.exists("all_freqs.csv"))
+
+    def test_empty_regions(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA, "-R", "50-60"])
+
+        # Then
+        self.assertEqual(2, result.exit_code)
+        self.assertIn("None of the reference positions", result.output)
+        self.assertFalse(os.path.exists("all_freqs.csv"))
+
+    def test_wrong_bed(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bed_file = os.path.join(tmpdir, "regions.bed")
+            with open(bed_file, "w") as f:
+                f.write("chrM\tstart\tend\n")
+
+            # When
+            result = self.runner.invoke(cli.main,
+                                        [SAMPLE_MULTIALG_FASTA, "-R",
+                                         bed_file])
+
+        # Then
+        self.assertEqual(2, result.exit_code)
+        self.assertIn("not recognised", result.output)
+        self.assertFalse(os.path.exists("all_freqs.csv"))
+
+    def test_profile(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    ["--profile", SAMPLE_MULTIALG_FASTA])
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertIn("peak memory", result.stderr)
+        self.assertIn("write", result.stderr)
+        self.assertNotIn("peak memory", result.stdout)
+        # Cleanup
+        os.remove("all_freqs.csv")
+
     def test_no_ref(self):
         # Given/When
         result = self.runner.invoke(cli.main,
@@ -144,3 +397,258 @@ class TestFromCsvCLI(unittest.TestCase):
         pdtest.assert_frame_equal(test_csv, exp_csv)
         # Cleanup
         os.remove("all_freqs.csv")
+
+    def test_chunksize(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_CSV,
+                                     "--chunksize", "2"])
+        exp_csv = pd.read_csv(SAMPLE_FREQUENCIES)
+        test_csv = pd.read_csv("all_freqs.csv")
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        # Cleanup
+        os.remove("all_freqs.csv")
+
+    def test_groups_chunksize(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            groups = os.path.join(tmpdir, "groups.csv")
+            with open(groups, "w") as f:
+                f.write("id,group\nseq1,A\nseq2,B\n")
+
+            # When
+            result = self.runner.invoke(cli.main,
+                                        [SAMPLE_MULTIALG_CSV, "--groups",
+                                         groups, "--chunksize", "2"])
+
+        # Then
+        self.assertEqual(2, result.exit_code)
+        self.assertIn("--groups or --chunksize", result.output)
+
+
+class TestConvertCLI(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.runner = CliRunner()
+
+    def tearDown(self) -> None:
+        os.remove(TEST_AFM)
+
+    def test_convert(self):
+        # Given/When
+        convert = self.runner.invoke(cli.main,
+                                     ["convert", SAMPLE_MULTIALG_FASTA,
+                                      TEST_AFM])
+        result = self.runner.invoke(cli.main, [TEST_AFM, "--out", TEST_CSV])
+        exp_csv = pd.read_csv(SAMPLE_FREQUENCIES)
+        test_csv = pd.read_csv(TEST_CSV)
+
+        # Then
+        self.assertEqual(0, convert.exit_code)
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        # Cleanup
+        os.remove(TEST_CSV)
+
+    def test_convert_no_ref(self):
+        # Given/When
+        convert = self.runner.invoke(cli.main,
+                                     ["convert", SAMPLE_MULTIALG_NOREF_CSV,
+                                      TEST_AFM,
+                                      "--reference", SAMPLE_REF_CSV])
+        result = self.runner.invoke(cli.main,
+                                    ["run", TEST_AFM, "--out", TEST_CSV])
+        exp_csv = pd.read_csv(SAMPLE_FREQUENCIES)
+        test_csv = pd.read_csv(TEST_CSV)
+
+        # Then
+        self.assertEqual(0, convert.exit_code)
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+        # Cleanup
+        os.remove(TEST_CSV)
+
+
+class TestIndexCLI(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.runner = CliRunner()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.tmpdir.name, "alg_L6.fasta")
+        shutil.copy(REAL_ALG_L6_FASTA, self.fasta)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_index(self):
+        # Given/When
+        result = self.runner.invoke(cli.main, ["index", self.fasta,
+                                               SAMPLE_MULTIALG_FASTA])
+
+        # Then
+        self.assertEqual(1, result.exit_code)
+        self.assertIn("indexed 13 sequences", result.output)
+        self.assertIn("{}: failed".format(SAMPLE_MULTIALG_FASTA),
+                      result.output)
+        self.assertTrue(os.path.exists(self.fasta + ".fai"))
+        self.assertFalse(os.path.exists(SAMPLE_MULTIALG_FASTA + ".fai"))
+
+    def test_run_index(self):
+        # Given
+        out = os.path.join(self.tmpdir.name, "freqs.csv")
+
+        # When
+        result = self.runner.invoke(cli.main, [self.fasta, "--index",
+                                               "--jobs", "2", "--out", out])
+        exp_csv = pd.read_csv(REAL_L6_FREQUENCIES)
+        test_csv = pd.read_csv(out)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertTrue(os.path.exists(self.fasta + ".fai"))
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+
+    def test_run_index_compressed(self):
+        # Given
+        fasta = self.fasta + ".gz"
+        with open(self.fasta, "rb") as f_in, gzip.open(fasta, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        out = os.path.join(self.tmpdir.name, "freqs.csv")
+
+        # When
+        result = self.runner.invoke(cli.main, [fasta, "--index", "--out",
+                                               out])
+        exp_csv = pd.read_csv(REAL_L6_FREQUENCIES)
+        test_csv = pd.read_csv(out)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertFalse(os.path.exists(fasta + ".fai"))
+        pdtest.assert_frame_equal(test_csv, exp_csv)
+
+
+class TestServeCLI(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.runner = CliRunner()
+
+    def test_wrong_options(self):
+        for args in ([], [SAMPLE_MULTIALG_FASTA, SAMPLE_MULTIALG_FASTA],
+                     [SAMPLE_MULTIALG_FASTA, "--dedup", "--storage",
+                      "packed"],
+                     [SAMPLE_MULTIALG_FASTA, "--reference", "ref.txt"],
+                     ["multialg.txt"]):
+            # When
+            result = self.runner.invoke(cli.main, ["serve"] + args)
+
+            # Then
+            self.assertEqual(2, result.exit_code)
+
+
+class TestBatchCLI(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.runner = CliRunner()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.out = os.path.join(self.tmpdir.name, "{name}.freqs.csv")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _output(self, input_file: str) -> pd.DataFrame:
+        return pd.read_csv(self.out.format(name=os.path.basename(input_file)))
+
+    def test_multiple_inputs(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA,
+                                     SAMPLE_MULTIALG_CSV,
+                                     "--out", self.out])
+        exp_csv = pd.read_csv(SAMPLE_FREQUENCIES)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertIn("2 succeeded, 0 failed", result.output)
+        pdtest.assert_frame_equal(self._output(SAMPLE_MULTIALG_FASTA),
+                                  exp_csv)
+        pdtest.assert_frame_equal(self._output(SAMPLE_MULTIALG_CSV),
+                                  exp_csv)
+
+    def test_shared_reference_jobs(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_NOREF_FASTA,
+                                     SAMPLE_MULTIALG_NOREF_CSV,
+                                     "--reference", SAMPLE_REF_FASTA,
+                                     "--out", self.out, "--jobs", "2"])
+        exp_csv = pd.read_csv(SAMPLE_FREQUENCIES)
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        pdtest.assert_frame_equal(self._output(SAMPLE_MULTIALG_NOREF_FASTA),
+                                  exp_csv)
+        pdtest.assert_frame_equal(self._output(SAMPLE_MULTIALG_NOREF_CSV),
+                                  exp_csv)
+
+    def test_manifest_glob(self):
+        # Given
+        manifest = os.path.join(self.tmpdir.name, "manifest.txt")
+        with open(manifest, "w") as f:
+            f.write(f"# inputs\n{SAMPLE_MULTIALG_FASTA}\n")
+
+        # When
+        result = self.runner.invoke(cli.main,
+                                    [os.path.join(DATADIR, "*_multialg.csv"),
+                                     "--manifest", manifest,
+                                     "--out", self.out])
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        self.assertIn("Processed 2 files", result.output)
+
+    def test_failure(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA, SAMPLE_REF_CSV,
+                                     "--out", self.out])
+
+        # Then
+        self.assertEqual(1, result.exit_code)
+        self.assertIn("1 succeeded, 1 failed", result.output)
+
+    def test_compressed_inputs(self):
+        # Given
+        with open(SAMPLE_MULTIALG_FASTA, "rb") as f:
+            data = f.read()
+        inputs = [os.path.join(self.tmpdir.name, name)
+                  for name in ("alg1.fasta.gz", "alg2.fa", "alg3.fas")]
+        with gzip.open(inputs[0], "wb") as f:
+            f.write(data)
+        for input_file in inputs[1:]:
+            with open(input_file, "wb") as f:
+                f.write(data)
+        out = os.path.join(self.tmpdir.name, "{stem}.csv")
+
+        # When
+        result = self.runner.invoke(cli.main, inputs + ["--out", out])
+
+        # Then
+        self.assertEqual(0, result.exit_code)
+        for stem in ("alg1", "alg2", "alg3"):
+            pdtest.assert_frame_equal(
+                pd.read_csv(out.format(stem=stem)),
+                pd.read_csv(SAMPLE_FREQUENCIES)
+            )
+
+    def test_duplicated_outputs(self):
+        # Given/When
+        result = self.runner.invoke(cli.main,
+                                    [SAMPLE_MULTIALG_FASTA,
+                                     SAMPLE_MULTIALG_CSV])
+
+        # Then
+        self.assertEqual(1, result.exit_code)
+        self.assertIn("not unique", result.output)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import gzip
+import lzma
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+import pandas.testing as pdtest
+
+from allfreqs import AlleleFreqs
+from allfreqs.compression import (
+    detect_compression, open_input, strip_compression_suffix
+)
+from allfreqs.tests.constants import (
+    SAMPLE_MULTIALG_FASTA, SAMPLE_MULTIALG_CSV, REAL_ALG_L6_FASTA
+)
+
+
+def bgzip(data: bytes, block_size: int = 65280) -> bytes:
+    """Compress data in BGZF format, including the final empty block."""
+    blocks = []
+    for start in range(0, len(data), block_size):
+        blocks.append(data[start:start + block_size])
+    blocks.append(b"")
+    out = []
+    for block in blocks:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = compressor.compress(block) + compressor.flush()
+        header = struct.pack("<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6,
+                             66, 67, 2, len(cdata) + 25)
+        trailer = struct.pack("<II", zlib.crc32(block), len(block))
+        out.append(header + cdata + trailer)
+
+    return b"".join(out)
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(REAL_ALG_L6_FASTA, "rb") as f:
+            self.data = f.read()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_detect_compression(self):
+        # Given
+        files = {
+            None: self._write("plain.fasta", self.data),
+            "gzip": self._write("gzip.fasta.gz", gzip.compress(self.data)),
+            "bgzip": self._write("bgzip.fasta.gz", bgzip(self.data)),
+            "xz": self._write("xz.fasta.xz", lzma.compress(self.data)),
+        }
+
+        # When/Then
+        for compression, path in files.items():
+            self.assertEqual(compression, detect_compression(path))
+
+    def test_open_input(self):
+        # Given
+        files = [self._write("plain.fasta", self.data),
+                 self._write("gzip.fasta.gz", gzip.compress(self.data)),
+                 self._write("xz.fasta.xz", lzma.compress(self.data))]
+
+        # When/Then
+        for path in files:
+            with open_input(path) as f:
+                self.assertEqual(self.data, f.read())
+
+    def test_open_bgzip(self):
+        # Given
+        path = self._write("bgzip.fasta.gz", bgzip(self.data, 1000))
+
+        # When
+        with open_input(path, threads=3) as f:
+            lines = f.readlines()
+        with gzip.open(path) as f:
+            expected = f.read()
+
+        # Then
+        self.assertEqual(self.data, expected)
+        self.assertEqual(self.data, b"".join(lines))
+
+    def test_corrupted_bgzip(self):
+        # Given
+        data = bytearray(bgzip(self.data, 1000))
+        data[-100] ^= 0xff
+        path = self._write("bgzip.fasta.gz", bytes(data))
+
+        # When/Then
+        with self.assertRaises(Exception):
+            with open_input(path) as f:
+                f.read()
+
+    def test_strip_compression_suffix(self):
+        # Given/When/Then
+        self.assertEqual("alg.fasta", strip_compression_suffix("alg.fasta.gz"))
+        self.assertEqual("alg.csv", strip_compression_suffix("alg.csv.XZ"))
+        self.assertEqual("alg.fasta", strip_compression_suffix("alg.fasta"))
+
+    def test_from_fasta(self):
+        # Given
+        expected = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+        with open(SAMPLE_MULTIALG_FASTA, "rb") as f:
+            data = f.read()
+        files = [self._write("gzip.fasta.gz", gzip.compress(data)),
+                 self._write("bgzip.fasta.gz", bgzip(data, 100)),
+                 self._write("xz.fasta.xz", lzma.compress(data))]
+
+        # When/Then
+        for path in files:
+            af = AlleleFreqs.from_fasta(sequences=path)
+            pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+            af = AlleleFreqs.from_fasta(sequences=path, streaming=True)
+            pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+
+    def test_from_csv(self):
+        # Given
+        expected = AlleleFreqs.from_csv(sequences=SAMPLE_MULTIALG_CSV)
+        with open(SAMPLE_MULTIALG_CSV, "rb") as f:
+            data = f.read()
+        path = self._write("gzip.csv.gz", gzip.compress(data))
+
+        # When
+        af = AlleleFreqs.from_csv(sequences=path)
+        chunked = AlleleFreqs.from_csv(sequences=path, chunksize=2)
+
+        # Then
+        pdtest.assert_frame_equal(af.frequencies, expected.frequencies)
+        pdtest.assert_frame_equal(chunked.frequencies, expected.frequencies)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import unittest
+
+import numpy as np
+import pandas.testing as pdtest
+
+from allfreqs.classes import MultiAlignment, Reference
+from allfreqs.constants import SYMBOLS
+from allfreqs.counting import (
+    OTHER, N_CODES, CountAccumulator, encode, count_alleles, count_alleles_grouped,
+    frequency_table
+)
+from allfreqs.tests.constants import (
+    SAMPLE_SEQUENCES_DICT, sample_sequences_freqs, sample_sequences_freqs_amb
+)
+
+
+class TestCounting(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+        self.ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+
+    def test_encode(self):
+        # Given
+        matrix = np.frombuffer(b"ACGTN-.x", dtype=np.uint8)
+
+        # When
+        result = encode(matrix)
+
+        # Then
+        self.assertEqual([0, 1, 2, 3, SYMBOLS.index("N"), SYMBOLS.index("-"),
+                          OTHER, OTHER], result.tolist())
+
+    def test_count_alleles(self):
+        # Given/When
+        counts = count_alleles(self.matrix)
+
+        # Then
+        self.assertEqual((44, N_CODES), counts.shape)
+        self.assertTrue((counts.sum(axis=1) == 5).all())
+        # position 18.0_G: G, G, W, Y, C
+        self.assertEqual(2, counts[18, SYMBOLS.index("G")])
+        self.assertEqual(1, counts[18, SYMBOLS.index("W")])
+        self.assertEqual(1, counts[18, SYMBOLS.index("Y")])
+        self.assertEqual(1, counts[18, SYMBOLS.index("C")])
+
+    def test_count_alleles_blocks(self):
+        # Given
+        import allfreqs.counting as counting
+        block_cells = counting.BLOCK_CELLS
+        counting.BLOCK_CELLS = 44  # one row at a time
+
+        # When
+        try:
+            counts = count_alleles(self.matrix)
+        finally:
+            counting.BLOCK_CELLS = block_cells
+
+        # Then
+        np.testing.assert_array_equal(counts, count_alleles(self.matrix))
+
+    def test_count_alleles_weights(self):
+        # Given
+        weights = np.array([3, 0, 1, 2, 1])
+
+        # When
+        counts = count_alleles(self.matrix, weights=weights)
+
+        # Then
+        np.testing.assert_array_equal(
+            counts, count_alleles(np.repeat(self.matrix, weights, axis=0))
+        )
+        self.assertEqual(np.int64, counts.dtype)
+
+    def test_count_alleles_grouped(self):
+        # Given
+        groups = np.array([1, 0, -1, 1, 0])
+
+        # When
+        counts = count_alleles_grouped(self.matrix, groups, 2)
+
+        # Then
+        self.assertEqual((2, 44, N_CODES), counts.shape)
+        np.testing.assert_array_equal(counts[0],
+                                      count_alleles(self.matrix[[1, 4]]))
+        np.testing.assert_array_equal(counts[1],
+                                      count_alleles(self.matrix[[0, 3]]))
+
+    def test_count_alleles_grouped_blocks(self):
+        # Given
+        import allfreqs.counting as counting
+        groups = np.array([2, 0, 4, 1, 2])
+        block_cells = counting.BLOCK_CELLS
+        counting.BLOCK_CELLS = 44 * N_CODES  # one group at a time
+
+        # When
+        try:
+            counts = count_alleles_grouped(self.matrix, groups, 5)
+        finally:
+            counting.BLOCK_CELLS = block_cells
+
+        # Then
+        np.testing.assert_array_equal(
+            counts, count_alleles_grouped(self.matrix, groups, 5)
+        )
+        np.testing.assert_array_equal(counts[2],
+                                      count_alleles(self.matrix[[0, 4]]))
+        self.assertEqual(0, counts[3].sum())
+
+    def test_frequency_table(self):
+        # Given/When
+        result = frequency_table(count_alleles(self.matrix), 5,
+                                 self.ref.indexes)
+
+        # Then
+        pdtest.assert_frame_equal(result, sample_sequences_freqs())
+
+    def test_frequency_table_ambiguous(self):
+        # Given/When
+        result = frequency_table(count_alleles(self.matrix), 5,
+                                 self.ref.indexes, ambiguous=True)
+
+        # Then
+        pdtest.assert_frame_equal(result, sample_sequences_freqs_amb())
+
+
+class TestCountAccumulator(unittest.TestCase):
+
+    def test_counts(self):
+        # Given
+        acc = CountAccumulator(44, batch_size=2)
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+        # When
+        for seq in SAMPLE_SEQUENCES_DICT.values():
+            acc.add(seq)
+
+        # Then
+        self.assertEqual(5, acc.n_seqs)
+        np.testing.assert_array_equal(acc.counts, count_alleles(matrix))
+
+    def test_padding(self):
+        # Given
+        acc = CountAccumulator(4)
+
+        # When
+        acc.add("AC")
+
+        # Then
+        self.assertEqual(2, acc.counts[:, SYMBOLS.index("-")].sum())
+
+    def test_too_long(self):
+        # Given
+        acc = CountAccumulator(4)
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            acc.add("ACGTA")
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from allfreqs.classes import MultiAlignment
+from allfreqs.counting import count_alleles
+from allfreqs.faidx import (
+    FastaIndex, IndexRecord, build_index, count_indexed, read_index,
+    read_indexed, write_index
+)
+from allfreqs.fasta import read_fasta
+from allfreqs.tests.constants import REAL_ALG_L6_FASTA, SAMPLE_MULTIALG_FASTA
+
+SAMPLE_FASTA = b""">ref description
+AAG-CTNG
+GGCA
+
+>seq1
+aagg\r
+ct\r
+>seq2
+AAGG
+"""
+
+
+class TestFastaIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.tmpdir.name, "sample.fasta")
+        with open(self.fasta, "wb") as f:
+            f.write(SAMPLE_FASTA)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_build_index(self):
+        # Given/When
+        records = build_index(self.fasta)
+
+        # Then
+        self.assertEqual([IndexRecord("ref", 12, 17, 8, 9),
+                          IndexRecord("seq1", 6, 38, 4, 6),
+                          IndexRecord("seq2", 4, 54, 4, 5)], records)
+
+    def test_read_write_index(self):
+        # Given
+        records = build_index(self.fasta)
+        index_file = os.path.join(self.tmpdir.name, "sample.fasta.fai")
+
+        # When
+        write_index(records, index_file)
+
+        # Then
+        self.assertEqual(records, read_index(index_file))
+        with open(index_file) as f:
+            self.assertEqual("ref\t12\t17\t8\t9\n", f.readline())
+
+    def test_fetch(self):
+        # Given
+        fai = FastaIndex(self.fasta)
+
+        # When/Then
+        self.assertEqual(["ref", "seq1", "seq2"], fai.ids)
+        self.assertEqual("AAGGCT", fai["seq1"])
+        self.assertEqual("AAG-CTNGGGCA", fai.fetch("ref"))
+        self.assertIn("seq2", fai)
+        self.assertNotIn("seq3", fai)
+        with self.assertRaises(KeyError):
+            fai.fetch("seq3")
+
+    def test_fetch_real_dataset(self):
+        # Given
+        fasta = os.path.join(self.tmpdir.name, "alg_L6.fasta")
+        shutil.copy(REAL_ALG_L6_FASTA, fasta)
+
+        # When
+        fai = FastaIndex(fasta)
+
+        # Then
+        self.assertEqual(dict(read_fasta(fasta)),
+                         {seq_id: fai[seq_id] for seq_id in fai})
+
+    def test_reuse_index(self):
+        # Given
+        FastaIndex(self.fasta)
+        index_file = self.fasta + ".fai"
+        with open(index_file, "w") as f:
+            f.write("seq9\t4\t54\t4\t5\n")
+
+        # When
+        fai = FastaIndex(self.fasta)
+
+        # Then
+        self.assertEqual("AAGG", fai["seq9"])
+
+    def test_outdated_index(self):
+        # Given
+        FastaIndex(self.fasta)
+        index_file = self.fasta + ".fai"
+        mtime = os.path.getmtime(self.fasta)
+        os.utime(index_file, (mtime - 10, mtime - 10))
+
+        # When
+        fai = FastaIndex(self.fasta)
+
+        # Then
+        self.assertEqual(["ref", "seq1", "seq2"], fai.ids)
+        self.assertGreaterEqual(os.path.getmtime(index_file), mtime)
+
+    def test_unique_records(self):
+        # Given
+        with open(self.fasta, "ab") as f:
+            f.write(b">seq1\nCCGG\n")
+
+        # When
+        records = FastaIndex(self.fasta).unique_records()
+
+        # Then
+        self.assertEqual(["ref", "seq1", "seq2"],
+                         [record.name for record in records])
+        self.assertEqual(4, records[1].length)
+
+    def test_invalid_files(self):
+        # Given
+        compressed = os.path.join(self.tmpdir.name, "sample.fasta.gz")
+        with gzip.open(compressed, "wb") as f:
+            f.write(SAMPLE_FASTA)
+        for content in (b"ACGT\n>seq1\nACGT\n", b">seq1\n>seq2\nACGT\n"):
+            with open(self.fasta, "wb") as f:
+                f.write(content)
+
+            # When/Then
+            with self.assertRaises(ValueError):
+                build_index(self.fasta)
+        for fasta in (compressed, SAMPLE_MULTIALG_FASTA):
+            with self.assertRaises(ValueError):
+                build_index(fasta)
+
+    def test_empty_file(self):
+        # Given
+        open(self.fasta, "w").close()
+
+        # When/Then
+        self.assertEqual([], build_index(self.fasta))
+
+
+class TestParallelReading(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.tmpdir.name, "alg_L6.fasta")
+        shutil.copy(REAL_ALG_L6_FASTA, self.fasta)
+        self.records = FastaIndex(self.fasta).records
+        self.matrix = MultiAlignment(dict(read_fasta(self.fasta))).matrix
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_read_indexed(self):
+        for n_jobs in (1, 2):
+            # When
+            matrix = read_indexed(self.fasta, self.records, n_jobs)
+
+            # Then
+            np.testing.assert_array_equal(matrix, self.matrix)
+
+    def test_read_indexed_shared(self):
+        # Given/When
+        matrix = read_indexed(self.fasta, self.records, 2)
+
+        # Then
+        # the matrix is a view of the shared buffer, not a copy of it
+        self.assertFalse(matrix.flags.owndata)
+        matrix[0, 0] = ord("N")
+        self.assertEqual(ord("N"), matrix[0, 0])
+
+    def test_read_indexed_width(self):
+        # Given/When
+        matrix = read_indexed(self.fasta, self.records[:2], width=17000)
+
+        # Then
+        self.assertEqual((2, 17000), matrix.shape)
+        np.testing.assert_array_equal(matrix[:, :16908], self.matrix[:2])
+        self.assertTrue((matrix[:, 16908:] == ord("-")).all())
+        with self.assertRaises(ValueError):
+            read_indexed(self.fasta, self.records, width=100)
+
+    def test_count_indexed(self):
+        # Given
+        columns = np.array([0, 72, 16907])
+
+        for n_jobs in (1, 2):
+            # When
+            counts = count_indexed(self.fasta, self.records, 16908,
+                                   n_jobs=n_jobs)
+            selected = count_indexed(self.fasta, self.records, 16908,
+                                     columns, n_jobs)
+
+            # Then
+            np.testing.assert_array_equal(counts, count_alleles(self.matrix))
+            np.testing.assert_array_equal(
+                selected, count_alleles(self.matrix, columns)
+            )
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import importlib.util
+import io
+import unittest
+
+from allfreqs.fasta import iter_fasta, parse_header, read_fasta
+from allfreqs.tests.constants import (
+    SAMPLE_MULTIALG_FASTA, REAL_ALG_L6_FASTA, SAMPLE_SEQUENCES_DICT
+)
+
+HAS_SKBIO = importlib.util.find_spec("skbio") is not None
+
+
+class TestFasta(unittest.TestCase):
+
+    def test_parse_header(self):
+        # Given/When/Then
+        self.assertEqual("seq1", parse_header(b">seq1 Turkey\n"))
+        self.assertEqual("seq1", parse_header(b">seq1\tTurkey"))
+        self.assertEqual("seq1", parse_header(b"seq1\r\n"))
+        self.assertEqual("", parse_header(b"> seq1"))
+        self.assertEqual("", parse_header(b">"))
+
+    def test_iter_fasta(self):
+        # Given
+        data = b"\n>seq1 desc\nAC GT\nac\n>seq2\r\nTT-\r\nNN\r\n\n"
+
+        # When
+        records = list(iter_fasta(io.BytesIO(data)))
+
+        # Then
+        self.assertEqual([("seq1", b"ACGTAC"), ("seq2", b"TT-NN")], records)
+
+    def test_iter_fasta_blocks(self):
+        # Given
+        with open(SAMPLE_MULTIALG_FASTA, "rb") as f:
+            data = f.read()
+
+        # When
+        expected = list(iter_fasta(io.BytesIO(data)))
+        results = [list(iter_fasta(io.BytesIO(data), block_size=size))
+                   for size in range(1, 50)]
+
+        # Then
+        for records in results:
+            self.assertEqual(expected, records)
+
+    def test_read_fasta(self):
+        # Given/When
+        records = dict(read_fasta(SAMPLE_MULTIALG_FASTA))
+
+        # Then
+        self.assertEqual("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT",
+                         records.pop("ref"))
+        self.assertEqual(SAMPLE_SEQUENCES_DICT, records)
+
+    def test_non_header(self):
+        # Given/When/Then
+        with self.assertRaises(ValueError):
+            list(iter_fasta(io.BytesIO(b"ACGT\n>seq1\nACGT\n")))
+
+    def test_missing_sequence(self):
+        # Given/When/Then
+        with self.assertRaises(ValueError):
+            list(iter_fasta(io.BytesIO(b">seq1\n>seq2\nACGT\n")))
+
+    def test_empty(self):
+        # Given/When/Then
+        self.assertEqual([], list(iter_fasta(io.BytesIO(b"\n\n"))))
+
+    def test_wrong_parser(self):
+        # Given/When/Then
+        with self.assertRaises(ValueError):
+            list(read_fasta(SAMPLE_MULTIALG_FASTA, parser="biopython"))
+
+    @unittest.skipUnless(HAS_SKBIO, "scikit-bio is not installed")
+    def test_skbio(self):
+        # Given/When
+        native = list(read_fasta(REAL_ALG_L6_FASTA))
+        skbio = list(read_fasta(REAL_ALG_L6_FASTA, parser="skbio"))
+
+        # Then
+        self.assertEqual(skbio, native)
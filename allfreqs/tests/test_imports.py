@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import os
+import subprocess
+import sys
+import unittest
+
+import allfreqs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(allfreqs.__file__)))
+HEAVY_MODULES = ("numpy", "pandas", "skbio", "cached_property")
+# Cumulative import time of allfreqs.cli, in microseconds; the actual time
+# is well below this budget, which leaves room for slower machines
+IMPORT_BUDGET = 300000
+# -X importtime and lazy imports of allfreqs are only available from 3.7
+requires_importtime = unittest.skipIf(sys.version_info < (3, 7),
+                                      "requires Python 3.7 or later")
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    """Run Python code in a fresh interpreter with -X importtime."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, env=env, check=True)
+
+
+def _import_times(stderr: str) -> dict:
+    """Parse -X importtime output into {module: cumulative microseconds}."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative)
+
+    return times
+
+
+class TestImports(unittest.TestCase):
+
+    @requires_importtime
+    def test_package(self):
+        # Given/When
+        times = _import_times(_run("import allfreqs").stderr)
+
+        # Then
+        self.assertIn("allfreqs", times)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+
+    @requires_importtime
+    def test_cli_budget(self):
+        # Given/When
+        times = _import_times(_run("import allfreqs.cli").stderr)
+
+        # Then
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+        self.assertLess(times["allfreqs.cli"], IMPORT_BUDGET)
+
+    @requires_importtime
+    def test_cli_version_help(self):
+        # Given
+        code = ("import sys\n"
+                "from allfreqs.cli import main\n"
+                "for args in (['--version'], ['--help'], ['run', '--help']):\n"
+                "    try:\n"
+                "        main(args)\n"
+                "    except SystemExit:\n"
+                "        pass\n")
+
+        # When
+        result = _run(code)
+        times = _import_times(result.stderr)
+
+        # Then
+        self.assertIn(f"version {allfreqs.__version__}", result.stdout)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+
+    def test_lazy_attributes(self):
+        # Given/When
+        from allfreqs import AlleleCounts, AlleleFreqs
+
+        # Then
+        self.assertEqual("AlleleFreqs", AlleleFreqs.__name__)
+        self.assertEqual("AlleleCounts", AlleleCounts.__name__)
+        with self.assertRaises(AttributeError):
+            allfreqs.NotAClass
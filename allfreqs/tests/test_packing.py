@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import unittest
+
+import numpy as np
+
+from allfreqs.classes import MultiAlignment
+from allfreqs.constants import SYMBOLS
+from allfreqs.counting import count_alleles
+from allfreqs.packing import count_packed, pack, pack_sequence, unpack
+from allfreqs.tests.constants import SAMPLE_SEQUENCES_DICT
+
+
+class TestPacking(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+    def test_pack(self):
+        # Given
+        matrix = np.frombuffer(b"ACGTN-", dtype=np.uint8).reshape(1, -1)
+
+        # When
+        packed = pack(matrix)
+
+        # Then
+        self.assertEqual([[0x01, 0x23, (SYMBOLS.index("N") << 4) | 0x0f]],
+                         packed.tolist())
+
+    def test_round_trip(self):
+        # Given
+        symbols = np.frombuffer(SYMBOLS.encode(), dtype=np.uint8)
+        matrix = np.random.default_rng(0).choice(symbols, size=(7, 11))
+
+        # When
+        packed = pack(matrix)
+
+        # Then
+        self.assertEqual((7, 6), packed.shape)
+        np.testing.assert_array_equal(unpack(packed, 11), matrix)
+        np.testing.assert_array_equal(unpack(pack(self.matrix), 44),
+                                      self.matrix)
+
+    def test_pack_sequence(self):
+        # Given/When
+        packed = pack_sequence("ACG")
+
+        # Then
+        self.assertEqual([0x01, 0x2f], packed.tolist())
+        self.assertEqual(b"ACG", unpack(packed, 3).tobytes())
+
+    def test_invalid_symbols(self):
+        with self.assertRaises(ValueError):
+            pack_sequence("ACGTX")
+
+    def test_count_packed(self):
+        # Given
+        packed = pack(self.matrix)
+        columns = np.array([0, 3, 4, 5, 43])
+
+        # When/Then
+        np.testing.assert_array_equal(count_packed(packed, 44),
+                                      count_alleles(self.matrix))
+        np.testing.assert_array_equal(count_packed(packed, 44, columns),
+                                      count_alleles(self.matrix, columns))
+
+    def test_count_packed_odd_width(self):
+        # Given
+        matrix = self.matrix[:, :43]
+
+        # When
+        counts = count_packed(pack(matrix), 43)
+
+        # Then
+        np.testing.assert_array_equal(counts, count_alleles(matrix))
+
+    def test_count_packed_blocks(self):
+        # Given
+        import allfreqs.packing as packing
+        block_cells = packing.BLOCK_CELLS
+        packing.BLOCK_CELLS = 22  # one row at a time
+
+        # When
+        try:
+            counts = count_packed(pack(self.matrix), 44)
+        finally:
+            packing.BLOCK_CELLS = block_cells
+
+        # Then
+        np.testing.assert_array_equal(counts, count_alleles(self.matrix))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import unittest
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdtest
+
+from allfreqs import AlleleFreqs
+from allfreqs.classes import MultiAlignment
+from allfreqs.counting import count_alleles
+from allfreqs.parallel import (
+    attach_matrix, count_alleles_parallel, shared_buffer, shared_matrix
+)
+from allfreqs.tests.constants import (
+    SAMPLE_SEQUENCES_DICT, REAL_ALG_L6_FASTA, REAL_L6_FREQUENCIES
+)
+
+
+class TestCountAllelesParallel(unittest.TestCase):
+
+    def test_sample(self):
+        # Given
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+        # When
+        result = count_alleles_parallel(matrix, n_jobs=2)
+
+        # Then
+        np.testing.assert_array_equal(result, count_alleles(matrix))
+
+    def test_weights(self):
+        # Given
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+        weights = np.array([3, 0, 1, 2, 1])
+
+        # When
+        result = count_alleles_parallel(matrix, n_jobs=2, weights=weights)
+
+        # Then
+        np.testing.assert_array_equal(
+            result, count_alleles(matrix, weights=weights)
+        )
+
+    def test_serial(self):
+        # Given
+        matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+        # When
+        result = count_alleles_parallel(matrix, n_jobs=1)
+
+        # Then
+        np.testing.assert_array_equal(result, count_alleles(matrix))
+
+    def test_shared_matrix(self):
+        # Given
+        buffer, matrix = shared_matrix((2, 3))
+
+        # When
+        matrix[:] = np.arange(6).reshape(2, 3)
+
+        # Then
+        np.testing.assert_array_equal(attach_matrix(buffer, (2, 3)), matrix)
+        self.assertEqual((0, 5), shared_matrix((0, 5))[1].shape)
+
+    def test_shared_buffer(self):
+        # Given
+        expected = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+        buffer, matrix = shared_matrix(expected.shape)
+        matrix[:] = expected
+
+        # When
+        result = count_alleles_parallel(matrix, n_jobs=2)
+
+        # Then
+        self.assertIs(buffer, shared_buffer(matrix))
+        self.assertIsNone(shared_buffer(matrix[1:]))
+        self.assertIsNone(shared_buffer(matrix[:, :10]))
+        self.assertIsNone(shared_buffer(expected))
+        np.testing.assert_array_equal(result, count_alleles(expected))
+
+
+class TestRealDatasetsL6Parallel(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.af = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                         n_jobs=2)
+        self.af_amb = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                             ambiguous=True, n_jobs=2)
+
+    def test_frequencies(self):
+        # Given/When
+        exp_freqs = pd.read_csv(REAL_L6_FREQUENCIES)
+
+        # Then
+        pdtest.assert_frame_equal(self.af.frequencies, exp_freqs)
+
+    def test_frequencies_ambiguous(self):
+        # Given/When
+        exp_freqs = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                           ambiguous=True).frequencies
+
+        # Then
+        pdtest.assert_frame_equal(self.af_amb.frequencies, exp_freqs,
+                                  check_exact=True)
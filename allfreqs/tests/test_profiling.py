@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import tracemalloc
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from allfreqs.profiling import Profiler, StageRecord, profile_stage
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_stage(self):
+        # Given
+        profiler = Profiler()
+
+        # When
+        with profiler.stage("alloc"):
+            data = np.ones(2 ** 20, dtype=np.uint8)
+        del data
+
+        # Then
+        self.assertEqual(1, len(profiler.records))
+        record = profiler.records[0]
+        self.assertEqual("alloc", record.stage)
+        self.assertGreaterEqual(record.wall_time, 0)
+        self.assertGreaterEqual(record.cpu_time, 0)
+        self.assertGreaterEqual(record.peak_memory, 2 ** 20)
+
+    def test_stage_without_reset_peak(self):
+        # Given
+        profiler = Profiler()
+        # tracemalloc of Python < 3.9, which has no reset_peak()
+        legacy = types.SimpleNamespace(**{
+            name: getattr(tracemalloc, name)
+            for name in ("start", "stop", "is_tracing", "get_traced_memory",
+                         "clear_traces")
+        })
+        tracemalloc.start()
+
+        # When
+        try:
+            with mock.patch("allfreqs.profiling.tracemalloc", legacy):
+                with profiler.stage("alloc"):
+                    data = np.ones(2 ** 22, dtype=np.uint8)
+                del data
+                with profiler.stage("count"):
+                    pass
+        finally:
+            tracemalloc.stop()
+
+        # Then
+        self.assertGreaterEqual(profiler.records[0].peak_memory, 2 ** 22)
+        self.assertLess(profiler.records[1].peak_memory, 2 ** 20)
+
+    def test_no_memory(self):
+        # Given
+        profiler = Profiler(memory=False)
+
+        # When
+        with profiler.stage("count"):
+            pass
+
+        # Then
+        self.assertIsNone(profiler.records[0].peak_memory)
+        self.assertIn("-", profiler.format().splitlines()[1])
+
+    def test_callback(self):
+        # Given
+        records = []
+        profiler = Profiler(callback=records.append)
+
+        # When
+        with profiler.stage("parse"):
+            pass
+        with profiler.stage("count"):
+            pass
+
+        # Then
+        self.assertEqual(["parse", "count"], [r.stage for r in records])
+        self.assertIsInstance(records[0], StageRecord)
+
+    def test_stage_error(self):
+        # Given
+        profiler = Profiler()
+
+        # When
+        with self.assertRaises(ValueError):
+            with profiler.stage("parse"):
+                raise ValueError
+
+        # Then
+        self.assertEqual("parse", profiler.records[0].stage)
+
+    def test_report(self):
+        # Given
+        profiler = Profiler()
+        with profiler.stage("parse"):
+            pass
+
+        # When
+        report = profiler.report()
+
+        # Then
+        self.assertEqual(["stage", "wall_time", "cpu_time", "peak_memory"],
+                         report.columns.tolist())
+        self.assertEqual(["parse"], report["stage"].tolist())
+        self.assertTrue(profiler.format().splitlines()[-1]
+                        .startswith("total"))
+
+    def test_disabled(self):
+        # Given/When
+        first = profile_stage(None, "parse")
+        second = profile_stage(None, "count")
+
+        # Then
+        self.assertIs(first, second)
+        with first:
+            pass
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import os
+import tempfile
+import unittest
+
+from allfreqs.classes import Reference
+from allfreqs.regions import RegionError, read_bed, select_columns
+
+
+class TestRegions(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ref = Reference("AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT")
+
+    def _indexes(self, columns):
+        return [self.ref.indexes[col] for col in columns]
+
+    def test_no_regions(self):
+        # Given/When/Then
+        self.assertIsNone(select_columns(self.ref))
+
+    def test_range(self):
+        # Given/When
+        columns = select_columns(self.ref, ["2-4"])
+
+        # Then
+        self.assertEqual(["2.0_A", "3.0_G", "3.1_-", "4.0_C"],
+                         self._indexes(columns))
+
+    def test_positions(self):
+        # Given/When
+        columns = select_columns(self.ref, ["3.1,5", 7])
+
+        # Then
+        self.assertEqual(["3.1_-", "5.0_T", "7.0_G"], self._indexes(columns))
+
+    def test_wrap_around(self):
+        # Given/When
+        columns = select_columns(self.ref, "41-2")
+
+        # Then
+        self.assertEqual(["1.0_A", "2.0_A", "41.0_A", "42.0_T"],
+                         self._indexes(columns))
+
+    def test_exclude(self):
+        # Given/When
+        columns = select_columns(self.ref, ["1-5"], exclude=["3.1", "4"])
+
+        # Then
+        self.assertEqual(["1.0_A", "2.0_A", "3.0_G", "5.0_T"],
+                         self._indexes(columns))
+
+    def test_exclude_only(self):
+        # Given/When
+        columns = select_columns(self.ref, exclude=["3-41"])
+
+        # Then
+        self.assertEqual(["1.0_A", "2.0_A", "42.0_T"],
+                         self._indexes(columns))
+
+    def test_bed(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bed_file = os.path.join(tmpdir, "regions.bed")
+            with open(bed_file, "w") as f:
+                f.write("track name=test\nchrM\t0\t2\nchrM\t40\t42\tname\n")
+
+            # When
+            regions = read_bed(bed_file)
+            columns = select_columns(self.ref, [bed_file])
+
+        # Then
+        self.assertEqual([(1, 2), (41, 42)], regions)
+        self.assertEqual(["1.0_A", "2.0_A", "41.0_A", "42.0_T"],
+                         self._indexes(columns))
+
+    def test_bed_empty_interval(self):
+        # Given
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bed_file = os.path.join(tmpdir, "regions.bed")
+            with open(bed_file, "w") as f:
+                f.write("chrM\t5\t5\nchrM\t0\t2\n")
+
+            # When
+            regions = read_bed(bed_file)
+            columns = select_columns(self.ref, [bed_file])
+
+        # Then
+        self.assertEqual([(1, 2)], regions)
+        self.assertEqual(["1.0_A", "2.0_A"], self._indexes(columns))
+
+    def test_bed_wrong_interval(self):
+        for line in ("chrM\tstart\t10\n", "chrM\t10\t5\n"):
+            with self.subTest(line=line):
+                # Given
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    bed_file = os.path.join(tmpdir, "regions.bed")
+                    with open(bed_file, "w") as f:
+                        f.write(line)
+
+                    # When/Then
+                    with self.assertRaises(RegionError):
+                        read_bed(bed_file)
+
+    def test_missing_position(self):
+        # Given/When/Then
+        with self.assertRaises(RegionError) as context:
+            select_columns(self.ref, ["4.1"])
+        self.assertIn("4.1", str(context.exception))
+
+    def test_wrong_region(self):
+        # Given/When/Then
+        with self.assertRaises(ValueError):
+            select_columns(self.ref, ["chrM:1-10"])
+
+    def test_empty(self):
+        # Given/When/Then
+        with self.assertRaises(RegionError):
+            select_columns(self.ref, ["1-5"], exclude=["1-5"])
+        with self.assertRaises(RegionError):
+            select_columns(self.ref, ["50-60"])
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+import io
+import json
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import pandas as pd
+import pandas.testing as pdtest
+
+from allfreqs import AlleleFreqs
+from allfreqs.server import FrequencyService, create_server
+from allfreqs.tests.constants import (
+    REAL_ALG_L6_FASTA, SAMPLE_FREQUENCIES, SAMPLE_MULTIALG_FASTA,
+    sample_sequences_freqs, sample_sequences_freqs_amb
+)
+
+
+class TestFrequencyServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.sample = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+        cls.real = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA,
+                                          storage="sparse")
+        cls.server = create_server(FrequencyService({
+            "sample": cls.sample, "L6": cls.real
+        }), port=0)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:{}".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def _get(self, path: str, **params) -> bytes:
+        query = "?" + urlencode(params, doseq=True) if params else ""
+        with urlopen(self.url + path + query) as response:
+            return response.read()
+
+    def _post(self, path: str, params: dict) -> bytes:
+        request = Request(self.url + path, data=json.dumps(params).encode(),
+                          headers={"Content-Type": "application/json"})
+        with urlopen(request) as response:
+            return response.read()
+
+    @staticmethod
+    def _frame(result: dict) -> pd.DataFrame:
+        return pd.DataFrame(result["frequencies"])
+
+    def test_alignments(self):
+        # Given/When
+        result = json.loads(self._get("/alignments"))
+
+        # Then
+        self.assertEqual(["sample", "L6"], [a["name"] for a in result])
+        self.assertEqual(5, result[0]["n_seqs"])
+        self.assertEqual("SparseAlignment", result[1]["storage"])
+
+    def test_frequencies(self):
+        # Given/When
+        result = json.loads(self._get("/frequencies", alignment="sample"))
+        amb = json.loads(self._get("/frequencies", alignment="sample",
+                                   ambiguous="true"))
+
+        # Then
+        self.assertEqual(5, result["n_seqs"])
+        pdtest.assert_frame_equal(self._frame(result),
+                                  sample_sequences_freqs())
+        pdtest.assert_frame_equal(self._frame(amb),
+                                  sample_sequences_freqs_amb())
+
+    def test_csv(self):
+        # Given/When
+        result = self._get("/frequencies", alignment="sample", format="csv")
+
+        # Then
+        pdtest.assert_frame_equal(pd.read_csv(io.BytesIO(result)),
+                                  pd.read_csv(SAMPLE_FREQUENCIES))
+
+    def test_subsets(self):
+        # Given
+        ids = self.real.multialg.ids[3:8]
+        expected = self.real.subset_counts(ids, ["73", "16024-16100"])
+
+        # When
+        results = [
+            self._get("/frequencies", alignment="L6",
+                      regions="73,16024-16100", ids=",".join(ids)),
+            self._get("/frequencies", alignment="L6",
+                      regions=["73", "16024-16100"], ids=ids),
+            self._post("/frequencies", {"alignment": "L6", "ids": ids,
+                                        "regions": ["73", "16024-16100"]}),
+        ]
+
+        # Then
+        for result in map(json.loads, results):
+            self.assertEqual(5, result["n_seqs"])
+            pdtest.assert_frame_equal(self._frame(result),
+                                      expected.frequencies())
+
+    def test_concurrent_queries(self):
+        # Given
+        ids = [self.real.multialg.ids[:n] for n in range(1, 13)]
+
+        # When
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(
+                lambda subset: json.loads(self._post(
+                    "/frequencies", {"alignment": "L6", "ids": subset,
+                                     "exclude": "1-16000"})
+                ), ids))
+
+        # Then
+        for subset, result in zip(ids, results):
+            pdtest.assert_frame_equal(
+                self._frame(result),
+                self.real.subset_counts(subset,
+                                        exclude=["1-16000"]).frequencies()
+            )
+
+    def test_errors(self):
+        for path, params, status in (
+                ("/frequencies", {"alignment": "missing"}, 404),
+                ("/frequencies", {}, 400),
+                ("/frequencies", {"alignment": "sample", "ids": "seq9"},
+                 400),
+                ("/frequencies", {"alignment": "sample", "regions": "x"},
+                 400),
+                ("/frequencies", {"alignment": "sample",
+                                  "regions": "regions.bed"}, 400),
+                ("/frequencies", {"alignment": "sample", "format": "xml"},
+                 400),
+                ("/missing", {}, 404)):
+            with self.assertRaises(HTTPError) as context:
+                self._get(path, **params)
+            self.assertEqual(status, context.exception.code)
+            self.assertIn("error", json.loads(context.exception.read()))
+            context.exception.close()
+
+    def test_content_length(self):
+        for headers, status in (({}, 411),
+                                ({"Content-Length": "abc"}, 400),
+                                ({"Content-Length": "-1"}, 400)):
+            # Given
+            connection = HTTPConnection("127.0.0.1",
+                                        self.server.server_address[1])
+            connection.putrequest("POST", "/frequencies")
+            for key, value in headers.items():
+                connection.putheader(key, value)
+
+            # When
+            connection.endheaders()
+            response = connection.getresponse()
+
+            # Then
+            self.assertEqual(status, response.status)
+            self.assertIn("error", json.loads(response.read()))
+            connection.close()
+
+    def test_internal_error(self):
+        # Given
+        service = self.server.service
+        with mock.patch.object(service, "query",
+                               side_effect=KeyError("position")), \
+                mock.patch("traceback.print_exc"):
+            # When
+            with self.assertRaises(HTTPError) as context:
+                self._get("/frequencies", alignment="sample")
+
+        # Then
+        self.assertEqual(500, context.exception.code)
+        self.assertIn("error", json.loads(context.exception.read()))
+        context.exception.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import unittest
+
+import numpy as np
+
+from allfreqs.classes import MultiAlignment
+from allfreqs.counting import count_alleles
+from allfreqs.sparse import (
+    count_sparse, densify, diff_rows, select_rows, stack_rows
+)
+from allfreqs.tests.constants import SAMPLE_SEQUENCES_DICT
+
+REFERENCE = np.frombuffer(b"AAG-CTNGGGCATTTCAGGGTGAGCCCGGGCAATACAGGG-TAT",
+                          dtype=np.uint8)
+
+
+class TestSparse(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.matrix = MultiAlignment(SAMPLE_SEQUENCES_DICT).matrix
+
+    def test_diff_rows(self):
+        # Given
+        matrix = np.frombuffer(b"ACGTAACGAA", dtype=np.uint8).reshape(2, -1)
+        reference = np.frombuffer(b"ACGAC", dtype=np.uint8)
+
+        # When
+        indptr, indices, symbols = diff_rows(matrix, reference)
+
+        # Then
+        self.assertEqual([0, 2, 3], indptr.tolist())
+        self.assertEqual([3, 4, 4], indices.tolist())
+        self.assertEqual(b"TAA", symbols.tobytes())
+
+    def test_densify(self):
+        # Given
+        indptr, indices, symbols = diff_rows(self.matrix, REFERENCE)
+
+        # When
+        matrix = densify(indptr, indices, symbols, REFERENCE)
+
+        # Then
+        np.testing.assert_array_equal(matrix, self.matrix)
+
+    def test_stack_rows(self):
+        # Given
+        blocks = [diff_rows(self.matrix[:2], REFERENCE),
+                  diff_rows(self.matrix[2:], REFERENCE)]
+
+        # When
+        indptr, indices, symbols = stack_rows(blocks)
+
+        # Then
+        expected = diff_rows(self.matrix, REFERENCE)
+        np.testing.assert_array_equal(indptr, expected[0])
+        np.testing.assert_array_equal(indices, expected[1])
+        np.testing.assert_array_equal(symbols, expected[2])
+        self.assertEqual([0], stack_rows([])[0].tolist())
+
+    def test_select_rows(self):
+        # Given
+        rows = np.array([3, 0, 3])
+
+        # When
+        indptr, indices, symbols = select_rows(
+            *diff_rows(self.matrix, REFERENCE), rows
+        )
+
+        # Then
+        np.testing.assert_array_equal(
+            densify(indptr, indices, symbols, REFERENCE), self.matrix[rows]
+        )
+
+    def test_count_sparse(self):
+        # Given
+        indptr, indices, symbols = diff_rows(self.matrix, REFERENCE)
+        columns = np.array([0, 3, 43])
+
+        # When/Then
+        np.testing.assert_array_equal(
+            count_sparse(indptr, indices, symbols, REFERENCE),
+            count_alleles(self.matrix)
+        )
+        np.testing.assert_array_equal(
+            count_sparse(indptr, indices, symbols, REFERENCE, columns),
+            count_alleles(self.matrix, columns)
+        )
+
+    def test_count_sparse_other_symbols(self):
+        # Given
+        matrix = np.frombuffer(b"AC*TX-AZ?TTA", dtype=np.uint8).reshape(3, -1)
+        reference = np.frombuffer(b"X*GT", dtype=np.uint8)
+
+        # When
+        counts = count_sparse(*diff_rows(matrix, reference), reference)
+
+        # Then
+        np.testing.assert_array_equal(counts, count_alleles(matrix))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import io
+import unittest
+
+import pandas as pd
+import pandas.testing as pdtest
+
+from allfreqs import AlleleFreqs
+from allfreqs.writer import write_frequencies
+from allfreqs.tests.constants import SAMPLE_MULTIALG_FASTA, REAL_ALG_L6_FASTA
+
+
+class TestWriteFrequencies(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.af = AlleleFreqs.from_fasta(sequences=SAMPLE_MULTIALG_FASTA)
+        self.real = AlleleFreqs.from_fasta(sequences=REAL_ALG_L6_FASTA)
+
+    def test_same_as_pandas(self):
+        # Given
+        for af in (self.af, self.real):
+            for ambiguous in (False, True):
+                expected = af.counts.frequencies(ambiguous).to_csv(
+                    index=False)
+                output = io.StringIO()
+
+                # When
+                write_frequencies(af.counts, output, ambiguous)
+
+                # Then
+                self.assertEqual(expected, output.getvalue())
+
+    def test_precision(self):
+        # Given
+        expected = self.af.frequencies.to_csv(index=False, sep="\t",
+                                              float_format="%.3f")
+        output = io.StringIO()
+
+        # When
+        write_frequencies(self.af.counts, output, sep="\t", precision=3)
+
+        # Then
+        self.assertEqual(expected, output.getvalue())
+
+    def test_groups(self):
+        # Given
+        counts = self.af.grouped_counts({"seq1": "H", "seq2": "L,3",
+                                         "seq3": "H"})
+        expected = self.af.grouped_frequencies({"seq1": "H", "seq2": "L,3",
+                                                "seq3": "H"})
+        output = io.StringIO()
+
+        # When
+        for n, (label, group_counts) in enumerate(counts.items()):
+            write_frequencies(group_counts, output, group=label,
+                              header=n == 0)
+        output.seek(0)
+        result = pd.read_csv(output)
+
+        # Then
+        pdtest.assert_frame_equal(result, expected)
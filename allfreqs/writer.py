@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Created by Roberto Preste
+import sys
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TextIO, Union
+
+import numpy as np
+
+from allfreqs.classes import AlleleCounts
+from allfreqs.counting import frequency_matrix
+
+# Number of positions converted to text at once
+BLOCK_ROWS = 4096
+
+
+@contextmanager
+def _open_output(output: Union[str, TextIO], append: bool = False
+                 ) -> Iterator[TextIO]:
+    """Open the output file, or use the given file object (or stdout if
+    output is "-") without closing it."""
+    if output == "-":
+        yield sys.stdout
+    elif isinstance(output, str):
+        with open(output, "a" if append else "w", newline="") as f:
+            yield f
+    else:
+        yield output
+
+
+def _quote(value: str, sep: str) -> str:
+    """Quote a text field containing the separator or quotes, as done by
+    the csv module."""
+    if sep in value or '"' in value or "\n" in value:
+        return '"{}"'.format(value.replace('"', '""'))
+    return value
+
+
+def format_rows(counts: np.ndarray,
+                n_seqs: int,
+                labels: List[str],
+                ambiguous: bool = False,
+                sep: str = ",",
+                precision: Optional[int] = None,
+                group: Optional[str] = None) -> str:
+    """Convert the allele frequencies of a block of positions to text.
+
+    Args:
+        counts: (positions x N_CODES) matrix of symbol counts of the block
+        n_seqs: number of sequences used to calculate counts
+        labels: position labels of the block
+        ambiguous: show frequencies for ambiguous nucleotides too
+            [default: False]
+        sep: field separator [default: ","]
+        precision: number of decimal digits of frequencies, or None to
+            write them in full as pandas does [default: None]
+        group: value of the leading group column, or None to omit it
+            [default: None]
+
+    Returns:
+        text: one line for each position of the block
+    """
+    freqs, columns = frequency_matrix(counts, n_seqs, ambiguous)
+    float_format = "%r" if precision is None else "%.{}f".format(precision)
+    row_format = sep.join(["%s"] + [float_format] * len(columns)) + "\n"
+    if group is not None:
+        row_format = _quote(str(group), sep).replace("%", "%%") + sep + \
+            row_format
+
+    return "".join(map(row_format.__mod__, zip(labels, *freqs.T.tolist())))
+
+
+def write_frequencies(counts: AlleleCounts,
+                      output: Union[str, TextIO] = "all_freqs.csv",
+                      ambiguous: bool = False,
+                      sep: str = ",",
+                      precision: Optional[int] = None,
+                      group: Optional[str] = None,
+                      header: bool = True,
+                      append: bool = False):
+    """Write allele frequencies as delimited text, one block of positions
+    at a time.
+
+    Frequencies are calculated from counts and written block by block, so
+    that the whole frequency dataframe is never created; with the default
+    precision, the output is the same as `frequencies.to_csv()`.
+
+    Args:
+        counts: allele counts of the multialignment
+        output: output file name, open text file object, or "-" for
+            stdout [default: "all_freqs.csv"]
+        ambiguous: show frequencies for ambiguous nucleotides too
+            [default: False]
+        sep: field separator, e.g. "\\t" for tsv output [default: ","]
+        precision: number of decimal digits of frequencies, or None to
+            write them in full [default: None]
+        group: value of a leading group column, or None to omit it
+            [default: None]
+        header: write the header line [default: True]
+        append: append to the output file instead of overwriting it
+            [default: False]
+    """
+    _, columns = frequency_matrix(counts.counts[:0], 1, ambiguous)
+    labels = counts.reference.indexes
+    if group is not None:
+        columns = ["group", "position"] + columns
+    else:
+        columns = ["position"] + columns
+    with _open_output(output, append) as f:
+        if header:
+            f.write(sep.join(columns) + "\n")
+        for start in range(0, len(counts.counts), BLOCK_ROWS):
+            stop = start + BLOCK_ROWS
+            f.write(format_rows(counts.counts[start:stop], counts.n_seqs,
+                                labels[start:stop], ambiguous, sep,
+                                precision, group))
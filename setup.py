@@ -9,7 +9,13 @@ with open("README.rst") as readme_file:
 with open("HISTORY.rst") as history_file:
     history = history_file.read()
 
-requirements = ["Click", "scikit-bio", "cached_property"]
+requirements = ["Click", "numpy", "pandas", "cached_property"]
+
+extra_requirements = {
+    "arrow": ["pyarrow"],
+    "hdf5": ["tables"],
+    "skbio": ["scikit-bio"],
+}
 
 setup_requirements = ["pytest-runner", ]
 
@@ -34,6 +40,7 @@ setup(  # pragma: no cover
         ],
     },
     install_requires=requirements,
+    extras_require=extra_requirements,
     license="MIT license",
     long_description=readme + "\n\n" + history,
     long_description_content_type="text/x-rst",